@@ -0,0 +1,563 @@
+#!/usr/bin/env python3
+"""
+📊 BENCHMARK & LASTTEST FÜR DEN FRONIUS PROXY
+=============================================
+
+Simuliert eine Farm aus N Fronius-Wechselrichtern (je ein lokaler
+HTTP-Server mit Solar API) und misst den Proxy dagegen:
+- Poll-Zyklen von FroniusManager.poll_all
+- Durchsatz und Latenz von /data, /proxy und /devices unter Last
+- Speicherverbrauch
+- Parsen der Power-Flow-Antwort: FieldSpec gegen json.loads (Subkommando parse)
+
+Wird nicht auf dem Pi installiert - nur für Entwicklung/Messungen.
+
+VERWENDUNG:
+    python3 fronius_bench.py run --inverters 10 --latency 50 --clients 8
+    python3 fronius_bench.py run --inverters 100 --error-rate 0.05 --json > bench.json
+    python3 fronius_bench.py run --baseline bench.json     # Regressionen markieren
+    python3 fronius_bench.py run --server waitress         # Produktions-Server messen
+    python3 fronius_bench.py farm --inverters 5            # nur Fake-Farm starten
+    python3 fronius_bench.py parse --sizes 1,10,50         # Parser-Mikrobenchmark
+"""
+
+import argparse
+import json
+import logging
+import math
+import multiprocessing
+import os
+import random
+import resource
+import sys
+import tempfile
+import threading
+import time
+import timeit
+import tracemalloc
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Dict, List
+
+# ═══════════════════════════════════════════════════════════════════════════
+# FAKE SOLAR API
+# ═══════════════════════════════════════════════════════════════════════════
+
+class FarmConfig:
+    """Verhalten der simulierten Wechselrichter"""
+
+    def __init__(self, latency_ms: float = 20, jitter_ms: float = 10,
+                 error_rate: float = 0.0, timeout_rate: float = 0.0,
+                 garbage_rate: float = 0.0, hang_s: float = 15.0):
+        self.latency_ms = latency_ms
+        self.jitter_ms = jitter_ms
+        self.error_rate = error_rate      # Anteil HTTP 500
+        self.timeout_rate = timeout_rate  # Anteil Antworten, die hang_s hängen
+        self.garbage_rate = garbage_rate  # Anteil ungültiges JSON
+        self.hang_s = hang_s
+
+
+def power_flow_payload(index: int, now: float) -> dict:
+    """Plausible GetPowerFlowRealtimeData-Antwort mit Tagesverlauf"""
+    phase = (now / 60 + index) % (2 * math.pi)
+    pv = max(0.0, 4000 + 3000 * math.sin(phase))
+    load = 1500 + 500 * math.cos(phase * 3)
+    akku = -min(pv - load, 2000) if pv > load else 800
+    grid = load - pv - akku
+    return {
+        'Body': {
+            'Data': {
+                'Site': {
+                    'Mode': 'bidirectional',
+                    'P_PV': round(pv, 1),
+                    'P_Grid': round(grid, 1),
+                    'P_Load': -round(load, 1),
+                    'P_Akku': round(akku, 1),
+                    'E_Day': 12345.0,
+                    'E_Total': 9876543.0,
+                    'rel_Autonomy': 100.0,
+                    'rel_SelfConsumption': 80.0
+                },
+                'Inverters': {
+                    '1': {'DT': 1, 'P': round(pv, 1), 'SOC': round(50 + 40 * math.sin(phase / 2), 1)}
+                },
+                'Version': '12'
+            }
+        },
+        'Head': {
+            'RequestArguments': {},
+            'Status': {'Code': 0, 'Reason': '', 'UserMessage': ''},
+            'Timestamp': time.strftime('%Y-%m-%dT%H:%M:%S+00:00', time.gmtime(now))
+        }
+    }
+
+
+def large_power_flow_payload(inverters: int, now: float = 0.0) -> dict:
+    """Power-Flow einer großen Anlage: viele Wechselrichter, Ohmpilots und Zähler"""
+    payload = power_flow_payload(0, now)
+    data = payload['Body']['Data']
+    data['Inverters'] = {
+        str(n): {'Battery_Mode': 'normal', 'DT': 1, 'E_Day': 5000.0 + n, 'E_Total': 1e6 + n,
+                 'E_Year': 2e5 + n, 'P': 1000.0 + n, 'SOC': 55.0 if n == inverters else None,
+                 'CID': 0}
+        for n in range(1, inverters + 1)
+    }
+    data['Smartloads'] = {'Ohmpilots': {str(n): {'P_AC_Total': 0, 'State': 'normal', 'Temperature': 42.5}
+                                        for n in range(inverters)}}
+    data['SecondaryMeters'] = {str(n): {'Category': 'METER_CAT_WR', 'Label': f'Zaehler {n}', 'MLoc': 3,
+                                        'P': -120.0 - n}
+                               for n in range(inverters)}
+    return payload
+
+
+def generic_payload(endpoint: str, index: int, inverters: int = 1) -> dict:
+    """Antwort für Inverter-/Meter-/Storage-Endpunkte (mehrere Geräte pro Anlage)"""
+    data = {}
+    for n in range(1, inverters + 1):
+        data[str(n)] = {
+            'PAC': {'Unit': 'W', 'Value': 1000 + index + n},
+            'DAY_ENERGY': {'Unit': 'Wh', 'Value': 5000 + n},
+            'TOTAL_ENERGY': {'Unit': 'Wh', 'Value': 1000000 + n},
+            'Details': {'Manufacturer': 'Fronius', 'Model': 'Symo GEN24'},
+            'Controller': {'StateOfCharge_Relative': 55.0, 'Capacity_Maximum': 10000}
+        }
+    return {
+        'Body': {'Data': data},
+        'Head': {
+            'RequestArguments': {'Scope': 'System'},
+            'Status': {'Code': 0, 'Reason': '', 'UserMessage': ''},
+            'Timestamp': time.strftime('%Y-%m-%dT%H:%M:%S+00:00')
+        }
+    }
+
+
+def make_handler(index: int, config: FarmConfig):
+    class FakeInverterHandler(BaseHTTPRequestHandler):
+        protocol_version = 'HTTP/1.1'  # Keep-Alive wie beim echten Fronius
+
+        def do_GET(self):
+            roll = random.random()
+            error_limit = config.timeout_rate + config.error_rate
+            garbage_limit = error_limit + config.garbage_rate
+
+            if roll < config.timeout_rate:
+                time.sleep(config.hang_s)
+            else:
+                delay = config.latency_ms + random.uniform(-config.jitter_ms, config.jitter_ms)
+                time.sleep(max(0.0, delay) / 1000)
+
+            if config.timeout_rate <= roll < error_limit:
+                self._send(500, b'Internal Server Error', 'text/plain')
+                return
+            if error_limit <= roll < garbage_limit:
+                self._send(200, b'<html>busy</html>', 'text/html')
+                return
+
+            path = self.path.rsplit('/', 1)[-1]
+            if path.startswith('GetPowerFlowRealtimeData'):
+                payload = power_flow_payload(index, time.time())
+            elif path.startswith('GetAPIVersion'):
+                payload = {'APIVersion': 1, 'BaseURL': '/solar_api/v1/', 'CompatibilityRange': '1.6-3'}
+            else:
+                payload = generic_payload(path, index)
+            self._send(200, json.dumps(payload).encode('utf-8'), 'application/json')
+
+        def _send(self, status: int, body: bytes, content_type: str):
+            try:
+                self.send_response(status)
+                self.send_header('Content-Type', content_type)
+                self.send_header('Content-Length', str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+            except (BrokenPipeError, ConnectionResetError):
+                pass
+
+        def log_message(self, *args):
+            pass
+
+    return FakeInverterHandler
+
+
+class InverterFarm:
+    """Startet N Fake-Wechselrichter auf aufeinanderfolgenden Ports"""
+
+    def __init__(self, count: int, config: FarmConfig, base_port: int = 18100,
+                 host: str = '127.0.0.1'):
+        self.count = count
+        self.config = config
+        self.host = host
+        self.base_port = base_port
+        self._servers: List[ThreadingHTTPServer] = []
+
+    @property
+    def addresses(self) -> List[str]:
+        return [f"{self.host}:{server.server_address[1]}" for server in self._servers]
+
+    def start(self):
+        for i in range(self.count):
+            server = ThreadingHTTPServer((self.host, self.base_port + i), make_handler(i, self.config))
+            server.daemon_threads = True
+            threading.Thread(target=server.serve_forever, daemon=True).start()
+            self._servers.append(server)
+        return self
+
+    def stop(self):
+        for server in self._servers:
+            server.shutdown()
+            server.server_close()
+        self._servers = []
+
+
+# ═══════════════════════════════════════════════════════════════════════════
+# AUSWERTUNG
+# ═══════════════════════════════════════════════════════════════════════════
+
+def percentile(values: List[float], pct: float) -> float:
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    index = min(len(ordered) - 1, max(0, math.ceil(pct / 100 * len(ordered)) - 1))
+    return ordered[index]
+
+
+def summarize(latencies_s: List[float], duration_s: float) -> dict:
+    return {
+        'count': len(latencies_s),
+        'throughput_rps': round(len(latencies_s) / duration_s, 1) if duration_s else 0.0,
+        'p50_ms': round(percentile(latencies_s, 50) * 1000, 2),
+        'p99_ms': round(percentile(latencies_s, 99) * 1000, 2),
+        'max_ms': round(max(latencies_s) * 1000, 2) if latencies_s else 0.0
+    }
+
+
+def max_rss_mb() -> float:
+    rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Linux liefert KB, macOS Bytes
+    return round(rss / 1024 / (1024 if sys.platform == 'darwin' else 1), 1)
+
+
+# ═══════════════════════════════════════════════════════════════════════════
+# BENCHMARKS
+# ═══════════════════════════════════════════════════════════════════════════
+
+def load_proxy(workdir: str):
+    """Importiert den Proxy mit Config/Historie in einem Temp-Verzeichnis"""
+    os.environ['HOME'] = workdir
+    sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+    import fronius_proxy
+    return fronius_proxy
+
+
+def bench_poll(fp, farm: InverterFarm, cycles: int) -> dict:
+    """Misst poll_all gegen die Farm"""
+    manager = fp.manager
+    # Über _set_devices, damit PowerAggregator und Scheduler die Geräte kennen -
+    # eine direkte Zuweisung an manager.devices ließe die Summen bei 0
+    with manager._write_lock:
+        manager._set_devices({
+            f"fronius_{i + 1}": fp.FroniusDevice(f"fronius_{i + 1}", address, f"Fake {i + 1}")
+            for i, address in enumerate(farm.addresses)
+        })
+
+    durations = []
+    start = time.time()
+    for _ in range(cycles):
+        cycle_start = time.time()
+        manager.poll_all()
+        durations.append(time.time() - cycle_start)
+    total = time.time() - start
+
+    result = summarize(durations, total)
+    result['reachable'] = manager.snapshot.data['reachable_count']
+    result['devices'] = len(manager.devices)
+    return result
+
+
+def parse_with_json(raw: bytes) -> tuple:
+    """Bisheriger Weg in fetch_data: ganzes Dokument dekodieren, dann get-Ketten"""
+    data = json.loads(raw)
+    site = data.get('Body', {}).get('Data', {}).get('Site', {})
+    inverters = data.get('Body', {}).get('Data', {}).get('Inverters', {})
+    soc = None
+    for inv_data in inverters.values():
+        if inv_data.get('SOC') is not None:
+            soc = inv_data['SOC']
+            break
+    return site.get('P_PV'), site.get('P_Grid'), site.get('P_Load'), site.get('P_Akku'), soc
+
+
+def bench_parse(fp, sizes: List[int], number: int) -> Dict[str, dict]:
+    """
+    Vergleicht POWER_FLOW_SPEC.extract mit json.loads je Anlagengröße.
+    
+    'full' und 'scan' erzwingen jeweils einen Weg des FieldSpec (über
+    EXTRACT_FULL_DECODE_MAX), 'extract' ist die Auswahl im Betrieb.
+    """
+    spec = fp.POWER_FLOW_SPEC
+    limit = fp.EXTRACT_FULL_DECODE_MAX
+
+    def extract_with(max_full):
+        def run(raw):
+            fp.EXTRACT_FULL_DECODE_MAX = max_full
+            return spec.extract(raw)
+        return run
+
+    variants = {
+        'json': parse_with_json,
+        'extract': extract_with(limit),
+        'full': extract_with(sys.maxsize),
+        'scan': extract_with(0),
+    }
+    results = {}
+    try:
+        for size in sizes:
+            raw = json.dumps(large_power_flow_payload(size)).encode('utf-8')
+            expected = parse_with_json(raw)
+            row = {'bytes': len(raw)}
+            for name, parse in variants.items():
+                if name != 'json':
+                    values = parse(raw)
+                    got = (values['pv_power'], values['grid_power'], values['load_power'],
+                           values['akku_power'], values['akku_soc'][0] if values['akku_soc'] else None)
+                    if got != expected:
+                        raise AssertionError(f"{name} liefert {got}, erwartet {expected}")
+                seconds = min(timeit.repeat(lambda: parse(raw), number=number, repeat=5)) / number
+                tracemalloc.start()
+                parse(raw)
+                peak = tracemalloc.get_traced_memory()[1]
+                tracemalloc.stop()
+                row[name] = {'us': round(seconds * 1e6, 1), 'peak_kb': round(peak / 1024, 1)}
+            row['speedup'] = round(row['json']['us'] / row['extract']['us'], 2)
+            results[str(size)] = row
+    finally:
+        fp.EXTRACT_FULL_DECODE_MAX = limit
+    return results
+
+
+def print_parse_report(results: Dict[str, dict]):
+    print()
+    print("=" * 78)
+    print("  PARSER - GetPowerFlowRealtimeData (us pro Antwort / Speicher-Spitze in KB)")
+    print("=" * 78)
+    print(f"  {'WR':>4}{'Bytes':>8}{'json':>14}{'extract':>14}{'full':>14}{'scan':>14}{'x':>8}")
+    for size, row in results.items():
+        cells = ''.join(f"{row[name]['us']:>8}/{row[name]['peak_kb']:<5}"
+                        for name in ('json', 'extract', 'full', 'scan'))
+        print(f"  {size:>4}{row['bytes']:>8}{cells}{row['speedup']:>8}")
+    print("=" * 78)
+
+
+def run_server(fp, kind: str, port_pipe):
+    """Läuft im Kindprozess: der Proxy-Server, wie ihn serve() startet"""
+    if kind == 'waitress':
+        from waitress.server import create_server
+        server = create_server(fp.app, host='127.0.0.1', port=0, **fp.waitress_options())
+        port_pipe.send(server.effective_port)
+        server.run()
+    else:
+        from werkzeug.serving import make_server
+        server = make_server('127.0.0.1', 0, fp.app, threaded=True)
+        port_pipe.send(server.server_port)
+        server.serve_forever()
+
+
+def bench_http(fp, farm: InverterFarm, clients: int, requests_per_client: int,
+               server_kind: str = 'werkzeug') -> Dict[str, dict]:
+    """
+    Last auf /data, /proxy und /devices über einen echten HTTP-Server.
+    
+    Der Server läuft in einem eigenen (geforkten) Prozess mit dem Zustand
+    nach bench_poll, damit die Last-Threads nicht um dessen GIL konkurrieren.
+    """
+    import requests
+
+    receiver, sender = multiprocessing.Pipe(duplex=False)
+    process = multiprocessing.get_context('fork').Process(
+        target=run_server, args=(fp, server_kind, sender), daemon=True)
+    process.start()
+    port = receiver.recv()
+
+    targets = {
+        '/data': '/data',
+        '/devices': '/devices',
+        '/proxy (configured)': f'/proxy?ip={farm.addresses[0]}',
+        '/proxy (unconfigured)': None,
+    }
+
+    results = {}
+    try:
+        for label, path in targets.items():
+            latencies: List[float] = []
+            lock = threading.Lock()
+
+            def client(worker: int):
+                session = requests.Session()
+                local = []
+                for n in range(requests_per_client):
+                    target = path
+                    if target is None:
+                        # Wechselnde, nicht konfigurierte Adressen -> Upstream-Cache
+                        target = f'/proxy?ip=localhost:{farm.base_port + (worker + n) % farm.count}'
+                    t = time.perf_counter()
+                    session.get(f'http://127.0.0.1:{port}{target}', timeout=30).content
+                    local.append(time.perf_counter() - t)
+                with lock:
+                    latencies.extend(local)
+
+            threads = [threading.Thread(target=client, args=(i,)) for i in range(clients)]
+            start = time.time()
+            for t in threads:
+                t.start()
+            for t in threads:
+                t.join()
+            results[label] = summarize(latencies, time.time() - start)
+    finally:
+        process.terminate()
+        process.join()
+    return results
+
+
+def compare(results: dict, baseline: dict, tolerance: float) -> List[str]:
+    """Vergleicht p99/Durchsatz mit einer früheren Messung"""
+    warnings = []
+
+    def check(name, current, previous):
+        if previous.get('p99_ms') and current['p99_ms'] > previous['p99_ms'] * (1 + tolerance):
+            warnings.append(f"{name}: p99 {previous['p99_ms']}ms -> {current['p99_ms']}ms")
+        if previous.get('throughput_rps') and current['throughput_rps'] < previous['throughput_rps'] * (1 - tolerance):
+            warnings.append(f"{name}: Durchsatz {previous['throughput_rps']} -> {current['throughput_rps']} req/s")
+
+    if 'poll' in baseline and 'poll' in results:
+        check('poll_all', results['poll'], baseline['poll'])
+    if baseline.get('server', 'werkzeug') != results.get('server', 'werkzeug'):
+        return warnings  # HTTP-Werte verschiedener Server sind nicht vergleichbar
+    for label, current in results.get('http', {}).items():
+        if label in baseline.get('http', {}):
+            check(label, current, baseline['http'][label])
+    return warnings
+
+
+def print_report(results: dict):
+    print()
+    print("=" * 78)
+    print(f"  FRONIUS PROXY BENCHMARK - {results['inverters']} Wechselrichter, "
+          f"{results['clients']} Clients, Server {results.get('server', 'werkzeug')}")
+    print("=" * 78)
+    if 'poll' in results:
+        p = results['poll']
+        print(f"  poll_all: {p['count']} Zyklen, p50 {p['p50_ms']}ms, p99 {p['p99_ms']}ms, "
+              f"max {p['max_ms']}ms, erreichbar {p['reachable']}/{p['devices']}")
+    if 'http' in results:
+        print()
+        print(f"  {'Endpoint':<24}{'req/s':>10}{'p50 ms':>10}{'p99 ms':>10}{'max ms':>10}")
+        for label, r in results['http'].items():
+            print(f"  {label:<24}{r['throughput_rps']:>10}{r['p50_ms']:>10}{r['p99_ms']:>10}{r['max_ms']:>10}")
+    print()
+    print(f"  Speicher (max RSS): {results['max_rss_mb']} MB")
+    for warning in results.get('regressions', []):
+        print(f"  [REGRESSION] {warning}")
+    print("=" * 78)
+
+
+# ═══════════════════════════════════════════════════════════════════════════
+# MAIN
+# ═══════════════════════════════════════════════════════════════════════════
+
+def add_farm_arguments(parser: argparse.ArgumentParser):
+    parser.add_argument('--inverters', type=int, default=10, help='Anzahl Fake-Wechselrichter')
+    parser.add_argument('--latency', type=float, default=20, help='Antwortzeit in ms')
+    parser.add_argument('--jitter', type=float, default=10, help='Zufällige Abweichung in ms')
+    parser.add_argument('--error-rate', type=float, default=0.0, help='Anteil HTTP 500 (0-1)')
+    parser.add_argument('--timeout-rate', type=float, default=0.0, help='Anteil hängender Antworten (0-1)')
+    parser.add_argument('--garbage-rate', type=float, default=0.0, help='Anteil ungültiger Antworten (0-1)')
+    parser.add_argument('--base-port', type=int, default=18100, help='Port des ersten Wechselrichters')
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark für den Fronius Multi-Device Proxy')
+    sub = parser.add_subparsers(dest='command', required=True)
+
+    farm_parser = sub.add_parser('farm', help='Nur die Fake-Farm starten')
+    add_farm_arguments(farm_parser)
+
+    run_parser = sub.add_parser('run', help='Benchmark ausführen')
+    add_farm_arguments(run_parser)
+    run_parser.add_argument('--cycles', type=int, default=5, help='Poll-Zyklen')
+    run_parser.add_argument('--clients', type=int, default=8, help='Parallele HTTP-Clients')
+    run_parser.add_argument('--requests', type=int, default=200, help='Anfragen pro Client und Endpoint')
+    run_parser.add_argument('--skip-http', action='store_true', help='Nur poll_all messen')
+    run_parser.add_argument('--server', choices=('werkzeug', 'waitress'), default='werkzeug',
+                            help='HTTP-Server für die Lastmessung')
+    run_parser.add_argument('--json', action='store_true', help='Ergebnis als JSON ausgeben')
+    run_parser.add_argument('--baseline', help='JSON einer früheren Messung zum Vergleich')
+    run_parser.add_argument('--tolerance', type=float, default=0.2, help='Erlaubte Verschlechterung (0.2 = 20%%)')
+
+    parse_parser = sub.add_parser('parse', help='Parser-Mikrobenchmark (ohne Farm)')
+    parse_parser.add_argument('--sizes', default='1,5,20,50', help='Wechselrichter pro Antwort, kommagetrennt')
+    parse_parser.add_argument('--number', type=int, default=2000, help='Durchläufe pro Messung')
+    parse_parser.add_argument('--json', action='store_true', help='Ergebnis als JSON ausgeben')
+
+    args = parser.parse_args()
+
+    if args.command == 'parse':
+        with tempfile.TemporaryDirectory(prefix='fronius-bench-') as workdir:
+            fp = load_proxy(workdir)
+            fp.logger.setLevel(logging.ERROR)
+            results = bench_parse(fp, [int(size) for size in args.sizes.split(',')], args.number)
+            fp.manager.stop_polling()
+        if args.json:
+            print(json.dumps(results, indent=2))
+        else:
+            print_parse_report(results)
+        return
+
+    config = FarmConfig(args.latency, args.jitter, args.error_rate, args.timeout_rate, args.garbage_rate)
+    farm = InverterFarm(args.inverters, config, args.base_port).start()
+
+    if args.command == 'farm':
+        print(f"Fake-Farm laeuft ({args.inverters} Wechselrichter):")
+        for address in farm.addresses:
+            print(f"  http://{address}/solar_api/v1/GetPowerFlowRealtimeData.fcgi")
+        try:
+            while True:
+                time.sleep(3600)
+        except KeyboardInterrupt:
+            farm.stop()
+        return
+
+    with tempfile.TemporaryDirectory(prefix='fronius-bench-') as workdir:
+        fp = load_proxy(workdir)
+        fp.logger.setLevel(logging.ERROR)
+        logging.getLogger('werkzeug').setLevel(logging.ERROR)
+
+        results = {
+            'inverters': args.inverters,
+            'clients': args.clients,
+            'server': args.server,
+            'latency_ms': args.latency,
+            'error_rate': args.error_rate,
+            'timeout_rate': args.timeout_rate,
+            'poll': bench_poll(fp, farm, args.cycles)
+        }
+        if not args.skip_http:
+            results['http'] = bench_http(fp, farm, args.clients, args.requests, args.server)
+        results['max_rss_mb'] = max_rss_mb()
+
+        if args.baseline:
+            with open(args.baseline) as f:
+                results['regressions'] = compare(results, json.load(f), args.tolerance)
+
+        fp.manager.stop_polling()
+
+    farm.stop()
+
+    if args.json:
+        print(json.dumps(results, indent=2))
+    else:
+        print_report(results)
+
+    if results.get('regressions'):
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
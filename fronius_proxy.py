@@ -12,6 +12,8 @@ Features:
 
 INSTALLATION:
     pip3 install flask requests
+    pip3 install waitress          # optional: Produktions-Server
+    pip3 install brotli msgpack    # optional: Brotli-Kompression, MessagePack
 
 STARTEN:
     python3 fronius_proxy.py
@@ -22,29 +24,177 @@ ENDPOINTS:
     GET  /fronius?ip=X.X.X.X   - Einzelner Fronius (Legacy)
     GET  /devices              - Alle konfigurierten Geräte
     POST /devices              - Gerät hinzufügen
+    POST /devices/batch        - Viele Geräte hinzufügen/ändern/entfernen
+    GET  /discover             - Fronius-Geräte im Netz suchen
     DELETE /devices/<id>       - Gerät löschen
+    GET  /sites                - Upstream-Proxys (Föderation)
+    POST /sites                - Upstream-Proxy hinzufügen
     GET  /data                 - Akkumulierte Daten aller Geräte
     GET  /data/<id>            - Daten eines Geräts
+    GET  /data/group/<name>    - Akkumulierte Daten einer Gruppe
+    GET  /stream               - Live-Daten (Server-Sent Events)
+    GET  /metrics              - Kennzahlen (Prometheus-Format)
+    GET  /history              - Zeitreihe (?from=&to=&step=&device=)
+    GET  /energy               - Energie pro Tag/Woche/Monat/Jahr
 """
 
-from flask import Flask, request, jsonify
-import requests
+from flask import Flask, Response, request, jsonify
 import time
 import json
 import os
 import threading
 import logging
-from datetime import datetime
+import atexit
+import bisect
+import gzip
+import heapq
+import importlib
+import importlib.util
+import ipaddress
+import math
+import mmap
+import random
+import re
+import selectors
+import signal
+import socket
+import struct
+import sys
+import zlib
+from collections import OrderedDict, deque
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, as_completed, wait
+from datetime import date, datetime, timedelta
 from typing import Dict, List, Optional
 
+
+class _LazyModule:
+    """
+    Importiert ein Modul erst beim ersten Attributzugriff.
+    
+    requests/urllib3 kosten auf einem Pi Zero beim Start rund eine
+    Sekunde, werden aber erst für die erste Abfrage gebraucht.
+    """
+    
+    def __init__(self, name: str):
+        self._name = name
+        self._module = None
+    
+    def __getattr__(self, attr):
+        if self._module is None:
+            self._module = importlib.import_module(self._name)
+        return getattr(self._module, attr)
+
+
+def _optional_module(name: str) -> Optional[_LazyModule]:
+    """Lazy-Modul, falls installiert (nur Suche im Pfad, kein Import)"""
+    return _LazyModule(name) if importlib.util.find_spec(name) is not None else None
+
+
+requests = _LazyModule('requests')
+# Optionale Pakete: Brotli-Kompression und MessagePack-Kodierung
+brotli = _optional_module('brotli')
+msgpack = _optional_module('msgpack')
+
 # ═══════════════════════════════════════════════════════════════════════════
 # KONFIGURATION
 # ═══════════════════════════════════════════════════════════════════════════
 
 CONFIG_FILE = os.path.expanduser('~/.fronius_proxy_config.json')
-POLL_INTERVAL = 10  # Sekunden
+CONFIG_SAVE_DELAY = 2.0  # Sekunden - Änderungen werden gesammelt geschrieben
+POLL_INTERVAL = 10  # Sekunden - Standard-Takt, pro Gerät über poll_interval änderbar
+POLL_DEADLINE = 8.0  # Sekunden - maximale Dauer eines Poll-Zyklus
+POLL_MIN_INTERVAL = 1.0  # Sekunden - kleinster erlaubter poll_interval
+POLL_JITTER = 0.05  # +/- 5% des Takts Zufallsanteil pro Termin
+PUBLISH_MIN_INTERVAL = 1.0  # Sekunden - Snapshot höchstens so oft neu bauen
+POLL_WORKERS = 8  # Parallele Abfragen pro Zyklus
+REQUEST_TIMEOUT = 10  # Sekunden - Timeout pro HTTP-Anfrage
+POWER_FLOW_ENDPOINT = 'GetPowerFlowRealtimeData.fcgi'
+# Zusätzliche Solar-API-Endpunkte mit eigenem Abfrage-Intervall (Sekunden).
+# Power-Flow wird jeden Zyklus abgefragt, langsam veränderliche Daten seltener.
+EXTRA_ENDPOINTS = {
+    'GetInverterRealtimeData.cgi?Scope=System': 30,
+    'GetMeterRealtimeData.cgi?Scope=System': 60,
+    'GetStorageRealtimeData.cgi?Scope=System': 120,
+}
+DISCOVERY_SUBNET = '192.168.200.0/24'  # Standard-Netz für /discover
+DISCOVERY_WORKERS = 64  # Parallele Probes
+DISCOVERY_CONNECT_TIMEOUT = 0.5  # Sekunden - kurz, da meist niemand antwortet
+DISCOVERY_READ_TIMEOUT = 2.0  # Sekunden
+DISCOVERY_MAX_HOSTS = 1024  # Größtes erlaubtes Netz (/22)
+HTTP_POOL_SIZE = 2  # Keep-Alive-Verbindungen pro Gerät
+HTTP_KEEPALIVE_IDLE = 30  # Sekunden - danach Verbindungen neu aufbauen
+HTTP_KEEPALIVE_MAX_REQUESTS = 1000  # Anfragen pro Session, danach neue Session
+BREAKER_THRESHOLD = 3  # Fehler in Folge, bis ein Gerät gesperrt wird
+BREAKER_BASE_BACKOFF = 30  # Sekunden - erste Sperrzeit
+BREAKER_MAX_BACKOFF = 600  # Sekunden - maximale Sperrzeit
+BREAKER_JITTER = 0.2  # +/- 20% Zufallsanteil, damit Geräte nicht synchron proben
+DEFAULT_BATTERY_CAPACITY = 10.0  # kWh - SOC-Gewicht, wenn die Kapazität unbekannt ist
+AGGREGATE_RESUM_EVERY = 10000  # Updates, nach denen die Summen neu gebildet werden
+# Veraltete Messwerte: ab STALE_AFTER gilt ein Wert als veraltet, ab STALE_MAX_AGE
+# wird er nicht mehr mitgezählt. Dazwischen entscheidet STALE_POLICY:
+# 'hold' (letzten Wert halten), 'drop' (sofort weglassen) oder
+# 'interpolate' (Leistung linear bis STALE_MAX_AGE auf 0 abklingen lassen).
+# Für Geräte mit längerem poll_interval wachsen beide Grenzen anteilig mit.
+STALE_AFTER = 3 * POLL_INTERVAL  # Sekunden
+STALE_MAX_AGE = 120  # Sekunden
+STALE_POLICY = 'hold'
 PORT = 5000
 
+# Server: 'auto' (waitress falls installiert), 'waitress' oder 'werkzeug' (Dev-Server)
+SERVER = os.environ.get('FRONIUS_PROXY_SERVER', 'auto')
+SERVER_THREADS = int(os.environ.get('FRONIUS_PROXY_THREADS', 8))  # Worker für normale Anfragen
+SERVER_BACKLOG = int(os.environ.get('FRONIUS_PROXY_BACKLOG', 256))  # Listen-Queue des Sockets
+SERVER_CONNECTION_LIMIT = 500  # Gleichzeitige Verbindungen (inkl. Keep-Alive)
+
+HISTORY_DIR = os.path.expanduser('~/.fronius_proxy_history')
+# Auflösungsstufen: (Schrittweite in s, Aufbewahrung in s) - ca. 2.6 MB pro Zeitreihe
+HISTORY_TIERS = [
+    (10, 2 * 86400),      # Rohdaten: 2 Tage
+    (60, 14 * 86400),     # 1 Minute: 14 Tage
+    (900, 730 * 86400),   # 15 Minuten: 2 Jahre
+]
+HISTORY_MAX_POINTS = 1500  # Standard-Punktzahl, wenn kein step angegeben ist
+ENERGY_MAX_GAP = 300  # Sekunden - längere Lücken werden nicht überbrückt
+ENERGY_TODAY_TTL = 60  # Sekunden - so lange gilt die Auswertung des laufenden Tages
+PROXY_CACHE_TTL = 2.0  # Sekunden - Gültigkeit einer /proxy-Antwort
+PROXY_CACHE_MAX = 64  # Maximale Einträge (LRU)
+PROXY_METRIC_TARGETS = 64  # Eigene /metrics-Serien für /proxy-Ziele, weitere zählen als "other"
+KEEP_RAW_PAYLOAD = True  # Original-Antwort als Bytes für ?raw=1 aufheben
+# Antworten bis zu dieser Größe werden komplett dekodiert, größere gezielt
+# (siehe FieldSpec; Grenze per `fronius_bench.py parse` ermittelt)
+EXTRACT_FULL_DECODE_MAX = 4096  # Bytes
+SSE_KEEPALIVE = 15  # Sekunden - Kommentarzeile gegen Proxy-Timeouts
+SSE_MAX_CLIENTS = 200  # Maximale gleichzeitige Stream-Abonnenten
+# Eigener Port für /stream (Event-Loop, ein Thread für alle Abonnenten);
+# 0 = /stream läuft über den WSGI-Server mit einem Thread pro Client
+SSE_PORT = int(os.environ.get('FRONIUS_PROXY_SSE_PORT', PORT + 1))
+SSE_HEADER_TIMEOUT = 10  # Sekunden - so lange darf ein Client für seine Anfrage brauchen
+COMPRESS_MIN_SIZE = 512  # Bytes - kleinere Antworten werden nicht komprimiert
+GZIP_LEVEL = 6
+BROTLI_QUALITY = 5  # 0-11; höher kostet auf dem Pi deutlich mehr CPU
+SNAPSHOT_VARIANTS_MAX = 32  # Kodierte Varianten (Format/fields/Kompression) pro Snapshot
+# Delta-Updates (/data?since=): so viele Vorgänger-Versionen werden vorgehalten
+DELTA_HISTORY = 120
+# Totzonen je Feldname - kleinere Änderungen erscheinen nicht im Delta
+# (Leistung in kW: 0.01 = 10 W)
+DELTA_DEADBANDS = {
+    'solarPower': 0.01, 'gridPower': 0.01, 'housePower': 0.01, 'batteryPower': 0.01,
+    'pv_power': 0.01, 'grid_power': 0.01, 'load_power': 0.01, 'akku_power': 0.01,
+    'batterySOC': 0.5, 'akku_soc': 0.5,
+    'oldest_age_s': 10, 'age_s': 10, 'data_age_s': 10,
+    'last_latency_ms': 50, 'last_connect_ms': 50, 'avg_connect_ms': 50, 'reuse_ratio': 0.05,
+}
+
+# Warmstart: letzter Snapshot auf Platte, damit nach dem Boot sofort Daten da sind
+WARM_START_FILE = os.path.expanduser('~/.fronius_proxy_snapshot.json')
+WARM_START_MAX_AGE = 6 * 3600  # Sekunden - ältere Stände werden nicht geladen
+WARM_START_SAVE_INTERVAL = 300  # Sekunden - seltenes Schreiben schont die SD-Karte
+STARTUP_POLL_DELAY = 1.0  # Sekunden - erster Poll erst, wenn der Server lauscht
+
+# Eindeutig pro Prozessstart, damit ETags nach einem Neustart nicht kollidieren
+BOOT_ID = format(int(time.time()), 'x')
+STARTED_AT = time.monotonic()
+
 # Logging
 logging.basicConfig(
     level=logging.INFO,
@@ -52,118 +202,2597 @@ logging.basicConfig(
 )
 logger = logging.getLogger('fronius-proxy')
 
-app = Flask(__name__)
+app = Flask(__name__)
+
+# ═══════════════════════════════════════════════════════════════════════════
+# HTTP-VERBINDUNGEN (Keep-Alive Pool)
+# ═══════════════════════════════════════════════════════════════════════════
+
+# Verbindungsaufbau-Zeit der letzten neuen Verbindung im aktuellen Thread.
+# Jede Abfrage läuft komplett in einem Thread, daher reicht thread-lokal.
+_connect_timing = threading.local()
+
+
+_adapter_class = None
+
+
+def _keepalive_adapter_class():
+    """Baut die Adapter-Klasse beim ersten Aufruf (erst dann werden requests/urllib3 geladen)"""
+    global _adapter_class
+    if _adapter_class is not None:
+        return _adapter_class
+    
+    from requests.adapters import HTTPAdapter
+    from urllib3.connection import HTTPConnection
+    from urllib3.connectionpool import HTTPConnectionPool, HTTPSConnectionPool
+    
+    class _TimedHTTPConnection(HTTPConnection):
+        """HTTPConnection, die die Dauer des TCP-Verbindungsaufbaus misst"""
+        
+        def connect(self):
+            start = time.time()
+            try:
+                super().connect()
+            finally:
+                _connect_timing.ms = round((time.time() - start) * 1000, 2)
+    
+    class _TimedHTTPConnectionPool(HTTPConnectionPool):
+        ConnectionCls = _TimedHTTPConnection
+    
+    class _KeepAliveAdapter(HTTPAdapter):
+        """HTTPAdapter mit gemessenen Verbindungen"""
+        
+        def init_poolmanager(self, *args, **kwargs):
+            super().init_poolmanager(*args, **kwargs)
+            self.poolmanager.pool_classes_by_scheme = {
+                'http': _TimedHTTPConnectionPool,
+                'https': HTTPSConnectionPool
+            }
+    
+    _adapter_class = _KeepAliveAdapter
+    return _adapter_class
+
+
+def create_session(pool_size: int = HTTP_POOL_SIZE) -> 'requests.Session':
+    """Erstellt eine Session mit Keep-Alive-Verbindungspool"""
+    session = requests.Session()
+    adapter = _keepalive_adapter_class()(pool_connections=1, pool_maxsize=pool_size)
+    session.mount('http://', adapter)
+    session.mount('https://', adapter)
+    session.headers.update({
+        'User-Agent': 'Lademeyer-Proxy/3.0',
+        'Accept': 'application/json',
+        'Connection': 'keep-alive'
+    })
+    return session
+
+
+# ═══════════════════════════════════════════════════════════════════════════
+# METRIKEN (Prometheus)
+# ═══════════════════════════════════════════════════════════════════════════
+
+# Bucket-Grenzen in Sekunden
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+CYCLE_BUCKETS = (0.05, 0.1, 0.25, 0.5, 1.0, 2.0, 4.0, 6.0, 8.0, 10.0, 15.0)
+
+
+class FroniusHTTPError(Exception):
+    """Fronius hat mit einem HTTP-Status ungleich 200 geantwortet"""
+    
+    def __init__(self, status: int):
+        super().__init__(f"HTTP {status}")
+        self.status = status
+
+
+class FroniusAPIError(Exception):
+    """Solar API meldet im Head einen Status-Code ungleich 0"""
+    
+    def __init__(self, code: int, reason: str = ''):
+        super().__init__(f"Solar API Status {code}{': ' + reason if reason else ''}")
+        self.code = code
+
+
+class FroniusSchemaError(ValueError):
+    """Gültiges JSON, aber nicht im erwarteten Aufbau (Pfad fehlt, falscher Typ)"""
+
+
+def classify_error(error: Exception) -> str:
+    """Ordnet einen Abfragefehler einer Ursache für die Metriken zu"""
+    if isinstance(error, requests.Timeout):
+        return 'timeout'
+    if isinstance(error, requests.ConnectionError):
+        return 'connection'
+    if isinstance(error, FroniusHTTPError):
+        return 'http_status'
+    if isinstance(error, FroniusAPIError):
+        return 'api_status'
+    if isinstance(error, FroniusSchemaError):
+        return 'schema'
+    if isinstance(error, (ValueError, KeyError, TypeError, AttributeError)):
+        return 'parse'
+    return 'other'
+
+
+ERROR_CAUSES = ('timeout', 'connection', 'http_status', 'api_status', 'schema', 'parse', 'other')
+
+
+class Histogram:
+    """Histogramm mit festen, beim Erstellen angelegten Buckets"""
+    
+    __slots__ = ('bounds', 'counts', 'sum', 'count')
+    
+    def __init__(self, bounds: tuple):
+        self.bounds = bounds
+        self.counts = [0] * (len(bounds) + 1)  # letzter Bucket = +Inf
+        self.sum = 0.0
+        self.count = 0
+    
+    def observe(self, value: float):
+        self.counts[bisect.bisect_left(self.bounds, value)] += 1
+        self.sum += value
+        self.count += 1
+    
+    def render(self, name: str, labels: str, lines: list):
+        prefix = labels + ',' if labels else ''
+        cumulative = 0
+        for bound, count in zip(self.bounds, self.counts):
+            cumulative += count
+            lines.append(f'{name}_bucket{{{prefix}le="{bound}"}} {cumulative}')
+        cumulative += self.counts[-1]
+        lines.append(f'{name}_bucket{{{prefix}le="+Inf"}} {cumulative}')
+        suffix = f'{{{labels}}}' if labels else ''
+        lines.append(f'{name}_sum{suffix} {self.sum:.6f}')
+        lines.append(f'{name}_count{suffix} {self.count}')
+
+
+def _label(value) -> str:
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+class Metrics:
+    """
+    Sammelt Kennzahlen für /metrics.
+    
+    Histogramme und Zähler werden pro Gerät bzw. Route einmalig angelegt;
+    danach erhöht eine Messung nur noch vorhandene Listeneinträge.
+    """
+    
+    def __init__(self):
+        self.device_latency: Dict[str, Histogram] = {}
+        self.device_errors: Dict[str, List[int]] = {}
+        # Einmalige Abfragen nicht konfigurierter Geräte (/proxy, /fronius) nach Ziel-IP
+        self.upstream_latency: Dict[str, Histogram] = {}
+        self.upstream_errors: Dict[str, List[int]] = {}
+        self.poll_cycle = Histogram(CYCLE_BUCKETS)
+        self.poll_lag = 0.0
+        self.route_latency: Dict[tuple, Histogram] = {}
+        self.route_status: Dict[tuple, int] = {}
+        self.data_responses = {'full': 0, 'not_modified': 0, 'delta': 0}
+        self._lock = threading.Lock()
+    
+    def observe_device(self, device_id: str, seconds: float):
+        histogram = self.device_latency.get(device_id)
+        if histogram is None:
+            with self._lock:
+                histogram = self.device_latency.setdefault(device_id, Histogram(LATENCY_BUCKETS))
+        histogram.observe(seconds)
+    
+    def device_error(self, device_id: str, cause: str):
+        counters = self.device_errors.get(device_id)
+        if counters is None:
+            with self._lock:
+                counters = self.device_errors.setdefault(device_id, [0] * len(ERROR_CAUSES))
+        counters[ERROR_CAUSES.index(cause)] += 1
+    
+    def prune_devices(self, device_ids):
+        """Verwirft die Serien entfernter Geräte"""
+        with self._lock:
+            for store in (self.device_latency, self.device_errors):
+                for device_id in [d for d in store if d not in device_ids]:
+                    del store[device_id]
+    
+    def _upstream_target(self, target: str) -> str:
+        """Begrenzt die Zahl der Ziel-Serien, da /proxy beliebige IPs annimmt"""
+        if target in self.upstream_latency or target in self.upstream_errors:
+            return target
+        known = self.upstream_latency.keys() | self.upstream_errors.keys()
+        return target if len(known) < PROXY_METRIC_TARGETS else 'other'
+    
+    def observe_upstream(self, target: str, seconds: float):
+        with self._lock:
+            target = self._upstream_target(target)
+            histogram = self.upstream_latency.setdefault(target, Histogram(LATENCY_BUCKETS))
+        histogram.observe(seconds)
+    
+    def upstream_error(self, target: str, cause: str):
+        with self._lock:
+            target = self._upstream_target(target)
+            counters = self.upstream_errors.setdefault(target, [0] * len(ERROR_CAUSES))
+        counters[ERROR_CAUSES.index(cause)] += 1
+    
+    def observe_route(self, route: str, method: str, status: int, seconds: float):
+        key = (route, method)
+        histogram = self.route_latency.get(key)
+        if histogram is None:
+            with self._lock:
+                histogram = self.route_latency.setdefault(key, Histogram(LATENCY_BUCKETS))
+        histogram.observe(seconds)
+        status_key = (route, method, status)
+        with self._lock:
+            self.route_status[status_key] = self.route_status.get(status_key, 0) + 1
+
+
+metrics = Metrics()
+
+
+# ═══════════════════════════════════════════════════════════════════════════
+# ZEITREIHEN-HISTORIE
+# ═══════════════════════════════════════════════════════════════════════════
+
+HISTORY_FIELDS = ('pv_power', 'grid_power', 'load_power', 'akku_power', 'akku_soc')
+
+# Ein Datensatz: Bucket-Start (uint32 Unix-Zeit) + 5 Werte (float32) = 24 Bytes
+_RECORD = struct.Struct('<I5f')
+
+
+class _RingFile:
+    """
+    Ringpuffer fester Größe in einer memory-mapped Datei.
+    
+    Der Slot eines Datensatzes ergibt sich direkt aus der Zeit
+    (bucket % capacity), Schreiben ist also ein einzelner Zugriff ohne
+    Index. Jeder Slot speichert seinen Bucket-Start, damit alte oder leere
+    Slots beim Lesen erkannt werden. Die Aufbewahrung ergibt sich aus der
+    Kapazität.
+    """
+    
+    def __init__(self, path: str, step: int, retention: int):
+        self.step = step
+        self.capacity = retention // step
+        size = self.capacity * _RECORD.size
+        
+        mode = 'r+b' if os.path.exists(path) and os.path.getsize(path) == size else 'w+b'
+        self._file = open(path, mode)
+        if mode == 'w+b':
+            self._file.truncate(size)
+        self._map = mmap.mmap(self._file.fileno(), size)
+        
+        # Laufender Mittelwert des aktuellen Buckets (für Downsampling)
+        self._bucket = None
+        self._sums = [0.0] * len(HISTORY_FIELDS)
+        self._count = 0
+    
+    def add(self, ts: int, values: tuple):
+        """Nimmt einen Messwert auf und schreibt den Mittelwert seines Buckets"""
+        bucket = ts // self.step
+        if bucket != self._bucket:
+            self._bucket = bucket
+            self._sums = [0.0] * len(HISTORY_FIELDS)
+            self._count = 0
+        self._count += 1
+        for i, value in enumerate(values):
+            self._sums[i] += value
+        means = [total / self._count for total in self._sums]
+        offset = (bucket % self.capacity) * _RECORD.size
+        _RECORD.pack_into(self._map, offset, bucket * self.step, *means)
+    
+    def _slot_ranges(self, start: int, end: int) -> List[tuple]:
+        """Zusammenhängende Slot-Bereiche für [start, end] (ggf. zweigeteilt durch Umlauf)"""
+        first = start // self.step
+        last = end // self.step
+        first = max(first, last - self.capacity + 1)
+        if last < first:
+            return []
+        first_slot = first % self.capacity
+        count = last - first + 1
+        ranges = [(first_slot, min(count, self.capacity - first_slot))]
+        if ranges[0][1] < count:
+            ranges.append((0, count - ranges[0][1]))
+        return ranges
+    
+    def read(self, start: int, end: int) -> List[tuple]:
+        """Liefert alle gültigen Datensätze mit start <= ts <= end"""
+        rows = []
+        for slot, n in self._slot_ranges(start, end):
+            chunk = self._map[slot * _RECORD.size:(slot + n) * _RECORD.size]
+            for record in _RECORD.iter_unpack(chunk):
+                if record[0] and start <= record[0] <= end:
+                    rows.append(record)
+        return rows
+    
+    def flush(self):
+        self._map.flush()
+    
+    def close(self):
+        self._map.close()
+        self._file.close()
+
+
+class HistoryStore:
+    """
+    Zeitreihen-Speicher für die Leistungswerte (gesamt und pro Gerät).
+    
+    Jeder Messwert wird in alle Auflösungsstufen aus HISTORY_TIERS
+    geschrieben, die gröberen Stufen halten den Mittelwert ihres Buckets.
+    """
+    
+    TOTAL = 'total'
+    
+    def __init__(self, directory: str = HISTORY_DIR, tiers: list = None):
+        self.directory = directory
+        self.tiers = tiers or HISTORY_TIERS
+        self._series: Dict[str, List[_RingFile]] = {}
+        self._lock = threading.Lock()
+        self.enabled = True
+        try:
+            os.makedirs(directory, exist_ok=True)
+        except OSError as e:
+            logger.error(f"Historie deaktiviert: {e}")
+            self.enabled = False
+    
+    def _get_series(self, series_id: str, create: bool = True) -> Optional[List[_RingFile]]:
+        rings = self._series.get(series_id)
+        if rings is not None or not create:
+            return rings
+        with self._lock:
+            rings = self._series.get(series_id)
+            if rings is None:
+                safe_id = re.sub(r'[^A-Za-z0-9_.-]', '_', series_id)
+                rings = [
+                    _RingFile(os.path.join(self.directory, f"{safe_id}.{step}s.bin"), step, retention)
+                    for step, retention in self.tiers
+                ]
+                self._series[series_id] = rings
+            return rings
+    
+    def has_series(self, series_id: str) -> bool:
+        if series_id in self._series:
+            return True
+        safe_id = re.sub(r'[^A-Za-z0-9_.-]', '_', series_id)
+        return os.path.exists(os.path.join(self.directory, f"{safe_id}.{self.tiers[0][0]}s.bin"))
+    
+    def record(self, series_id: str, ts: int, values: dict):
+        """Schreibt einen Messwert in alle Stufen einer Zeitreihe"""
+        if not self.enabled:
+            return
+        row = tuple(float(values.get(field, 0) or 0) for field in HISTORY_FIELDS)
+        for ring in self._get_series(series_id):
+            ring.add(ts, row)
+    
+    def record_snapshot(self, snapshot: 'DataSnapshot', ts: int = None):
+        """Schreibt Gesamtwerte und alle Geräte mit Daten aus einem Snapshot"""
+        ts = ts or int(time.time())
+        data = snapshot.data
+        self.record(self.TOTAL, ts, data)
+        for device in data['devices']:
+            if 'data' in device:
+                self.record(device['id'], ts, device['data'])
+    
+    def query(self, series_id: str, start: int, end: int, step: int = None,
+              fields: List[str] = None) -> dict:
+        """
+        Liefert Punkte im Bereich [start, end].
+        
+        Gewählt wird die gröbste Stufe, deren Schrittweite <= step ist und
+        die `start` noch abdeckt; ist step feiner als jede abdeckende Stufe,
+        gilt die feinste davon und step wird auf ihre Auflösung angehoben.
+        Ist step größer als die Stufe, werden mehrere Buckets gemittelt.
+        Mit fields nur diese Spalten (plus Zeit).
+        """
+        now = int(time.time())
+        if step is None:
+            # Feinste Stufe, die den Bereich mit HISTORY_MAX_POINTS Punkten abdeckt
+            for tier_step, retention in self.tiers:
+                if (end - start) // tier_step <= HISTORY_MAX_POINTS and now - retention <= start:
+                    step = tier_step
+                    break
+            else:
+                coarsest = self.tiers[-1][0]
+                step = max(1, -(-(end - start) // (HISTORY_MAX_POINTS * coarsest))) * coarsest
+        
+        # Feinste Stufe, die start noch abdeckt (sonst die gröbste); danach
+        # die gröbste abdeckende Stufe, die step nicht überschreitet
+        covering = [i for i, (_, retention) in enumerate(self.tiers) if now - retention <= start]
+        tier_index = covering[0] if covering else len(self.tiers) - 1
+        for i in covering:
+            if self.tiers[i][0] <= step:
+                tier_index = i
+        
+        rings = self._get_series(series_id, create=self.has_series(series_id))
+        tier_step = self.tiers[tier_index][0]
+        rows = rings[tier_index].read(start, end) if rings else []
+        step = max(step, tier_step)
+        
+        points = []
+        if step == tier_step:
+            points = [[r[0]] + [round(v, 3) for v in r[1:]] for r in rows]
+        else:
+            # Auf die gewünschte Schrittweite mitteln
+            bucket = None
+            sums = None
+            count = 0
+            for r in rows + [None]:
+                b = r[0] // step if r is not None else None
+                if b != bucket and count:
+                    points.append([bucket * step] + [round(v / count, 3) for v in sums])
+                    count = 0
+                if r is None:
+                    break
+                if count == 0:
+                    bucket = b
+                    sums = list(r[1:])
+                else:
+                    sums = [a + v for a, v in zip(sums, r[1:])]
+                count += 1
+        
+        fields = list(fields or HISTORY_FIELDS)
+        if fields != list(HISTORY_FIELDS):
+            columns = [0] + [HISTORY_FIELDS.index(field) + 1 for field in fields]
+            points = [[point[i] for i in columns] for point in points]
+        
+        return {
+            'series': series_id,
+            'from': start,
+            'to': end,
+            'step': step,
+            'tier_step': tier_step,
+            'fields': ['timestamp'] + fields,
+            'points': points
+        }
+    
+    def flush(self):
+        for rings in list(self._series.values()):
+            for ring in rings:
+                ring.flush()
+
+
+# ═══════════════════════════════════════════════════════════════════════════
+# ENERGIE-AUSWERTUNG
+# ═══════════════════════════════════════════════════════════════════════════
+
+# Tageswerte: Energie in kWh (Trapez-Integration der Leistung), Spitzen in kW
+ENERGY_SUMS = ('pv_kwh', 'load_kwh', 'grid_import_kwh', 'grid_export_kwh',
+               'battery_charge_kwh', 'battery_discharge_kwh')
+ENERGY_PEAKS = ('peak_load_kw', 'peak_pv_kw')
+
+
+def _energy_columns(pv, grid, load, akku):
+    """Leistungen je ENERGY_SUMS (Netz: + Bezug, Batterie: - Laden)"""
+    return (pv, load, max(grid, 0.0), max(-grid, 0.0), max(-akku, 0.0), max(akku, 0.0))
+
+
+def integrate_days(rows, day_starts: List[int], max_gap: float) -> List[dict]:
+    """
+    Integriert Leistungswerte tageweise in einem Durchgang.
+    
+    rows: Datensätze (ts, pv, grid, load, akku, soc) aufsteigend nach Zeit.
+    day_starts: Beginn jedes Tages plus Ende des letzten. Segmente über
+    Tagesgrenzen oder Lücken > max_gap zählen nicht.
+    """
+    days = len(day_starts) - 1
+    sums = [[0.0] * len(ENERGY_SUMS) for _ in range(days)]
+    peaks = [[0.0] * len(ENERGY_PEAKS) for _ in range(days)]
+    covered = [0.0] * days
+    samples = [0] * days
+    
+    day = 0
+    previous = None
+    for row in rows:
+        ts = row[0]
+        while day < days and ts >= day_starts[day + 1]:
+            day += 1
+            previous = None  # Segmente nicht über Tagesgrenzen
+        if day >= days or ts < day_starts[day]:
+            continue
+        cols = _energy_columns(row[1], row[2], row[3], row[4])
+        samples[day] += 1
+        peaks[day][0] = max(peaks[day][0], row[3])
+        peaks[day][1] = max(peaks[day][1], row[1])
+        if previous is not None and ts - previous[0] <= max_gap:
+            dt = ts - previous[0]
+            covered[day] += dt
+            day_sums = sums[day]
+            for k, (a, b) in enumerate(zip(previous[1], cols)):
+                day_sums[k] += (a + b) * dt / 7200.0
+        previous = (ts, cols)
+    
+    result = []
+    for d in range(days):
+        stats = {key: round(value, 3) for key, value in zip(ENERGY_SUMS, sums[d])}
+        stats.update({key: round(value, 3) for key, value in zip(ENERGY_PEAKS, peaks[d])})
+        stats['covered_s'] = int(covered[d])
+        stats['samples'] = int(samples[d])
+        result.append(stats)
+    return result
+
+
+def energy_ratios(stats: dict) -> dict:
+    """Eigenverbrauchsquote und Autarkie aus summierten Energien"""
+    pv = stats['pv_kwh']
+    load = stats['load_kwh']
+    stats['self_consumption'] = round(min(1.0, max(0.0, (pv - stats['grid_export_kwh']) / pv)), 3) if pv > 0 else None
+    stats['autarky'] = round(min(1.0, max(0.0, 1 - stats['grid_import_kwh'] / load)), 3) if load > 0 else None
+    return stats
+
+
+def _day_start(day: date) -> int:
+    """Lokale Mitternacht als Unix-Zeit"""
+    return int(datetime(day.year, day.month, day.day).timestamp())
+
+
+class EnergyAnalytics:
+    """
+    Tages-, Wochen- und Monatswerte der Energie aus der Historie.
+    
+    Jeder abgeschlossene Tag wird einmal aus der feinsten noch vorhandenen
+    Stufe integriert und in energy_days.json abgelegt; beim ersten Start
+    werden alle vorhandenen Tage gesammelt nachgerechnet. Abfragen fassen
+    nur noch Tageswerte zusammen, der laufende Tag wird höchstens alle
+    ENERGY_TODAY_TTL Sekunden neu berechnet.
+    """
+    
+    PERIODS = ('day', 'week', 'month', 'year')
+    
+    def __init__(self, history: HistoryStore, series_id: str = HistoryStore.TOTAL):
+        self.history = history
+        self.series_id = series_id
+        self.path = os.path.join(history.directory, 'energy_days.json')
+        self.days: Dict[str, dict] = {}  # 'YYYY-MM-DD' -> Tageswerte
+        self.closed_until: Optional[date] = None
+        self._checked: Optional[date] = None
+        self._today = (0.0, None)  # (monotone Zeit, Tageswerte)
+        self._lock = threading.Lock()
+        try:
+            with open(self.path, 'r') as f:
+                saved = json.load(f)
+            self.days = saved.get('days', {})
+            if saved.get('closed_until'):
+                self.closed_until = date.fromisoformat(saved['closed_until'])
+        except FileNotFoundError:
+            pass
+        except Exception as e:
+            logger.error(f"Energie-Tageswerte nicht lesbar: {e}")
+    
+    def _tier_for(self, start: int) -> Optional[int]:
+        """Feinste Stufe, deren Aufbewahrung start noch abdeckt"""
+        now = int(time.time())
+        for i, (_, retention) in enumerate(self.history.tiers):
+            if now - retention <= start:
+                return i
+        return None
+    
+    def _compute(self, first: date, last: date, tier_index: int) -> List[dict]:
+        """Tageswerte für first..last aus einer Stufe (ein Lesezugriff)"""
+        rings = self.history._get_series(self.series_id, create=self.history.has_series(self.series_id))
+        count = (last - first).days + 1
+        day_starts = [_day_start(first + timedelta(days=d)) for d in range(count + 1)]
+        if not rings:
+            return integrate_days([], day_starts, ENERGY_MAX_GAP)
+        ring = rings[tier_index]
+        start, end = day_starts[0], min(day_starts[-1] - 1, int(time.time()))
+        return integrate_days(ring.read(start, end), day_starts, max(ENERGY_MAX_GAP, 2 * ring.step))
+    
+    def close_days(self, today: date = None) -> int:
+        """
+        Berechnet alle abgeschlossenen, noch fehlenden Tage (nur einmal pro Tag aktiv).
+        
+        Zusammenhängende Tage derselben Stufe werden gemeinsam berechnet.
+        Liefert die Anzahl neu berechneter Tage.
+        """
+        today = today or date.today()
+        if self._checked == today or not self.history.enabled:
+            return 0
+        with self._lock:
+            yesterday = today - timedelta(days=1)
+            first = self.closed_until + timedelta(days=1) if self.closed_until else None
+            if first is None:
+                # Erster Lauf: alles, was die gröbste Stufe noch hat
+                first = date.fromtimestamp(time.time() - self.history.tiers[-1][1]) + timedelta(days=1)
+            
+            # Tage nach Stufe gruppieren (ältere Tage = gröbere Stufe)
+            batches = []
+            day = first
+            while day <= yesterday:
+                tier_index = self._tier_for(_day_start(day))
+                if tier_index is not None:
+                    if batches and batches[-1][2] == tier_index:
+                        batches[-1][1] = day
+                    else:
+                        batches.append([day, day, tier_index])
+                day += timedelta(days=1)
+            
+            computed = 0
+            for batch_first, batch_last, tier_index in batches:
+                step = self.history.tiers[tier_index][0]
+                for offset, stats in enumerate(self._compute(batch_first, batch_last, tier_index)):
+                    if stats['samples']:
+                        stats['resolution_s'] = step
+                        self.days[(batch_first + timedelta(days=offset)).isoformat()] = stats
+                        computed += 1
+            
+            self.closed_until = yesterday
+            self._checked = today
+            if computed or batches:
+                self._save()
+        if computed:
+            logger.info(f"[ENERGIE] {computed} Tag(e) abgeschlossen")
+        return computed
+    
+    def _save(self):
+        tmp_path = f"{self.path}.tmp"
+        try:
+            with open(tmp_path, 'w') as f:
+                json.dump({'closed_until': self.closed_until.isoformat(), 'days': self.days},
+                          f, separators=(',', ':'))
+            os.replace(tmp_path, self.path)
+        except Exception as e:
+            logger.error(f"Energie-Tageswerte speichern fehlgeschlagen: {e}")
+    
+    def today(self) -> Optional[dict]:
+        """Laufender Tag (zwischengespeichert für ENERGY_TODAY_TTL)"""
+        computed_at, stats = self._today
+        if time.monotonic() - computed_at < ENERGY_TODAY_TTL:
+            return stats
+        day = date.today()
+        stats = self._compute(day, day, 0)[0]
+        stats['resolution_s'] = self.history.tiers[0][0]
+        stats = stats if stats['samples'] else None
+        self._today = (time.monotonic(), stats)
+        return stats
+    
+    @staticmethod
+    def period_start(day: date, period: str) -> date:
+        if period == 'week':
+            return day - timedelta(days=day.weekday())
+        if period == 'month':
+            return day.replace(day=1)
+        if period == 'year':
+            return day.replace(month=1, day=1)
+        return day
+    
+    def rollup(self, period: str, first: date, last: date) -> List[dict]:
+        """Fasst Tageswerte zu Zeiträumen zusammen (Summen, Spitzen, Quoten neu berechnet)"""
+        days = dict(self.days)
+        today = date.today()
+        if first <= today <= last:
+            stats = self.today()
+            if stats:
+                days[today.isoformat()] = dict(stats, partial=True)
+        
+        # Nur vorhandene Tage durchgehen (ISO-Daten sortieren wie Daten) -
+        # auch sehr weite Bereiche bis date.min/date.max kosten so nichts
+        lo, hi = first.isoformat(), last.isoformat()
+        buckets: Dict[date, dict] = {}
+        for day_key, stats in days.items():
+            if not lo <= day_key <= hi:
+                continue
+            key = self.period_start(date.fromisoformat(day_key), period)
+            bucket = buckets.get(key)
+            if bucket is None:
+                bucket = buckets[key] = dict.fromkeys(ENERGY_SUMS + ENERGY_PEAKS, 0.0)
+                bucket.update(start=key.isoformat(), days=0, covered_s=0, partial=False)
+            for field in ENERGY_SUMS:
+                bucket[field] += stats[field]
+            for field in ENERGY_PEAKS:
+                bucket[field] = max(bucket[field], stats[field])
+            bucket['days'] += 1
+            bucket['covered_s'] += stats['covered_s']
+            bucket['partial'] = bucket['partial'] or bool(stats.get('partial'))
+        
+        result = []
+        for key in sorted(buckets):
+            bucket = buckets[key]
+            for field in ENERGY_SUMS:
+                bucket[field] = round(bucket[field], 3)
+            result.append(energy_ratios(bucket))
+        return result
+
+
+# ═══════════════════════════════════════════════════════════════════════════
+# SOLAR-API-PARSER
+# ═══════════════════════════════════════════════════════════════════════════
+
+_JSON_SCANNER = json.JSONDecoder().scan_once
+_JSON_WHITESPACE = ' \t\r\n'
+
+
+def _json_depth(text: str, pos: int) -> int:
+    """
+    Verschachtelungstiefe an `pos` aus der Zahl der Klammern.
+    
+    Gezählt wird von der näheren Seite aus (das Dokument ist geschlossen),
+    Klammern in Strings werden nicht erkannt - ein Treffer auf falscher
+    Tiefe wird deshalb verworfen und das Dokument notfalls ganz dekodiert.
+    """
+    if pos <= len(text) // 2:
+        return (text.count('{', 0, pos) + text.count('[', 0, pos)
+                - text.count('}', 0, pos) - text.count(']', 0, pos))
+    return (text.count('}', pos) + text.count(']', pos)
+            - text.count('{', pos) - text.count('[', pos))
+
+
+def _find_key(text: str, key: str, pos: int, depth: int) -> Optional[int]:
+    """Position des Werts zum Schlüssel `key` auf Tiefe `depth` ab `pos` (None = fehlt)"""
+    token = f'"{key}"'
+    end = len(text)
+    while True:
+        start = text.find(token, pos)
+        if start < 0:
+            return None
+        pos = start + len(token)
+        # Nur echte Schlüssel: davor '{' oder ',', danach ':'
+        before = start - 1
+        while before >= 0 and text[before] in _JSON_WHITESPACE:
+            before -= 1
+        after = pos
+        while after < end and text[after] in _JSON_WHITESPACE:
+            after += 1
+        if before < 0 or text[before] not in '{,' or after >= end or text[after] != ':':
+            continue
+        if _json_depth(text, start) != depth:
+            continue
+        after += 1
+        while after < end and text[after] in _JSON_WHITESPACE:
+            after += 1
+        return after
+
+
+# Exakte Typen für die schnelle Prüfung (bool ist keine Zahl)
+_NUMBER_TYPES = frozenset((int, float))
+
+
+class FieldSpec:
+    """
+    Feldpfade eines Solar-API-Endpunkts und ihre Extraktion aus den Rohdaten.
+    
+    fields bildet Ausgabenamen auf Pfade ab, '*' steht für jedes Kind eines
+    Objekts: {'pv_power': 'Body.Data.Site.P_PV', 'akku_soc':
+    'Body.Data.Inverters.*.SOC'}. Alle Felder sind Zahlen oder null; Pfade
+    mit '*' liefern die Liste der Werte ungleich null. Pfade in `required`
+    müssen vorhanden sein, sonst FroniusSchemaError. Ein Status-Code
+    ungleich 0 im Head wird als FroniusAPIError gemeldet.
+    
+    Kleine Antworten werden komplett dekodiert (json in C ist dort am
+    schnellsten) und direkt über get-Ketten ausgelesen. In größeren werden nur die Teilbäume gesucht und
+    dekodiert, in denen Felder liegen ("Site", "Inverters", "Head.Status") -
+    Smartloads, SecondaryMeters und Co. werden nur überlesen.
+    """
+    
+    STATUS_PATH = ('Head', 'Status')
+    
+    def __init__(self, fields: Dict[str, str], required: tuple = ()):
+        self.fields = dict(fields)
+        self.required = tuple(tuple(path.split('.')) for path in required)
+        # Teilbaum (bis vor das erste '*' bzw. das Blatt) -> [(Name, Restpfad)]
+        self._anchors: Dict[tuple, List[tuple]] = {}
+        for name, path in self.fields.items():
+            parts = tuple(path.split('.'))
+            cut = parts.index('*') if '*' in parts else len(parts) - 1
+            self._anchors.setdefault(parts[:cut], []).append((name, parts[cut:]))
+        for path in self.required:
+            self._anchors.setdefault(path, [])
+        self._anchors.setdefault(self.STATUS_PATH, [])
+        # Für kleine Antworten: (Teilbaum, Pflicht, ((Name, Schlüssel, Restpfad), ...))
+        self._plan = tuple(
+            (anchor, anchor in self.required,
+             tuple((name, rest[0] if rest[0] != '*' else None, rest[1:]) for name, rest in picks))
+            for anchor, picks in self._anchors.items() if anchor != self.STATUS_PATH
+        )
+    
+    def extract(self, raw: bytes) -> dict:
+        """Liefert {Name: Wert}; ValueError bei ungültigem JSON"""
+        if len(raw) <= EXTRACT_FULL_DECODE_MAX:
+            return self._extract_decoded(json.loads(raw))
+        subtrees = self._subtrees_scanned(raw.decode('utf-8'))
+        
+        status = subtrees.get(self.STATUS_PATH)
+        if isinstance(status, dict) and status.get('Code'):
+            raise FroniusAPIError(status['Code'], status.get('Reason') or '')
+        for path in self.required:
+            if not isinstance(subtrees.get(path), dict):
+                raise FroniusSchemaError(f"{'.'.join(path)} fehlt")
+        
+        values = {}
+        for anchor, picks in self._anchors.items():
+            subtree = subtrees.get(anchor)
+            for name, rest in picks:
+                if rest[0] == '*':
+                    found = [value for value in self._wildcard(subtree, rest[1:]) if value is not None]
+                    for value in found:
+                        self._check_number(name, value)
+                    values[name] = found
+                else:
+                    value = subtree.get(rest[0]) if isinstance(subtree, dict) else None
+                    self._check_number(name, value)
+                    values[name] = value
+        return values
+    
+    def _extract_decoded(self, document) -> dict:
+        """Kleiner Weg: direkte get-Ketten auf dem ganzen Dokument"""
+        head = document.get('Head') if type(document) is dict else None
+        status = head.get('Status') if type(head) is dict else None
+        if type(status) is dict and status.get('Code'):
+            raise FroniusAPIError(status['Code'], status.get('Reason') or '')
+        
+        values = {}
+        for anchor, required, picks in self._plan:
+            node = document
+            for key in anchor:
+                node = node.get(key) if type(node) is dict else None
+            if type(node) is not dict:
+                if required:
+                    raise FroniusSchemaError(f"{'.'.join(anchor)} fehlt")
+                node = {}
+            for name, key, rest in picks:
+                if key is not None:
+                    value = node.get(key)
+                    if value is not None and type(value) not in _NUMBER_TYPES:
+                        self._check_number(name, value)
+                    values[name] = value
+                    continue
+                found = []
+                for child in node.values():
+                    for part in rest:
+                        child = child.get(part) if type(child) is dict else None
+                    if child is not None:
+                        if type(child) not in _NUMBER_TYPES:
+                            self._check_number(name, child)
+                        found.append(child)
+                values[name] = found
+        return values
+    
+    def _subtrees_decoded(self, document) -> Dict[tuple, object]:
+        subtrees = {}
+        for anchor in self._anchors:
+            node = document
+            for key in anchor:
+                node = node.get(key) if isinstance(node, dict) else None
+            subtrees[anchor] = node
+        return subtrees
+    
+    def _subtrees_scanned(self, text: str) -> Dict[tuple, object]:
+        """Sucht jeden Teilbaum gezielt; fehlt einer, wird doch alles dekodiert"""
+        subtrees = {}
+        for anchor in self._anchors:
+            pos = 0
+            for depth, key in enumerate(anchor, 1):
+                pos = _find_key(text, key, pos, depth)
+                if pos is None:
+                    return self._subtrees_decoded(json.loads(text))
+            try:
+                subtrees[anchor] = _JSON_SCANNER(text, pos)[0]
+            except StopIteration:
+                raise ValueError(f"Ungültiges JSON bei Zeichen {pos}") from None
+        return subtrees
+    
+    @staticmethod
+    def _wildcard(subtree, rest: tuple):
+        if not isinstance(subtree, dict):
+            return
+        for child in subtree.values():
+            for key in rest:
+                child = child.get(key) if isinstance(child, dict) else None
+            yield child
+    
+    @staticmethod
+    def _check_number(name: str, value):
+        if value is not None and (isinstance(value, bool) or not isinstance(value, (int, float))):
+            raise FroniusSchemaError(f"{name}: Zahl erwartet, {type(value).__name__} erhalten")
+
+
+# Felder je Endpunkt (Leistungen in W, SOC in %, Kapazität in Wh)
+POWER_FLOW_SPEC = FieldSpec({
+    'pv_power': 'Body.Data.Site.P_PV',
+    'grid_power': 'Body.Data.Site.P_Grid',
+    'load_power': 'Body.Data.Site.P_Load',
+    'akku_power': 'Body.Data.Site.P_Akku',
+    'akku_soc': 'Body.Data.Inverters.*.SOC',
+}, required=('Body.Data.Site',))
+STORAGE_SPEC = FieldSpec({
+    'capacity': 'Body.Data.*.Controller.Capacity_Maximum',
+}, required=('Body.Data',))
+
+
+# ═══════════════════════════════════════════════════════════════════════════
+# DATEN-STRUKTUREN
+# ═══════════════════════════════════════════════════════════════════════════
+
+class DeviceReading:
+    """Kompakter Messwert eines Geräts (nur die extrahierten Felder)"""
+    
+    __slots__ = ('pv_power', 'grid_power', 'load_power', 'akku_power', 'akku_soc',
+                 'response_time_ms', 'connect_time_ms', 'timestamp', 'fetched_at')
+    
+    def __init__(self, pv_power: float, grid_power: float, load_power: float,
+                 akku_power: float, akku_soc: Optional[float], response_time_ms: float,
+                 connect_time_ms: Optional[float], timestamp: str):
+        self.pv_power = pv_power
+        self.grid_power = grid_power
+        self.load_power = load_power
+        self.akku_power = akku_power
+        self.akku_soc = akku_soc  # None = keine Batterie
+        self.response_time_ms = response_time_ms
+        self.connect_time_ms = connect_time_ms
+        self.timestamp = timestamp
+        self.fetched_at = time.monotonic()
+    
+    def power_dict(self) -> dict:
+        """Nur die Leistungswerte (für /data)"""
+        return {
+            'pv_power': self.pv_power,
+            'grid_power': self.grid_power,
+            'load_power': self.load_power,
+            'akku_power': self.akku_power,
+            'akku_soc': self.akku_soc if self.akku_soc is not None else 0,
+        }
+    
+    def age(self, now: float = None) -> float:
+        """Alter in Sekunden (monotone Uhr)"""
+        return (now or time.monotonic()) - self.fetched_at
+    
+    def to_dict(self, interval: float = POLL_INTERVAL) -> dict:
+        data = self.power_dict()
+        data['age_s'] = round(self.age(), 1)
+        data['freshness'] = staleness(self.age(), interval)[0]
+        data['response_time_ms'] = self.response_time_ms
+        data['connect_time_ms'] = self.connect_time_ms
+        data['connection_reused'] = self.connect_time_ms is None
+        data['timestamp'] = self.timestamp
+        return data
+
+
+def stale_limits(interval: float = POLL_INTERVAL) -> tuple:
+    """STALE_AFTER und STALE_MAX_AGE für ein Gerät mit dem Poll-Takt `interval`"""
+    scale = max(1.0, interval / POLL_INTERVAL)
+    return STALE_AFTER * scale, STALE_MAX_AGE * scale
+
+
+def staleness(age: float, interval: float = POLL_INTERVAL) -> tuple:
+    """
+    Zustand und Faktor eines Messwerts nach STALE_POLICY.
+    
+    Liefert (Zustand, Faktor, zählt_mit): Zustand ist 'fresh', 'stale'
+    oder 'expired', der Faktor wird auf die Leistungswerte angewendet.
+    """
+    stale_after, max_age = stale_limits(interval)
+    if age <= stale_after:
+        return 'fresh', 1.0, True
+    if age > max_age or STALE_POLICY == 'drop':
+        return ('expired' if age > max_age else 'stale'), 0.0, False
+    if STALE_POLICY == 'interpolate':
+        return 'stale', (max_age - age) / (max_age - stale_after), True
+    return 'stale', 1.0, True
+
+
+class EndpointData:
+    """Zwischengespeicherte Antwort eines Solar-API-Endpunkts"""
+    
+    __slots__ = ('raw', 'response_time_ms', 'timestamp', 'fetched_at')
+    
+    def __init__(self, raw: bytes, response_time_ms: float,
+                 timestamp: str = None, fetched_at: float = None):
+        self.raw = raw
+        self.response_time_ms = response_time_ms
+        self.timestamp = timestamp or datetime.now().isoformat()
+        self.fetched_at = fetched_at or time.monotonic()
+
+
+# Erlaubte Endpunkt-Namen, z.B. "GetMeterRealtimeData.cgi?Scope=System"
+_ENDPOINT_PATTERN = re.compile(r'^Get[A-Za-z]+\.f?cgi(\?[A-Za-z0-9_=&.-]*)?$')
+
+
+def is_valid_endpoint(endpoint: str) -> bool:
+    return bool(_ENDPOINT_PATTERN.match(endpoint or ''))
+
+
+_IP_PATTERN = re.compile(r'^(\d{1,3}\.){3}\d{1,3}$')
+
+
+def is_valid_ip(ip: str) -> bool:
+    return isinstance(ip, str) and bool(_IP_PATTERN.match(ip))
+
+
+# Namen von Aggregat-Gruppen, z.B. "haus_a" oder "phase-l1"
+_GROUP_PATTERN = re.compile(r'^[A-Za-z0-9_.-]{1,64}$')
+
+
+def is_valid_group(group: str) -> bool:
+    return isinstance(group, str) and bool(_GROUP_PATTERN.match(group)) and group != 'all'
+
+
+class FroniusDevice:
+    """Repräsentiert einen Fronius-Wechselrichter"""
+    
+    kind = 'device'
+    # Einstellungen aus Config/PUT/Batch; 0 bzw. [] setzt auf den Standard zurück
+    OPTION_DEFAULTS = {'groups': [], 'battery_capacity': 0, 'poll_interval': 0, 'priority': 0}
+    
+    def __init__(self, device_id: str, ip: str, name: str = None, endpoints: dict = None,
+                 options: dict = None, transient: bool = False):
+        self.id = device_id
+        self.ip = ip
+        self.name = name or f"Fronius {device_id}"
+        # Einmalige Abfrage ohne Registry-Eintrag: Metriken nach IP statt Geräte-ID
+        self.transient = transient
+        # Zusätzliche Endpunkte -> Intervall in Sekunden
+        self.endpoints: Dict[str, float] = dict(EXTRA_ENDPOINTS if endpoints is None else endpoints)
+        self.endpoint_cache: Dict[str, EndpointData] = {}
+        # Aggregat-Gruppen (z.B. Gebäude oder Phase) und Batteriekapazität in kWh
+        self.groups: List[str] = []
+        self.battery_capacity = None  # konfiguriert
+        # Eigener Poll-Takt (None = POLL_INTERVAL); höhere Priorität wird zuerst abgefragt
+        self.poll_interval: Optional[float] = None
+        self.priority = 0
+        self.apply_options(options or {})
+        self.detected_capacity = None  # aus GetStorageRealtimeData
+        self.listener = None  # Callback bei neuem Messwert (Aggregation)
+        self.is_reachable = False
+        self.last_check = None
+        self.last_data: Optional[DeviceReading] = None
+        self.last_raw: Optional[bytes] = None  # Original-Antwort (nur mit keep_raw)
+        self.keep_raw = KEEP_RAW_PAYLOAD
+        self.error_count = 0
+        self.last_latency_ms = None  # Dauer der letzten Abfrage (auch bei Fehler)
+        
+        # Circuit-Breaker: closed -> open -> half_open -> closed/open
+        self.breaker_state = 'closed'
+        self._breaker_open_until = 0.0
+        self._breaker_lock = threading.Lock()
+        
+        # Keep-Alive Session (wird bei Bedarf erstellt)
+        self._session = None
+        self._session_requests = 0
+        self._session_last_used = 0.0
+        self.http_stats = {
+            'requests': 0,
+            'new_connections': 0,
+            'reused_connections': 0,
+            'last_connect_ms': None,
+            'total_connect_ms': 0.0
+        }
+    
+    def _get_session(self) -> 'requests.Session':
+        """Liefert die Session, baut sie nach Idle-Zeit oder Anfrage-Limit neu auf"""
+        now = time.monotonic()
+        if self._session is not None and (
+            now - self._session_last_used > HTTP_KEEPALIVE_IDLE
+            or self._session_requests >= HTTP_KEEPALIVE_MAX_REQUESTS
+        ):
+            # Eingebettete Webserver schließen Idle-Verbindungen selbst -
+            # lieber sauber neu verbinden als auf einen toten Socket zu schreiben
+            self.close()
+        if self._session is None:
+            self._session = create_session()
+            self._session_requests = 0
+        self._session_last_used = now
+        self._session_requests += 1
+        return self._session
+    
+    def close(self):
+        """Schließt alle offenen Verbindungen zum Gerät"""
+        if self._session is not None:
+            self._session.close()
+            self._session = None
+    
+    def _record_connection(self):
+        """Wertet aus, ob die letzte Anfrage eine neue Verbindung aufgebaut hat"""
+        connect_ms = getattr(_connect_timing, 'ms', None)
+        _connect_timing.ms = None
+        stats = self.http_stats
+        stats['requests'] += 1
+        if connect_ms is None:
+            stats['reused_connections'] += 1
+        else:
+            stats['new_connections'] += 1
+            stats['last_connect_ms'] = connect_ms
+            stats['total_connect_ms'] += connect_ms
+        return connect_ms
+    
+    def http_summary(self) -> dict:
+        """Kennzahlen zur Wiederverwendung der Verbindungen"""
+        stats = self.http_stats
+        new = stats['new_connections']
+        return {
+            'requests': stats['requests'],
+            'new_connections': new,
+            'reuse_ratio': round(stats['reused_connections'] / stats['requests'], 3) if stats['requests'] else None,
+            'last_connect_ms': stats['last_connect_ms'],
+            'avg_connect_ms': round(stats['total_connect_ms'] / new, 2) if new else None
+        }
+    
+    def breaker_ready(self) -> bool:
+        """True wenn eine Abfrage erlaubt wäre (ohne den Zustand zu ändern)"""
+        if self.breaker_state == 'open':
+            return time.monotonic() >= self._breaker_open_until
+        return self.breaker_state == 'closed'
+    
+    def _breaker_acquire(self) -> bool:
+        """Prüft den Breaker vor einer Abfrage; lässt im Half-Open genau eine Probe durch"""
+        with self._breaker_lock:
+            if self.breaker_state == 'closed':
+                return True
+            if self.breaker_state == 'open' and time.monotonic() >= self._breaker_open_until:
+                self.breaker_state = 'half_open'
+                return True
+            return False
+    
+    def _breaker_success(self):
+        with self._breaker_lock:
+            if self.breaker_state != 'closed':
+                logger.info(f"[BREAKER] {self.name} ({self.ip}) wieder erreichbar")
+            self.breaker_state = 'closed'
+            self._breaker_open_until = 0.0
+    
+    def _breaker_failure(self):
+        """Öffnet den Breaker ab BREAKER_THRESHOLD Fehlern mit exponentiellem Backoff"""
+        with self._breaker_lock:
+            if self.error_count < BREAKER_THRESHOLD:
+                return
+            backoff = min(BREAKER_MAX_BACKOFF,
+                          BREAKER_BASE_BACKOFF * 2 ** (self.error_count - BREAKER_THRESHOLD))
+            backoff *= random.uniform(1 - BREAKER_JITTER, 1 + BREAKER_JITTER)
+            self.breaker_state = 'open'
+            self._breaker_open_until = time.monotonic() + backoff
+            logger.warning(f"[BREAKER] {self.name} ({self.ip}) gesperrt fuer {backoff:.0f}s")
+    
+    def change_ip(self, ip: str):
+        """Neue IP: Verbindungen, Breaker und Endpunkt-Cache zurücksetzen"""
+        if ip == self.ip:
+            return
+        self.close()
+        self.reset_breaker()
+        self.endpoint_cache.clear()
+        self.ip = ip
+    
+    def reset_breaker(self):
+        """Setzt Fehlerzähler und Breaker zurück (z.B. nach IP-Änderung)"""
+        with self._breaker_lock:
+            self.error_count = 0
+            self.breaker_state = 'closed'
+            self._breaker_open_until = 0.0
+    
+    def breaker_info(self) -> dict:
+        retry_in = max(0.0, self._breaker_open_until - time.monotonic())
+        return {
+            'state': self.breaker_state,
+            'retry_in_s': round(retry_in, 1) if self.breaker_state == 'open' else None
+        }
+    
+    def apply_options(self, options: dict, reset: bool = False):
+        """Übernimmt Einstellungen; nicht angegebene bleiben (mit reset: Standard)"""
+        if reset:
+            options = dict(self.OPTION_DEFAULTS, **{k: v for k, v in options.items() if v is not None})
+        if options.get('groups') is not None:
+            self.groups = list(options['groups'])
+        if options.get('battery_capacity') is not None:
+            self.battery_capacity = options['battery_capacity'] or None
+        if options.get('poll_interval') is not None:
+            self.poll_interval = options['poll_interval'] or None
+        if options.get('priority') is not None:
+            self.priority = int(options['priority'])
+    
+    def options(self) -> dict:
+        return {
+            'groups': self.groups,
+            'battery_capacity': self.battery_capacity,
+            'poll_interval': self.poll_interval,
+            'priority': self.priority
+        }
+    
+    @property
+    def interval(self) -> float:
+        """Effektiver Poll-Takt in Sekunden"""
+        return self.poll_interval or POLL_INTERVAL
+    
+    def soc_weight(self) -> float:
+        """Gewicht des SOC im Aggregat: Batteriekapazität in kWh"""
+        return self.battery_capacity or self.detected_capacity or DEFAULT_BATTERY_CAPACITY
+    
+    def _notify(self):
+        if self.listener is not None:
+            self.listener(self)
+    
+    def _detect_capacity(self, raw: bytes):
+        """Summiert Capacity_Maximum (Wh) aller Speicher aus GetStorageRealtimeData"""
+        try:
+            capacity = sum(STORAGE_SPEC.extract(raw)['capacity']) / 1000
+        except (ValueError, FroniusAPIError):
+            return
+        if capacity > 0 and capacity != self.detected_capacity:
+            self.detected_capacity = capacity
+            self._notify()
+    
+    def to_dict(self) -> dict:
+        return {
+            'id': self.id,
+            'kind': self.kind,
+            'ip': self.ip,
+            'name': self.name,
+            'groups': self.groups,
+            'battery_capacity_kwh': self.battery_capacity or self.detected_capacity,
+            'poll_interval': self.interval,
+            'priority': self.priority,
+            'is_reachable': self.is_reachable,
+            'last_check': self.last_check.isoformat() if self.last_check else None,
+            'error_count': self.error_count,
+            'last_latency_ms': self.last_latency_ms,
+            'http': self.http_summary(),
+            'breaker': self.breaker_info(),
+            'endpoints': self.endpoint_info(),
+            'has_data': self.last_data is not None
+        }
+    
+    def endpoint_info(self) -> dict:
+        """Intervall und Alter der zwischengespeicherten Endpunkt-Daten"""
+        now = time.monotonic()
+        info = {}
+        for endpoint, interval in self.endpoints.items():
+            cached = self.endpoint_cache.get(endpoint)
+            info[endpoint] = {
+                'interval_s': interval,
+                'age_s': round(now - cached.fetched_at, 1) if cached else None
+            }
+        return info
+    
+    def get_endpoint_data(self, endpoint: str, max_age: float = None) -> Optional[EndpointData]:
+        """Zwischengespeicherte Antwort eines Endpunkts, falls jünger als max_age"""
+        if endpoint == POWER_FLOW_ENDPOINT:
+            if self.last_data is None or self.last_raw is None:
+                return None
+            reading = self.last_data
+            cached = EndpointData(self.last_raw, reading.response_time_ms,
+                                  reading.timestamp, reading.fetched_at)
+        else:
+            cached = self.endpoint_cache.get(endpoint)
+        if cached is None:
+            return None
+        if max_age is None:
+            max_age = self.endpoints.get(endpoint, POLL_INTERVAL) * 2
+        if time.monotonic() - cached.fetched_at > max_age:
+            return None
+        return cached
+    
+    def fetch_endpoint(self, endpoint: str, timeout: float = REQUEST_TIMEOUT) -> Optional[EndpointData]:
+        """Fragt einen beliebigen Solar-API-Endpunkt ab und speichert die Rohdaten"""
+        url = f"http://{self.ip}/solar_api/v1/{endpoint}"
+        start = time.time()
+        _connect_timing.ms = None
+        
+        try:
+            try:
+                response = self._get_session().get(url, timeout=timeout)
+            finally:
+                self._record_connection()
+            if response.status_code != 200:
+                raise FroniusHTTPError(response.status_code)
+            if not response.content.lstrip()[:1] == b'{':
+                raise Exception("Keine JSON-Antwort")
+            
+            cached = EndpointData(response.content, round((time.time() - start) * 1000, 2))
+            self.endpoint_cache[endpoint] = cached
+            if self.transient:
+                self._record_latency(cached.response_time_ms)
+            if endpoint.startswith('GetStorageRealtimeData'):
+                self._detect_capacity(cached.raw)
+            return cached
+        except Exception as e:
+            logger.warning(f"[FEHLER] {self.name} ({self.ip}) {endpoint}: {e}")
+            self._record_error(e)
+            return None
+    
+    def probe(self, connect_timeout: float = DISCOVERY_CONNECT_TIMEOUT,
+              read_timeout: float = DISCOVERY_READ_TIMEOUT) -> Optional[dict]:
+        """Prüft per GetAPIVersion.cgi, ob unter der IP eine Fronius Solar API läuft"""
+        url = f"http://{self.ip}/solar_api/GetAPIVersion.cgi"
+        try:
+            response = self._get_session().get(url, timeout=(connect_timeout, read_timeout))
+            if response.status_code != 200:
+                return None
+            info = response.json()
+            if not isinstance(info, dict) or 'APIVersion' not in info:
+                return None
+            return {
+                'ip': self.ip,
+                'api_version': info.get('APIVersion'),
+                'base_url': info.get('BaseURL'),
+                'compatibility_range': info.get('CompatibilityRange')
+            }
+        except (requests.RequestException, ValueError):
+            return None
+    
+    def poll(self, timeout: float = REQUEST_TIMEOUT) -> Optional[DeviceReading]:
+        """
+        Ein Poll-Durchlauf: Power-Flow immer, weitere Endpunkte nur wenn fällig.
+        
+        Ist das Gerät nicht erreichbar, werden die weiteren Endpunkte
+        übersprungen.
+        """
+        reading = self.fetch_data(timeout)
+        if reading is None:
+            return None
+        
+        now = time.monotonic()
+        for endpoint, interval in self.endpoints.items():
+            cached = self.endpoint_cache.get(endpoint)
+            if cached is None or now - cached.fetched_at >= interval:
+                self.fetch_endpoint(endpoint, timeout)
+        return reading
+    
+    def fetch_data(self, timeout: float = REQUEST_TIMEOUT, force: bool = False) -> Optional[DeviceReading]:
+        """
+        Holt Daten vom Fronius.
+        
+        Bei offenem Circuit-Breaker wird sofort None geliefert, ohne das
+        Gerät anzufragen. Mit force=True wird der Breaker umgangen.
+        """
+        if not force and not self._breaker_acquire():
+            return None
+        
+        url = f"http://{self.ip}/solar_api/v1/{POWER_FLOW_ENDPOINT}"
+        start = time.time()
+        _connect_timing.ms = None
+        
+        try:
+            try:
+                response = self._get_session().get(url, timeout=timeout)
+            finally:
+                connect_ms = self._record_connection()
+            response_time = round((time.time() - start) * 1000, 2)
+            
+            if response.status_code != 200:
+                raise FroniusHTTPError(response.status_code)
+            
+            # Nur die benötigten Felder aus den Rohdaten lesen
+            values = POWER_FLOW_SPEC.extract(response.content)
+            
+            # Werte in kW
+            pv_power = abs(values['pv_power'] or 0) / 1000
+            grid_power = (values['grid_power'] or 0) / 1000  # negativ = Export
+            load_power = abs(values['load_power'] or 0) / 1000
+            akku_power = (values['akku_power'] or 0) / 1000
+            
+            # Batterie SOC des ersten Wechselrichters mit Wert - 0 % ist gültig
+            akku_soc = values['akku_soc'][0] if values['akku_soc'] else None
+            
+            self.last_data = DeviceReading(
+                pv_power, grid_power, load_power, akku_power, akku_soc,
+                response_time, connect_ms, datetime.now().isoformat()
+            )
+            # Bytes unverändert aufheben - werden bei Bedarf direkt ausgeliefert
+            self.last_raw = response.content if self.keep_raw else None
+            self._mark_success(response_time)
+            return self.last_data
+            
+        except Exception as e:
+            self._mark_failure(start, e)
+            return None
+    
+    def _mark_success(self, response_time: float):
+        """Status, Breaker, Aggregation und Metriken nach einer erfolgreichen Abfrage"""
+        self.is_reachable = True
+        self.last_check = datetime.now()
+        self.error_count = 0
+        self.last_latency_ms = response_time
+        self._breaker_success()
+        self._notify()
+        self._record_latency(response_time)
+        
+        reading = self.last_data
+        logger.info(f"[OK] {self.name} ({self.ip}): PV={reading.pv_power:.1f}kW, Grid={reading.grid_power:.1f}kW")
+    
+    def _mark_failure(self, start: float, error: Exception):
+        self.is_reachable = False
+        self.last_check = datetime.now()
+        self.error_count += 1
+        self.last_latency_ms = round((time.time() - start) * 1000, 2)
+        logger.warning(f"[FEHLER] {self.name} ({self.ip}): {error}")
+        self._record_error(error)
+        self._breaker_failure()
+    
+    def _record_latency(self, response_time: float):
+        if self.transient:
+            metrics.observe_upstream(self.ip, response_time / 1000)
+        else:
+            metrics.observe_device(self.id, response_time / 1000)
+    
+    def _record_error(self, error: Exception):
+        if self.transient:
+            metrics.upstream_error(self.ip, classify_error(error))
+        else:
+            metrics.device_error(self.id, classify_error(error))
+
+
+# Felder, die von einem Upstream-Proxy gelesen werden (?fields= von /data)
+SITE_FIELDS = ('success,solarPower,gridPower,housePower,batteryPower,batterySOC,batteryCapacity,'
+               'deviceCount,reachableCount,freshness,timestamp,restored')
+_SITE_URL_PATTERN = re.compile(r'^https?://[A-Za-z0-9.-]+(:\d{1,5})?/?$')
+
+
+def is_valid_site_url(url: str) -> bool:
+    return isinstance(url, str) and bool(_SITE_URL_PATTERN.match(url))
+
+
+class UpstreamSite(FroniusDevice):
+    """
+    Ein anderer Proxy (z.B. ein Pi pro Gebäude) als Datenquelle.
+    
+    Wird wie ein Gerät gepollt, aggregiert und gealtert, liest aber nur die
+    Gesamtwerte von <url>/data. Über If-None-Match kostet ein unveränderter
+    Stand nur eine 304-Antwort ohne Body. Die URL steht in `ip`, damit
+    Registry und Index unverändert funktionieren.
+    """
+    
+    kind = 'site'
+    
+    def __init__(self, site_id: str, url: str, name: str = None, options: dict = None):
+        super().__init__(site_id, url.rstrip('/'), name or f"Standort {site_id}", endpoints={},
+                         options=options)
+        self.keep_raw = False
+        self.etag = None
+        self.site_info = None  # Geräte- und Frische-Angaben des Standorts
+        self.site_stats = {'full': 0, 'not_modified': 0}
+    
+    @property
+    def url(self) -> str:
+        return self.ip
+    
+    def change_ip(self, ip: str):
+        super().change_ip(ip.rstrip('/'))
+        self.etag = None
+    
+    def to_dict(self) -> dict:
+        info = super().to_dict()
+        info['url'] = self.url
+        info['site'] = self.site_info
+        info['responses'] = dict(self.site_stats)
+        return info
+    
+    def fetch_data(self, timeout: float = REQUEST_TIMEOUT, force: bool = False) -> Optional[DeviceReading]:
+        """Holt die Gesamtwerte des Standorts (304 = Stand unverändert)"""
+        if not force and not self._breaker_acquire():
+            return None
+        
+        start = time.time()
+        _connect_timing.ms = None
+        previous = self.last_data
+        headers = {'If-None-Match': self.etag} if self.etag and previous is not None else {}
+        
+        try:
+            try:
+                response = self._get_session().get(f"{self.url}/data", params={'fields': SITE_FIELDS},
+                                                   headers=headers, timeout=timeout)
+            finally:
+                connect_ms = self._record_connection()
+            response_time = round((time.time() - start) * 1000, 2)
+            
+            if response.status_code == 304 and previous is not None:
+                # Standort bestätigt den bekannten Stand - nur das Alter erneuern
+                self.last_data = DeviceReading(
+                    previous.pv_power, previous.grid_power, previous.load_power,
+                    previous.akku_power, previous.akku_soc, response_time, connect_ms,
+                    previous.timestamp
+                )
+                self.site_stats['not_modified'] += 1
+            elif response.status_code != 200:
+                raise FroniusHTTPError(response.status_code)
+            else:
+                data = response.json()
+                if not data.get('success'):
+                    raise ValueError('Keine Proxy-Antwort')
+                capacity = data.get('batteryCapacity')
+                if capacity is None:
+                    # Älterer Proxy ohne Kapazitätsangabe
+                    soc = data['batterySOC'] or None
+                else:
+                    soc = data['batterySOC'] if capacity > 0 else None
+                self.detected_capacity = capacity or None
+                self.last_data = DeviceReading(
+                    data['solarPower'], data['gridPower'], data['housePower'],
+                    data['batteryPower'], soc, response_time, connect_ms, data['timestamp']
+                )
+                self.site_info = {
+                    'device_count': data.get('deviceCount'),
+                    'reachable_count': data.get('reachableCount'),
+                    'freshness': data.get('freshness'),
+                    'restored': bool(data.get('restored'))
+                }
+                self.etag = response.headers.get('ETag')
+                self.site_stats['full'] += 1
+            self._mark_success(response_time)
+            return self.last_data
+            
+        except Exception as e:
+            self._mark_failure(start, e)
+            return None
+
+
+class PowerAggregator:
+    """
+    Laufende Summen der Leistungswerte je Aggregat-Gruppe.
+    
+    Jedes Gerät trägt zu 'all' und zu seinen eigenen Gruppen bei. Bei einem
+    neuen Messwert wird nur der alte Beitrag des Geräts abgezogen und der
+    neue addiert - das Lesen einer Gruppe kostet O(1), unabhängig von der
+    Anzahl der Geräte. Der SOC wird mit der Batteriekapazität gewichtet.
+    
+    Das Altern der Messwerte (siehe staleness) ist zeitgesteuert: ein Heap
+    hält fest, wann sich der Beitrag eines Geräts ohne neuen Messwert
+    ändert. refresh() arbeitet nur die fälligen Einträge ab.
+    """
+    
+    ALL = 'all'
+    # Indizes in den Summen-Listen
+    _FIELDS = ('pv_power', 'grid_power', 'load_power', 'akku_power')
+    _SOC, _WEIGHT, _REACHABLE, _COUNT, _FRESH, _STALE, _EXPIRED = 4, 5, 6, 7, 8, 9, 10
+    _SIZE = 11
+    
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._members: Dict[str, 'FroniusDevice'] = {}
+        self._contrib: Dict[str, tuple] = {}  # device_id -> (Gruppen, Werte, fetched_at)
+        self._totals: Dict[str, List[float]] = {}
+        self._due: List[tuple] = []  # Heap: (fällig, device_id, fetched_at)
+        self._updates = 0
+    
+    @staticmethod
+    def _contribution(device: 'FroniusDevice', now: float) -> tuple:
+        """Beitrag eines Geräts und Zeitpunkt der nächsten Änderung durch Altern"""
+        reading = device.last_data
+        if reading is None:
+            return (0.0,) * 6 + (0, 1, 0, 0, 0), None
+        age = now - reading.fetched_at
+        state, factor, counted = staleness(age, device.interval)
+        stale_after, max_age = stale_limits(device.interval)
+        if state == 'fresh':
+            next_change = reading.fetched_at + stale_after
+        elif state == 'stale':
+            next_change = reading.fetched_at + max_age
+            if STALE_POLICY == 'interpolate':
+                next_change = min(next_change, now + POLL_INTERVAL)
+        else:
+            next_change = None
+        flags = (int(state == 'fresh'), int(state == 'stale'), int(state == 'expired'))
+        if not counted:
+            return (0.0,) * 6 + (0, 1) + flags, next_change
+        if reading.akku_soc is None:
+            soc, weight = 0.0, 0.0
+        else:
+            weight = device.soc_weight()
+            soc = reading.akku_soc * weight
+        return (reading.pv_power * factor, reading.grid_power * factor,
+                reading.load_power * factor, reading.akku_power * factor,
+                soc, weight, 1, 1) + flags, next_change
+    
+    def _apply(self, entry: tuple, sign: int):
+        groups, values, _ = entry
+        for group in groups:
+            totals = self._totals.get(group)
+            if totals is None:
+                totals = self._totals[group] = [0.0] * self._SIZE
+            for i, value in enumerate(values):
+                totals[i] += sign * value
+            if totals[self._COUNT] <= 0:
+                del self._totals[group]
+    
+    def _set(self, device: 'FroniusDevice', now: float):
+        old = self._contrib.pop(device.id, None)
+        if old is not None:
+            self._apply(old, -1)
+        values, next_change = self._contribution(device, now)
+        fetched_at = device.last_data.fetched_at if device.last_data else None
+        entry = ((self.ALL,) + tuple(device.groups), values, fetched_at)
+        self._contrib[device.id] = entry
+        self._apply(entry, 1)
+        if next_change is not None:
+            heapq.heappush(self._due, (next_change, device.id, fetched_at))
+    
+    def _resum(self):
+        """Bildet alle Summen neu (gegen aufsummierte Rundungsfehler)"""
+        self._totals = {}
+        for entry in self._contrib.values():
+            self._apply(entry, 1)
+        self._updates = 0
+    
+    def update(self, device: 'FroniusDevice'):
+        """Übernimmt den aktuellen Messwert eines Geräts (ignoriert entfernte Geräte)"""
+        with self._lock:
+            if self._members.get(device.id) is not device:
+                return
+            self._set(device, time.monotonic())
+            self._updates += 1
+            if self._updates >= AGGREGATE_RESUM_EVERY:
+                self._resum()
+    
+    def sync(self, devices: Dict[str, 'FroniusDevice']):
+        """Gleicht die Mitglieder nach einer Änderung der Geräteliste ab"""
+        now = time.monotonic()
+        with self._lock:
+            for device_id in list(self._contrib):
+                if self._members.get(device_id) is not devices.get(device_id):
+                    self._apply(self._contrib.pop(device_id), -1)
+            self._members = dict(devices)
+            for device in devices.values():
+                # Gruppen oder Kapazität könnten sich geändert haben
+                self._set(device, now)
+            # Einträge entfernter Geräte und überholte Zeitpunkte verwerfen
+            self._due = [item for item in self._due
+                         if item[1] in self._contrib and self._contrib[item[1]][2] == item[2]]
+            heapq.heapify(self._due)
+    
+    def refresh(self, now: float = None):
+        """Aktualisiert die Beiträge aller Geräte, deren Messwert inzwischen gealtert ist"""
+        now = now or time.monotonic()
+        with self._lock:
+            while self._due and self._due[0][0] <= now:
+                _, device_id, fetched_at = heapq.heappop(self._due)
+                entry = self._contrib.get(device_id)
+                if entry is None or entry[2] != fetched_at:
+                    continue  # Gerät entfernt oder inzwischen neuer Messwert
+                self._set(self._members[device_id], now)
+    
+    def groups(self) -> List[str]:
+        with self._lock:
+            return sorted(group for group in self._totals if group != self.ALL)
+    
+    def totals(self, group: str = ALL) -> Optional[dict]:
+        """Summen einer Gruppe (None wenn die Gruppe kein Gerät hat)"""
+        with self._lock:
+            totals = self._totals.get(group)
+            totals = list(totals) if totals is not None else None
+        if totals is None:
+            if group != self.ALL:
+                return None
+            totals = [0.0] * self._SIZE
+        result = {key: round(totals[i], 2) for i, key in enumerate(self._FIELDS)}
+        weight = totals[self._WEIGHT]
+        result['akku_soc'] = round(totals[self._SOC] / weight, 2) if weight > 0 else 0.0
+        result['battery_capacity'] = round(weight, 2)
+        result['device_count'] = int(round(totals[self._COUNT]))
+        result['reachable_count'] = int(round(totals[self._REACHABLE]))
+        result['fresh_count'] = int(round(totals[self._FRESH]))
+        result['stale_count'] = int(round(totals[self._STALE]))
+        result['expired_count'] = int(round(totals[self._EXPIRED]))
+        return result
+
+
+class DataSnapshot:
+    """
+    Unveränderlicher Stand der akkumulierten Daten nach einem Poll-Zyklus.
+    
+    Die JSON-Antwort für /data wird einmal beim Erstellen kodiert und
+    danach unverändert an alle Clients ausgeliefert. Antworten für
+    Aggregat-Gruppen werden beim ersten Abruf kodiert.
+    """
+    
+    __slots__ = ('version', 'data', 'body', 'etag', 'sse_frame', 'created',
+                 'groups', 'deltas', 'content_key', 'content_version', '_variants')
+    
+    # Ändern sich bei jedem Snapshot, ohne dass sich die Werte ändern
+    VOLATILE_KEYS = ('devices', 'timestamp', 'oldest_age_s')
+    
+    def __init__(self, version: int, data: dict, groups: Dict[str, dict] = None,
+                 previous: 'DataSnapshot' = None):
+        self.version = version
+        self.data = data
+        self.body = json.dumps(format_data_response(data), separators=(',', ':')).encode('utf-8')
+        self.etag = f'{BOOT_ID}-{version}'
+        # Fertiges Server-Sent-Event (kompaktes JSON enthält keine Zeilenumbrüche)
+        self.sse_frame = b'id: %d\nevent: data\ndata: %s\n\n' % (version, self.body)
+        self.created = time.monotonic()
+        self.groups = groups or {}
+        # Gruppe -> ((Version, Änderungen bis Version + 1), ...) (vom DeltaTracker)
+        self.deltas: Dict[Optional[str], tuple] = {}
+        # Erste Version mit denselben Summen (ohne Zeitstempel und Alter) -
+        # Basis des ETags für Projektionen ohne Geräteliste
+        self.content_key = tuple(
+            (name, tuple((key, value) for key, value in sorted(item.items())
+                         if key not in self.VOLATILE_KEYS and not isinstance(value, (dict, list))))
+            for name, item in [(None, data)] + sorted(self.groups.items())
+        )
+        if previous is not None and previous.content_key == self.content_key:
+            self.content_version = previous.content_version
+        else:
+            self.content_version = version
+        # (Gruppe, Format, fields, Kompression) -> Bytes
+        self._variants: Dict[tuple, bytes] = {}
+    
+    def variant(self, group: str = None, fmt: str = 'json', fields: tuple = None,
+                encoding: str = None) -> Optional[bytes]:
+        """
+        Kodierte Antwort für /data bzw. eine Gruppe (None wenn unbekannt).
+        
+        Jede Variante wird pro Snapshot nur einmal kodiert und komprimiert;
+        alle weiteren Anfragen bekommen dieselben Bytes.
+        """
+        key = (group, fmt, fields, encoding)
+        body = self._variants.get(key)
+        if body is not None:
+            return body
+        if encoding:
+            body = self.variant(group, fmt, fields)
+            if body is None:
+                return None
+            body = compress_body(body, encoding)
+        elif group is None and fmt == 'json' and not fields:
+            return self.body
+        else:
+            data = self.data if group is None else self.groups.get(group)
+            if data is None:
+                return None
+            body = encode_payload(format_data_response(data), fmt, fields, self.version)
+        if len(self._variants) < SNAPSHOT_VARIANTS_MAX:
+            self._variants[key] = body
+        return body
+    
+    def delta_variant(self, group: str, since: int, fmt: str = 'json',
+                      encoding: str = None) -> Optional[bytes]:
+        """
+        Kodiertes Delta seit Version `since` (None wenn nicht vorgehalten).
+        
+        Die Änderungen je Version liegen schon fertig vor (DeltaTracker);
+        hier werden sie beim ersten Abruf einer Basis zusammengefasst und
+        wie bei variant() nur einmal pro Snapshot kodiert.
+        """
+        key = ('delta', group, since, fmt, encoding)
+        body = self._variants.get(key)
+        if body is not None:
+            return body
+        if encoding:
+            body = self.delta_variant(group, since, fmt)
+            if body is None:
+                return None
+            body = compress_body(body, encoding)
+        else:
+            if since == self.version and (group is None or group in self.groups):
+                changes = {}  # Client ist aktuell
+            else:
+                changes = DeltaTracker.merge(self.deltas.get(group, ()), since)
+            if changes is None:
+                return None
+            payload = {
+                'success': True,
+                'delta': True,
+                'version': self.etag,
+                'since': f'{BOOT_ID}-{since}',
+                'changed': {path: value for path, value in changes.items() if value is not _REMOVED},
+                'removed': [path for path, value in changes.items() if value is _REMOVED]
+            }
+            body = encode_payload(payload, fmt)
+        if len(self._variants) < SNAPSHOT_VARIANTS_MAX:
+            self._variants[key] = body
+        return body
+
+
+# Markiert entfernte Pfade in den Änderungen eines Deltas
+_REMOVED = object()
+
+
+def _pointer_token(key) -> str:
+    return str(key).replace('~', '~0').replace('/', '~1')
+
+
+def flatten_response(payload: dict) -> dict:
+    """
+    Zerlegt eine /data-Antwort in JSON-Pointer -> Blattwert.
+    
+    Listen von Objekten mit 'id' (die Geräte) werden nach ID statt nach
+    Index adressiert, z.B. /devices/fronius_1/data/pv_power - so bleibt
+    ein Pfad gültig, wenn Geräte hinzukommen oder wegfallen. Andere Listen
+    und leere Objekte sind Blattwerte.
+    """
+    flat = {}
+    
+    def walk(value, path):
+        if isinstance(value, dict) and value:
+            for key, item in value.items():
+                walk(item, f'{path}/{_pointer_token(key)}')
+        elif (isinstance(value, list) and value
+              and all(isinstance(item, dict) and 'id' in item for item in value)):
+            for item in value:
+                walk(item, f"{path}/{_pointer_token(item['id'])}")
+        else:
+            flat[path] = value
+    
+    walk(payload, '')
+    return flat
+
+
+def _exceeds_deadband(old, new, band: Optional[float]) -> bool:
+    if (band and isinstance(old, (int, float)) and isinstance(new, (int, float))
+            and not isinstance(old, bool) and not isinstance(new, bool)):
+        return abs(new - old) >= band
+    return old != new
+
+
+class DeltaTracker:
+    """
+    Berechnet die Änderungen zwischen Snapshots - einmal pro Snapshot im Poller.
+    
+    Je Stream (gesamt bzw. Gruppe) wird der Stand gehalten, den ein Client
+    nach Anwenden aller Deltas hat. Ein Wert gilt erst als geändert, wenn er
+    um mindestens seine Totzone (DELTA_DEADBANDS) von diesem Stand abweicht;
+    Delta-Clients liegen also höchstens eine Totzone neben dem vollen
+    Snapshot. Pro Version werden nur die Änderungen zur Vorgängerversion
+    abgelegt (die letzten DELTA_HISTORY); zusammengefasst wird erst beim
+    ersten Abruf einer Basis (merge) und dann pro Snapshot gecacht.
+    
+    Ein Stream (auch /data selbst) wird erst verfolgt, nachdem ein Client
+    ein Delta für ihn angefragt hat (watch) - ohne Delta-Clients kostet das
+    Veröffentlichen also nichts, und bis dahin gibt es den vollen Stand.
+    """
+    
+    def __init__(self):
+        # Stream -> (Client-Stand, deque((Version, Änderungen)), Version)
+        self._streams: Dict[Optional[str], tuple] = {}
+        self._watched = set()
+    
+    def watch(self, group: Optional[str]):
+        self._watched.add(group)
+    
+    def update(self, snapshot: DataSnapshot):
+        """Füllt snapshot.deltas (nur aus dem Poller unter _snapshot_lock aufrufen)"""
+        streams = {}
+        for group in list(self._watched):
+            data = snapshot.data if group is None else snapshot.groups.get(group)
+            if data is not None:
+                streams[group] = data
+        for stream in list(self._streams):
+            if stream not in streams:
+                del self._streams[stream]
+        for stream, data in streams.items():
+            flat = flatten_response(format_data_response(data))
+            state, chain, version = self._streams.get(stream, (None, None, None))
+            if state is None or version != snapshot.version - 1:
+                # Erster Stand (oder Lücke in den Versionen): kein Delta möglich
+                self._streams[stream] = (flat, deque(maxlen=DELTA_HISTORY), snapshot.version)
+                continue
+            chain.append((version, self._diff(state, flat)))
+            self._streams[stream] = (state, chain, snapshot.version)
+            snapshot.deltas[stream] = tuple(chain)
+    
+    @staticmethod
+    def merge(chain: tuple, since: int) -> Optional[dict]:
+        """Fasst die Änderungen ab Version `since` zusammen (None = nicht mehr vorgehalten)"""
+        if not chain or not chain[0][0] <= since <= chain[-1][0]:
+            return None
+        merged = {}
+        for version, changes in chain[since - chain[0][0]:]:
+            prefixes = tuple(path + '/' for path, value in changes.items() if value is _REMOVED)
+            if prefixes:
+                # Werte unter entfernten Präfixen entfallen
+                merged = {path: value for path, value in merged.items() if not path.startswith(prefixes)}
+            merged.update(changes)
+        return merged
+    
+    @staticmethod
+    def _diff(state: dict, flat: dict) -> dict:
+        """Änderungen gegenüber dem Client-Stand; aktualisiert den Stand"""
+        changes = {}
+        for path, value in flat.items():
+            if path not in state or _exceeds_deadband(state[path], value,
+                                                      DELTA_DEADBANDS.get(path.rpartition('/')[2])):
+                changes[path] = value
+        removed = [path for path in state if path not in flat]
+        state.update(changes)
+        for path in removed:
+            del state[path]
+        if removed:
+            # Ganz entfernte Teilbäume (z.B. ein Gerät) nur mit ihrem Präfix melden
+            containers = {path[:i] for path in state for i, c in enumerate(path) if c == '/' and i}
+            for path in removed:
+                parts = path.split('/')
+                for depth in range(2, len(parts) + 1):
+                    prefix = '/'.join(parts[:depth])
+                    if prefix not in containers and prefix not in state:
+                        changes[prefix] = _REMOVED
+                        break
+        return changes
+
+
+class SnapshotBroadcaster:
+    """
+    Verteilt neue Snapshots an alle Stream-Abonnenten.
+    
+    Es gibt keine Warteschlange pro Client: jeder Abonnent wartet nur auf
+    eine neuere Version als die zuletzt gesendete und bekommt dann immer
+    den aktuellsten Snapshot. Langsame Clients überspringen dadurch
+    Zwischenstände, statt Puffer anwachsen zu lassen.
+    """
+    
+    def __init__(self):
+        self._cond = threading.Condition()
+        self._snapshot: Optional[DataSnapshot] = None
+        self.subscribers = 0
+        self.listeners: List = []  # Rückrufe ohne Thread, z.B. StreamServer.notify
+    
+    @property
+    def latest(self) -> Optional[DataSnapshot]:
+        return self._snapshot
+    
+    def publish(self, snapshot: DataSnapshot):
+        with self._cond:
+            self._snapshot = snapshot
+            self._cond.notify_all()
+        for listener in self.listeners:
+            listener()
+    
+    def subscribe(self) -> bool:
+        """Meldet einen Abonnenten an; False wenn das Limit erreicht ist"""
+        with self._cond:
+            if self.subscribers >= SSE_MAX_CLIENTS:
+                return False
+            self.subscribers += 1
+            return True
+    
+    def unsubscribe(self):
+        with self._cond:
+            self.subscribers -= 1
+    
+    def wait_newer(self, version: int, timeout: float) -> Optional[DataSnapshot]:
+        """Wartet auf einen Snapshot mit höherer Version (None bei Timeout)"""
+        with self._cond:
+            if self._cond.wait_for(
+                lambda: self._snapshot is not None and self._snapshot.version > version,
+                timeout=timeout
+            ):
+                return self._snapshot
+            return None
+
+
+class _StreamClient:
+    """Zustand einer Verbindung des StreamServer"""
+    
+    __slots__ = ('sock', 'request', 'opened', 'streaming', 'version', 'out', 'pending', 'close_after')
+    
+    def __init__(self, sock: socket.socket):
+        self.sock = sock
+        self.request = b''
+        self.opened = time.monotonic()
+        self.streaming = False
+        self.version = 0
+        self.out: Optional[memoryview] = None  # wird gerade gesendet
+        self.pending: Optional[bytes] = None  # nächstes Event (nur das neueste)
+        self.close_after = False
+
+
+class StreamServer:
+    """
+    Server-Sent Events für alle Abonnenten in einer Event-Loop.
+    
+    Ein einziger Thread bedient über selectors alle Verbindungen auf
+    SSE_PORT - offene Streams belegen weder WSGI-Worker noch eigene
+    Threads. Neue Snapshots meldet der SnapshotBroadcaster über einen
+    Socket-Paar-Weckruf. Pro Client ist höchstens ein Event in Arbeit und
+    eines wartend; ein neuerer Snapshot ersetzt das wartende, langsame
+    Clients bekommen also zusammengefasste Stände statt wachsender Puffer.
+    """
+    
+    _HEADERS = (b'HTTP/1.1 200 OK\r\n'
+                b'Content-Type: text/event-stream\r\n'
+                b'Cache-Control: no-cache\r\n'
+                b'X-Accel-Buffering: no\r\n'
+                b'Access-Control-Allow-Origin: *\r\n\r\n')
+    
+    def __init__(self, broadcaster: SnapshotBroadcaster, host: str = '0.0.0.0', port: int = SSE_PORT):
+        self.broadcaster = broadcaster
+        self.host = host
+        self.port = port
+        self.running = False
+        self._selector = selectors.DefaultSelector()
+        self._listener: Optional[socket.socket] = None
+        self._wake_r, self._wake_w = socket.socketpair()
+        self._wake_r.setblocking(False)
+        self._wake_w.setblocking(False)
+        self._clients: Dict[socket.socket, _StreamClient] = {}
+        self._thread: Optional[threading.Thread] = None
+    
+    def start(self):
+        listener = socket.create_server((self.host, self.port), backlog=SERVER_BACKLOG)
+        listener.setblocking(False)
+        self.port = listener.getsockname()[1]
+        self._listener = listener
+        self._selector.register(listener, selectors.EVENT_READ, 'accept')
+        self._selector.register(self._wake_r, selectors.EVENT_READ, 'wake')
+        self.broadcaster.listeners.append(self.notify)
+        self.running = True
+        self._thread = threading.Thread(target=self._loop, name='sse', daemon=True)
+        self._thread.start()
+        logger.info(f"[SSE] /stream auf Port {self.port} (max. {SSE_MAX_CLIENTS} Clients)")
+    
+    def stop(self):
+        self.running = False
+        self.notify()
+    
+    def notify(self):
+        """Weckt die Event-Loop (aus beliebigem Thread, blockiert nie)"""
+        try:
+            self._wake_w.send(b'\0')
+        except (BlockingIOError, OSError):
+            pass  # Weckruf steht schon an
+    
+    def _loop(self):
+        next_keepalive = time.monotonic() + SSE_KEEPALIVE
+        while self.running:
+            for key, mask in self._selector.select(timeout=1.0):
+                try:
+                    if key.data == 'accept':
+                        self._accept()
+                    elif key.data == 'wake':
+                        self._drain_wake()
+                        self._broadcast()
+                    elif mask & selectors.EVENT_READ and not key.data.streaming:
+                        self._read_request(key.data)
+                    elif mask & selectors.EVENT_READ:
+                        # Streams senden nichts mehr - Lesen heißt: Verbindung zu
+                        if not key.data.sock.recv(4096):
+                            self._close(key.data)
+                    if mask & selectors.EVENT_WRITE and key.data not in ('accept', 'wake'):
+                        self._flush(key.data)
+                except OSError:
+                    if key.data not in ('accept', 'wake'):
+                        self._close(key.data)
+            now = time.monotonic()
+            for client in list(self._clients.values()):
+                if not client.streaming and now - client.opened > SSE_HEADER_TIMEOUT:
+                    self._close(client)
+            if now >= next_keepalive:
+                next_keepalive = now + SSE_KEEPALIVE
+                for client in list(self._clients.values()):
+                    if client.streaming and client.out is None:
+                        self._send(client, b': keepalive\n\n')
+        for client in list(self._clients.values()):
+            self._close(client)
+        self._selector.unregister(self._listener)
+        self._listener.close()
+    
+    def _accept(self):
+        while True:
+            try:
+                sock, _ = self._listener.accept()
+            except (BlockingIOError, InterruptedError):
+                return
+            sock.setblocking(False)
+            client = _StreamClient(sock)
+            self._clients[sock] = client
+            self._selector.register(sock, selectors.EVENT_READ, client)
+    
+    def _drain_wake(self):
+        try:
+            while self._wake_r.recv(4096):
+                pass
+        except (BlockingIOError, InterruptedError):
+            pass
+    
+    def _read_request(self, client: _StreamClient):
+        data = client.sock.recv(8192)
+        if not data:
+            self._close(client)
+            return
+        if client.close_after:
+            return  # Antwort läuft schon, Rest der Anfrage ignorieren
+        client.request += data
+        if b'\r\n\r\n' not in client.request:
+            if len(client.request) > 8192:
+                self._reply(client, 431, 'Request Header Fields Too Large')
+            return
+        
+        head = client.request.split(b'\r\n\r\n', 1)[0].decode('latin-1').split('\r\n')
+        parts = head[0].split(' ')
+        headers = {}
+        for line in head[1:]:
+            name, _, value = line.partition(':')
+            headers[name.strip().lower()] = value.strip()
+        if len(parts) != 3:
+            self._reply(client, 400, 'Bad Request')
+            return
+        method, target = parts[0], parts[1].split('?', 1)[0]
+        if target != '/stream':
+            self._reply(client, 404, 'Not Found')
+        elif method == 'OPTIONS':
+            self._reply(client, 204, 'No Content',
+                        b'Access-Control-Allow-Methods: GET, OPTIONS\r\n'
+                        b'Access-Control-Allow-Headers: Last-Event-ID, Cache-Control\r\n')
+        elif method not in ('GET', 'HEAD'):
+            self._reply(client, 405, 'Method Not Allowed')
+        elif method == 'HEAD':
+            self._send(client, self._HEADERS)
+            client.close_after = True
+        elif not self.broadcaster.subscribe():
+            self._reply(client, 503, 'Too many stream clients')
+        else:
+            client.streaming = True
+            latest = self.broadcaster.latest
+            try:
+                client.version = int(headers.get('last-event-id', 0))
+            except ValueError:
+                client.version = 0
+            if latest is None or client.version > latest.version:
+                client.version = 0  # ID stammt aus einem früheren Prozessstart
+            self._send(client, self._HEADERS + b'retry: 5000\n\n')
+            if latest is not None and latest.version > client.version:
+                client.version = latest.version
+                self._send(client, latest.sse_frame)
+    
+    def _reply(self, client: _StreamClient, status: int, reason: str, extra: bytes = b''):
+        body = json.dumps({'success': False, 'error': reason}).encode('utf-8') if status >= 400 else b''
+        self._send(client, b'HTTP/1.1 %d %s\r\nContent-Type: application/json\r\n'
+                           b'Content-Length: %d\r\nConnection: close\r\n'
+                           b'Access-Control-Allow-Origin: *\r\n%s\r\n%s'
+                   % (status, reason.encode('latin-1'), len(body), extra, body))
+        client.close_after = True
+    
+    def _broadcast(self):
+        snapshot = self.broadcaster.latest
+        if snapshot is None:
+            return
+        for client in list(self._clients.values()):
+            if client.streaming and client.version < snapshot.version:
+                client.version = snapshot.version
+                self._send(client, snapshot.sse_frame)
+    
+    def _send(self, client: _StreamClient, data: bytes):
+        """Stellt data hinter das laufende Event; ein wartendes wird ersetzt"""
+        if client.out is None:
+            client.out = memoryview(data)
+            self._flush(client)
+        else:
+            client.pending = data
+    
+    def _flush(self, client: _StreamClient):
+        while client.out is not None:
+            try:
+                sent = client.sock.send(client.out)
+            except (BlockingIOError, InterruptedError):
+                break
+            except OSError:
+                self._close(client)
+                return
+            client.out = client.out[sent:]
+            if not client.out:
+                client.out = memoryview(client.pending) if client.pending is not None else None
+                client.pending = None
+        if client.out is None and client.close_after:
+            self._close(client)
+        elif client.sock in self._clients:
+            events = selectors.EVENT_READ | (selectors.EVENT_WRITE if client.out is not None else 0)
+            self._selector.modify(client.sock, events, client)
+    
+    def _close(self, client: _StreamClient):
+        if self._clients.pop(client.sock, None) is None:
+            return
+        if client.streaming:
+            self.broadcaster.unsubscribe()
+        try:
+            self._selector.unregister(client.sock)
+        except (KeyError, ValueError):
+            pass
+        client.sock.close()
+
+
+def format_data_response(data: dict) -> dict:
+    """Format für XCompanySystemDataService (GET /data)"""
+    response = {
+        'success': True,
+        'solarPower': data['pv_power'],
+        'gridPower': data['grid_power'],
+        'housePower': data['load_power'],
+        'batteryPower': data['akku_power'],
+        'batterySOC': data['akku_soc'],
+        'batteryCapacity': data.get('battery_capacity', 0.0),
+        'deviceCount': data['device_count'],
+        'reachableCount': data['reachable_count'],
+        'freshness': {
+            'fresh': data['fresh_count'],
+            'stale': data['stale_count'],
+            'expired': data['expired_count'],
+            'oldest_age_s': data['oldest_age_s'],
+            'policy': STALE_POLICY,
+            'stale_after_s': STALE_AFTER,
+            'max_age_s': STALE_MAX_AGE
+        },
+        'devices': data['devices'],
+        'timestamp': data['timestamp'],
+        'proxy_info': {
+            'version': '3.0',
+            'server': 'raspberry-pi'
+        }
+    }
+    if 'group' in data:
+        response['group'] = data['group']
+    if data.get('restored'):
+        # Stand vom letzten Lauf, bis der erste Poll-Zyklus fertig ist
+        response['restored'] = True
+    return response
+
+
+# Kompakte Binärdarstellung der Gesamtwerte (format=frame), Little Endian:
+# Magic, Snapshot-Version, Unix-Zeit, PV/Netz/Haus/Batterie in kW, SOC in %,
+# Geräte, erreichbar, veraltet
+FRAME_MAGIC = b'FRP1'
+_FRAME = struct.Struct('<4sIdfffffHHH')
+
+RESPONSE_FORMATS = {
+    'json': 'application/json',
+    'msgpack': 'application/msgpack',
+    'frame': 'application/octet-stream',
+}
+
+
+def project_fields(payload, fields: tuple):
+    """
+    Reduziert eine Antwort auf die angegebenen Felder.
+    
+    Punkte wählen Unterfelder, Listen werden elementweise projiziert:
+    ('solarPower', 'devices.id', 'devices.data') behält nur diese Werte.
+    """
+    if isinstance(payload, list):
+        return [project_fields(item, fields) for item in payload]
+    if not isinstance(payload, dict):
+        return payload
+    nested: Dict[str, list] = {}
+    for field in fields:
+        head, _, rest = field.partition('.')
+        if head in payload:
+            nested.setdefault(head, [])
+            if rest and nested[head] is not None:
+                nested[head].append(rest)
+            else:
+                nested[head] = None  # ganzes Feld
+    return {key: payload[key] if sub is None else project_fields(payload[key], tuple(sub))
+            for key, sub in nested.items()}
+
+
+def pack_frame(response: dict, version: int) -> bytes:
+    """Gesamtwerte einer /data-Antwort als Binär-Frame (_FRAME)"""
+    freshness = response.get('freshness') or {}
+    return _FRAME.pack(
+        FRAME_MAGIC, version,
+        datetime.fromisoformat(response['timestamp']).timestamp(),
+        response['solarPower'], response['gridPower'], response['housePower'],
+        response['batteryPower'], response['batterySOC'],
+        response['deviceCount'], response['reachableCount'],
+        freshness.get('stale', 0) + freshness.get('expired', 0)
+    )
+
+
+def encode_payload(payload: dict, fmt: str = 'json', fields: tuple = None, version: int = 0) -> bytes:
+    """Kodiert eine Antwort als JSON, MessagePack oder Binär-Frame"""
+    if fmt == 'frame':
+        return pack_frame(payload, version)
+    if fields:
+        payload = project_fields(payload, fields)
+    if fmt == 'msgpack':
+        return msgpack.packb(payload, use_bin_type=True)
+    return json.dumps(payload, separators=(',', ':')).encode('utf-8')
+
+
+def compress_body(body: bytes, encoding: str) -> bytes:
+    if encoding == 'br':
+        return brotli.compress(body, quality=BROTLI_QUALITY)
+    return gzip.compress(body, compresslevel=GZIP_LEVEL, mtime=0)
 
-# ═══════════════════════════════════════════════════════════════════════════
-# DATEN-STRUKTUREN
-# ═══════════════════════════════════════════════════════════════════════════
 
-class FroniusDevice:
-    """Repräsentiert einen Fronius-Wechselrichter"""
+class ConfigStore:
+    """
+    Persistenz der Konfigurationsdatei.
     
-    def __init__(self, device_id: str, ip: str, name: str = None):
-        self.id = device_id
-        self.ip = ip
-        self.name = name or f"Fronius {device_id}"
-        self.is_reachable = False
-        self.last_check = None
-        self.last_data = None
-        self.error_count = 0
+    Änderungen werden nicht sofort geschrieben, sondern nach
+    CONFIG_SAVE_DELAY gesammelt in einem Hintergrund-Thread. Geschrieben
+    wird in eine Temp-Datei mit fsync und anschließendem rename, damit
+    bei Stromausfall entweder die alte oder die neue Datei vollständig
+    vorliegt. Jeder Schreibvorgang erhöht die Generation in der Datei.
+    """
     
-    def to_dict(self) -> dict:
-        return {
-            'id': self.id,
-            'ip': self.ip,
-            'name': self.name,
-            'is_reachable': self.is_reachable,
-            'last_check': self.last_check.isoformat() if self.last_check else None,
-            'error_count': self.error_count,
-            'has_data': self.last_data is not None
-        }
+    def __init__(self, path: str, delay: float = CONFIG_SAVE_DELAY):
+        self.path = path
+        self.delay = delay
+        self.generation = 0
+        self._payload_fn = None
+        self._timer: Optional[threading.Timer] = None
+        self._lock = threading.Lock()
+        self._write_lock = threading.Lock()
+        self._stat = None  # (mtime_ns, size) nach dem letzten Lesen/Schreiben
     
-    def fetch_data(self) -> Optional[dict]:
-        """Holt Daten vom Fronius"""
-        url = f"http://{self.ip}/solar_api/v1/GetPowerFlowRealtimeData.fcgi"
-        
+    def _file_stat(self):
         try:
-            start = time.time()
-            response = requests.get(url, timeout=10, headers={
-                'User-Agent': 'Lademeyer-Proxy/3.0',
-                'Accept': 'application/json'
-            })
-            response_time = round((time.time() - start) * 1000, 2)
-            
-            if response.status_code != 200:
-                raise Exception(f"HTTP {response.status_code}")
-            
-            data = response.json()
-            
-            # Fronius-Daten extrahieren
-            site = data.get('Body', {}).get('Data', {}).get('Site', {})
-            inverters = data.get('Body', {}).get('Data', {}).get('Inverters', {})
-            
-            # Werte extrahieren (in kW)
-            pv_power = abs(site.get('P_PV', 0) or 0) / 1000
-            grid_power = (site.get('P_Grid', 0) or 0) / 1000  # negativ = Export
-            load_power = abs(site.get('P_Load', 0) or 0) / 1000
-            akku_power = (site.get('P_Akku', 0) or 0) / 1000
-            
-            # Batterie SOC (falls vorhanden)
-            akku_soc = 0
-            for inv_data in inverters.values():
-                if 'SOC' in inv_data:
-                    akku_soc = inv_data.get('SOC', 0)
-                    break
-            
-            self.last_data = {
-                'pv_power': pv_power,
-                'grid_power': grid_power,
-                'load_power': load_power,
-                'akku_power': akku_power,
-                'akku_soc': akku_soc,
-                'response_time_ms': response_time,
-                'timestamp': datetime.now().isoformat(),
-                'raw': data
-            }
-            
-            self.is_reachable = True
-            self.last_check = datetime.now()
-            self.error_count = 0
-            
-            logger.info(f"[OK] {self.name} ({self.ip}): PV={pv_power:.1f}kW, Grid={grid_power:.1f}kW")
-            return self.last_data
-            
+            st = os.stat(self.path)
+            return st.st_mtime_ns, st.st_size
+        except OSError:
+            return None
+    
+    def exists(self) -> bool:
+        return os.path.exists(self.path)
+    
+    def read(self) -> Optional[dict]:
+        """Liest die Datei und merkt sich Generation und Zeitstempel"""
+        stat = self._file_stat()
+        with open(self.path, 'r') as f:
+            config = json.load(f)
+        self._stat = stat
+        self.generation = max(self.generation, int(config.get('generation', 0)))
+        return config
+    
+    def changed_on_disk(self) -> bool:
+        """Günstige Prüfung (nur stat), ob jemand anderes die Datei geändert hat"""
+        return self._file_stat() != self._stat
+    
+    def schedule(self, payload_fn):
+        """Plant einen Schreibvorgang; payload_fn wird erst beim Schreiben aufgerufen"""
+        with self._lock:
+            self._payload_fn = payload_fn
+            if self._timer is None:
+                self._timer = threading.Timer(self.delay, self.flush)
+                self._timer.daemon = True
+                self._timer.start()
+    
+    def flush(self):
+        """Schreibt eine geplante Änderung sofort"""
+        with self._lock:
+            payload_fn = self._payload_fn
+            self._payload_fn = None
+            if self._timer is not None:
+                self._timer.cancel()
+                self._timer = None
+        if payload_fn is not None:
+            self.write(payload_fn())
+    
+    def write(self, config: dict):
+        """Atomares Schreiben: Temp-Datei, fsync, rename, fsync des Verzeichnisses"""
+        with self._write_lock:
+            self.generation += 1
+            config = dict(config, generation=self.generation)
+            tmp_path = f"{self.path}.tmp"
+            try:
+                with open(tmp_path, 'w') as f:
+                    json.dump(config, f, indent=2)
+                    f.flush()
+                    os.fsync(f.fileno())
+                os.replace(tmp_path, self.path)
+                try:
+                    dir_fd = os.open(os.path.dirname(self.path) or '.', os.O_RDONLY)
+                    try:
+                        os.fsync(dir_fd)
+                    finally:
+                        os.close(dir_fd)
+                except OSError:
+                    pass  # Verzeichnis-fsync nicht überall möglich
+                self._stat = self._file_stat()
+                logger.info(f"[SAVE] Config gespeichert ({len(config.get('devices', []))} Geraete, Generation {self.generation})")
+            except Exception as e:
+                logger.error(f"Config speichern fehlgeschlagen: {e}")
+
+
+class WarmStartStore:
+    """
+    Letzter Snapshot als Datei für einen schnellen Start.
+    
+    Geschrieben wird nur alle WARM_START_SAVE_INTERVAL Sekunden und beim
+    Beenden (Temp-Datei + rename). Beim Start wird der Stand als
+    "restored" markiert ausgeliefert, bis der erste Poll-Zyklus fertig ist;
+    seine Messwerte zählen dabei als veraltet bzw. abgelaufen.
+    """
+    
+    def __init__(self, path: str = WARM_START_FILE):
+        self.path = path
+        self.last_saved = 0.0
+    
+    def load(self) -> Optional[DataSnapshot]:
+        try:
+            with open(self.path, 'r') as f:
+                saved = json.load(f)
+            age = time.time() - saved['saved_at']
+            if age > WARM_START_MAX_AGE:
+                return None
+            data = saved['data']
+            groups = saved.get('groups') or {}
+            for item in [data] + list(groups.values()):
+                self._age(item, max(0.0, age))
+            return DataSnapshot(1, data, groups)
+        except FileNotFoundError:
+            return None
         except Exception as e:
-            self.is_reachable = False
-            self.last_check = datetime.now()
-            self.error_count += 1
-            logger.warning(f"[FEHLER] {self.name} ({self.ip}): {e}")
+            logger.warning(f"[WARMSTART] Snapshot nicht lesbar: {e}")
             return None
+    
+    @staticmethod
+    def _age(item: dict, age: float):
+        """
+        Altert einen geladenen Stand um die Zeit seit dem Speichern.
+        
+        Wiederhergestellte Werte gelten nie als frisch; jenseits von
+        STALE_MAX_AGE sind sie abgelaufen und die Leistungssummen 0.
+        """
+        state, factor, counted = staleness(age)
+        if state == 'fresh':
+            state = 'stale'
+        item['restored'] = True
+        for key in ('pv_power', 'grid_power', 'load_power', 'akku_power'):
+            item[key] = round(item.get(key, 0.0) * factor, 2)
+        moved = item.get('fresh_count', 0) + item.get('stale_count', 0)
+        item['fresh_count'] = 0
+        item['stale_count'] = moved if state == 'stale' else 0
+        item['expired_count'] = item.get('expired_count', 0) + (moved if state == 'expired' else 0)
+        if counted and item.get('oldest_age_s') is not None:
+            item['oldest_age_s'] = round(item['oldest_age_s'] + age, 1)
+        else:
+            item['oldest_age_s'] = None
+        for device_info in item.get('devices', []):
+            if 'data_age_s' not in device_info:
+                continue
+            device_info['data_age_s'] = round(device_info['data_age_s'] + age, 1)
+            if device_info.get('freshness') != 'expired':
+                device_info['freshness'] = state
+            if not counted:
+                device_info.pop('data', None)
+    
+    def save(self, snapshot: DataSnapshot):
+        if snapshot.data.get('restored'):
+            return  # noch keine neuen Daten
+        tmp_path = f"{self.path}.tmp"
+        try:
+            with open(tmp_path, 'w') as f:
+                json.dump({'saved_at': time.time(), 'data': snapshot.data, 'groups': snapshot.groups},
+                          f, separators=(',', ':'))
+            os.replace(tmp_path, self.path)
+            self.last_saved = time.monotonic()
+        except Exception as e:
+            logger.error(f"[WARMSTART] Snapshot speichern fehlgeschlagen: {e}")
+    
+    def due(self) -> bool:
+        return time.monotonic() - self.last_saved >= WARM_START_SAVE_INTERVAL
+
+
+class PollScheduler:
+    """
+    Heap der nächsten Poll-Termine aller Geräte.
+    
+    Jedes Gerät läuft in seinem eigenen Takt (device.interval) auf einem
+    festen Raster k * Takt + Phase. Die Phase ergibt sich aus der Geräte-ID,
+    so verteilen sich Geräte mit gleichem Takt über das Intervall, statt
+    alle im selben Moment abgefragt zu werden. Der Jitter verschiebt nur den
+    einzelnen Termin, nicht das Raster - es gibt also keine Drift. Wer mehr
+    als einen Takt hinterherhängt, springt zum nächsten Rasterpunkt statt
+    verpasste Abfragen nachzuholen.
+    
+    Geänderte oder entfernte Geräte werden nicht aus dem Heap gelöscht;
+    ihre alten Einträge erkennt pop_due() an der Generation und verwirft sie.
+    """
+    
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._heap: List[tuple] = []  # (Termin, device_id, Generation, Rasterpunkt)
+        self._plans: Dict[str, tuple] = {}  # device_id -> (Generation, Takt, Priorität)
+        self._generation = 0
+    
+    @staticmethod
+    def _grid_after(device_id: str, interval: float, after: float) -> float:
+        """Erster Rasterpunkt des Geräts >= after"""
+        phase = zlib.crc32(device_id.encode()) / 2 ** 32 * interval
+        return math.ceil((after - phase) / interval) * interval + phase
+    
+    @staticmethod
+    def _jittered(point: float, interval: float) -> float:
+        return point + random.uniform(-POLL_JITTER, POLL_JITTER) * interval
+    
+    def sync(self, devices: Dict[str, 'FroniusDevice'], now: float = None):
+        """Plant neue Geräte ein und geänderte Takte um"""
+        now = now or time.monotonic()
+        with self._lock:
+            for device_id in list(self._plans):
+                if device_id not in devices:
+                    del self._plans[device_id]
+            for device in devices.values():
+                plan = self._plans.get(device.id)
+                if plan is not None and plan[1] == device.interval:
+                    if plan[2] != device.priority:
+                        self._plans[device.id] = (plan[0], plan[1], device.priority)
+                    continue
+                self._generation += 1
+                self._plans[device.id] = (self._generation, device.interval, device.priority)
+                point = self._grid_after(device.id, device.interval, now)
+                heapq.heappush(self._heap, (self._jittered(point, device.interval), device.id,
+                                            self._generation, point))
+    
+    def pop_due(self, now: float = None) -> tuple:
+        """
+        Fällige Geräte-IDs (höchste Priorität zuerst) und größter Verzug.
+        
+        Jedes fällige Gerät wird direkt für seinen nächsten Rasterpunkt
+        wieder eingeplant.
+        """
+        now = now or time.monotonic()
+        due = []
+        lag = 0.0
+        with self._lock:
+            while self._heap and self._heap[0][0] <= now:
+                when, device_id, generation, point = heapq.heappop(self._heap)
+                plan = self._plans.get(device_id)
+                if plan is None or plan[0] != generation:
+                    continue  # Gerät entfernt oder umgeplant
+                _, interval, priority = plan
+                due.append((-priority, when, device_id))
+                lag = max(lag, now - when)
+                point += interval
+                if point <= now:
+                    # Mindestens einen halben Takt Abstand zur gerade fälligen Abfrage
+                    point = self._grid_after(device_id, interval, now + interval / 2)
+                heapq.heappush(self._heap, (self._jittered(point, interval), device_id, generation, point))
+        due.sort()
+        return [device_id for _, _, device_id in due], lag
+    
+    def next_due(self) -> Optional[float]:
+        """Frühester Termin (kann ein verworfener Eintrag sein - dann wird nur früher geprüft)"""
+        with self._lock:
+            return self._heap[0][0] if self._heap else None
 
 
 class FroniusManager:
     """Verwaltet mehrere Fronius-Geräte"""
     
     def __init__(self):
+        # Copy-on-Write: das Dict wird nie verändert, sondern bei jeder
+        # Änderung komplett ersetzt. Leser brauchen daher keinen Lock.
         self.devices: Dict[str, FroniusDevice] = {}
-        self._lock = threading.Lock()
+        self._write_lock = threading.Lock()  # serialisiert nur Änderungen
+        self._ip_index: Dict[str, str] = {}  # IP -> Geräte-ID (wird mit devices ersetzt)
+        self.aggregator = PowerAggregator()
+        self.scheduler = PollScheduler()
+        self.config_store = ConfigStore(CONFIG_FILE)
+        atexit.register(self.config_store.flush)
         self._poll_thread = None
         self._running = False
+        self._executor = ThreadPoolExecutor(max_workers=POLL_WORKERS, thread_name_prefix='fronius-poll')
+        self._in_flight = {}  # device_id -> Future (noch laufende Abfragen)
+        self.poll_stats = {
+            'cycles': 0,
+            'last_cycle_ms': None,
+            'last_cycle_at': None,
+            'polled': 0,
+            'completed': 0,
+            'timed_out': 0,
+            'skipped': 0,
+            'breaker_open': 0
+        }
+        self.snapshot: Optional[DataSnapshot] = None
+        self._snapshot_lock = threading.Lock()
+        self.broadcaster = SnapshotBroadcaster()
+        self.deltas = DeltaTracker()
+        self.history = HistoryStore()
+        self.energy = EnergyAnalytics(self.history)
+        self.warm_start = WarmStartStore()
         self.load_config()
+        restored = self.warm_start.load()
+        if restored is not None:
+            self.snapshot = restored
+            self.broadcaster.publish(restored)
+            logger.info(f"[WARMSTART] Letzter Stand wiederhergestellt ({restored.data['device_count']} Geraete)")
+        else:
+            self.publish_snapshot()
     
     def load_config(self):
         """Lädt Konfiguration aus Datei oder erstellt Default-Config"""
         try:
-            if os.path.exists(CONFIG_FILE):
-                with open(CONFIG_FILE, 'r') as f:
-                    config = json.load(f)
-                    for device_data in config.get('devices', []):
-                        device = FroniusDevice(
-                            device_id=device_data['id'],
-                            ip=device_data['ip'],
-                            name=device_data.get('name')
-                        )
-                        self.devices[device.id] = device
+            if self.config_store.exists():
+                config = self.config_store.read()
+                devices = {}
+                for device_data in config.get('devices', []):
+                    device = FroniusDevice(
+                        device_id=device_data['id'],
+                        ip=device_data['ip'],
+                        name=device_data.get('name'),
+                        endpoints=device_data.get('endpoints'),
+                        options=device_data
+                    )
+                    devices[device.id] = device
+                for site_data in config.get('sites', []):
+                    site = UpstreamSite(
+                        site_id=site_data['id'],
+                        url=site_data['url'],
+                        name=site_data.get('name'),
+                        options=site_data
+                    )
+                    devices[site.id] = site
+                self._set_devices(devices)
                 logger.info(f"[OK] {len(self.devices)} Geraete aus Config geladen")
             else:
                 # DEFAULT-KONFIGURATION: Fronius bei 192.168.200.51
@@ -173,163 +2802,620 @@ class FroniusManager:
                     ip='192.168.200.51',
                     name='Fronius Hauptgeraet'
                 )
-                self.devices['fronius_1'] = default_device
-                self.save_config()
+                self._set_devices({'fronius_1': default_device})
+                self.save_config(immediate=True)
                 logger.info(f"[OK] Default-Geraet konfiguriert: 192.168.200.51")
         except Exception as e:
             logger.error(f"Config laden fehlgeschlagen: {e}")
     
-    def save_config(self):
-        """Speichert Konfiguration in Datei"""
+    def reload_config(self) -> bool:
+        """
+        Übernimmt extern geänderte Config-Dateien.
+        
+        Kostet ohne Änderung nur ein stat(). Eigene Schreibvorgänge merkt
+        sich der ConfigStore mit ihrem stat() und lösen kein Neuladen aus;
+        Handänderungen werden auch ohne neue Generation übernommen, aber
+        wie API-Eingaben geprüft; ist ein Eintrag ungültig, bleibt die
+        bisherige Geräteliste aktiv. Bestehende Geräte behalten ihren Zustand.
+        """
+        if not self.config_store.changed_on_disk():
+            return False
         try:
-            config = {
-                'devices': [
-                    {'id': d.id, 'ip': d.ip, 'name': d.name}
-                    for d in self.devices.values()
-                ],
-                'updated_at': datetime.now().isoformat()
-            }
-            with open(CONFIG_FILE, 'w') as f:
-                json.dump(config, f, indent=2)
-            logger.info(f"[SAVE] Config gespeichert ({len(self.devices)} Geraete)")
+            config = self.config_store.read()
         except Exception as e:
-            logger.error(f"Config speichern fehlgeschlagen: {e}")
+            logger.error(f"Config neu laden fehlgeschlagen: {e}")
+            return False
+        error = self._config_error(config)
+        if error:
+            logger.error(f"Config neu laden verworfen ({error}) - bisherige Geraete bleiben aktiv")
+            return False
+        
+        with self._write_lock:
+            devices = {}
+            for site_data in config.get('sites', []):
+                site = self.devices.get(site_data['id'])
+                if not isinstance(site, UpstreamSite):
+                    site = UpstreamSite(site_data['id'], site_data['url'])
+                site.change_ip(site_data['url'])
+                site.name = site_data.get('name') or site.name
+                site.apply_options(site_data, reset=True)
+                devices[site.id] = site
+            for device_data in config.get('devices', []):
+                device = self.devices.get(device_data['id'])
+                if device is None or isinstance(device, UpstreamSite):
+                    device = FroniusDevice(device_data['id'], device_data['ip'])
+                device.change_ip(device_data['ip'])
+                device.name = device_data.get('name') or device.name
+                if device_data.get('endpoints') is not None:
+                    device.endpoints = dict(device_data['endpoints'])
+                device.apply_options(device_data, reset=True)
+                devices[device.id] = device
+            for device_id, device in self.devices.items():
+                if device_id not in devices:
+                    device.close()
+            self._set_devices(devices)
+        
+        logger.info(f"[RELOAD] Config neu geladen ({len(devices)} Geraete)")
+        self.publish_snapshot()
+        return True
     
-    def add_device(self, ip: str, name: str = None) -> FroniusDevice:
-        """Fügt ein neues Gerät hinzu"""
-        with self._lock:
+    @staticmethod
+    def _config_error(config) -> Optional[str]:
+        """Prüft eine (von Hand geänderte) Config nach den Regeln der API"""
+        if not isinstance(config, dict):
+            return 'Config ist kein Objekt'
+        seen_ids, seen_addresses = set(), set()
+        for key, address_key, valid in (('devices', 'ip', is_valid_ip),
+                                        ('sites', 'url', is_valid_site_url)):
+            entries = config.get(key, [])
+            if not isinstance(entries, list):
+                return f'{key} ist keine Liste'
+            for entry in entries:
+                if not isinstance(entry, dict):
+                    return f'{key}: Eintrag ist kein Objekt'
+                entry_id = entry.get('id')
+                if not isinstance(entry_id, str) or not entry_id or entry_id in seen_ids:
+                    return f'{key}: fehlende oder doppelte id {entry_id!r}'
+                address = entry.get(address_key)
+                if not isinstance(address, str) or not valid(address):
+                    return f'{entry_id}: ungueltige {address_key} {address!r}'
+                address = address.rstrip('/')
+                if address in seen_addresses:
+                    return f'{entry_id}: {address_key} {address} doppelt'
+                name = entry.get('name')
+                if name is not None and not isinstance(name, str):
+                    return f'{entry_id}: name muss ein Text sein'
+                error = _device_options_error(entry)
+                if error:
+                    return f'{entry_id}: {error}'
+                seen_ids.add(entry_id)
+                seen_addresses.add(address)
+        return None
+    
+    def _config_payload(self) -> dict:
+        devices = list(self.devices.values())
+        return {
+            'devices': [
+                dict({'id': d.id, 'ip': d.ip, 'name': d.name, 'endpoints': d.endpoints}, **d.options())
+                for d in devices if d.kind == 'device'
+            ],
+            'sites': [
+                dict({'id': d.id, 'url': d.url, 'name': d.name}, **d.options())
+                for d in devices if d.kind == 'site'
+            ],
+            'updated_at': datetime.now().isoformat()
+        }
+    
+    def save_config(self, immediate: bool = False):
+        """
+        Speichert Konfiguration in Datei.
+        
+        Standardmäßig verzögert und gesammelt im Hintergrund; mit
+        immediate=True sofort im aufrufenden Thread.
+        """
+        if immediate:
+            self.config_store.write(self._config_payload())
+        else:
+            self.config_store.schedule(self._config_payload)
+    
+    def _set_devices(self, devices: Dict[str, FroniusDevice]):
+        """Ersetzt Registry und IP-Index (nur unter _write_lock bzw. beim Start)"""
+        for device in devices.values():
+            device.listener = self.aggregator.update
+        self._ip_index = {device.ip: device.id for device in devices.values()}
+        self.devices = devices
+        self.aggregator.sync(devices)
+        self.scheduler.sync(devices)
+        metrics.prune_devices(devices)
+    
+    def find_by_ip(self, ip: str) -> Optional[FroniusDevice]:
+        """O(1)-Suche eines konfigurierten Geräts nach IP"""
+        device_id = self._ip_index.get(ip)
+        return self.devices.get(device_id) if device_id else None
+    
+    @staticmethod
+    def _next_device_id(devices: Dict[str, FroniusDevice]) -> str:
+        device_id = f"fronius_{len(devices) + 1}"
+        while device_id in devices:
+            device_id = f"fronius_{int(device_id.split('_')[1]) + 1}"
+        return device_id
+    
+    def _fetch_in_background(self, devices: List[FroniusDevice]):
+        """Erste Abfrage neuer Geräte parallel im Poll-Pool, danach neuer Snapshot"""
+        if not devices:
+            return
+        remaining = [len(devices)]
+        counter_lock = threading.Lock()
+        
+        def done(_future):
+            with counter_lock:
+                remaining[0] -= 1
+                last = remaining[0] == 0
+            if last:
+                self.publish_snapshot()
+        
+        for device in devices:
+            self._executor.submit(device.poll).add_done_callback(done)
+    
+    def add_device(self, ip: str, name: str = None) -> tuple:
+        """
+        Fügt ein neues Gerät hinzu.
+        
+        Liefert (Gerät, angelegt). Ist die IP schon konfiguriert, kommt das
+        vorhandene Gerät mit angelegt=False zurück - geprüft unter dem
+        Schreib-Lock, damit parallele Anfragen keine Dubletten anlegen.
+        """
+        with self._write_lock:
+            existing = self.find_by_ip(ip)
+            if existing is not None:
+                return existing, False
+            
             # Generiere ID
-            device_id = f"fronius_{len(self.devices) + 1}"
-            while device_id in self.devices:
-                device_id = f"fronius_{int(device_id.split('_')[1]) + 1}"
+            device_id = self._next_device_id(self.devices)
             
             device = FroniusDevice(device_id, ip, name)
-            self.devices[device_id] = device
+            devices = dict(self.devices)
+            devices[device_id] = device
+            self._set_devices(devices)
             self.save_config()
-            
-            # Sofort Daten holen
-            device.fetch_data()
-            
-            logger.info(f"[ADD] Geraet hinzugefuegt: {device.name} ({ip})")
-            return device
+        
+        logger.info(f"[ADD] Geraet hinzugefuegt: {device.name} ({ip})")
+        
+        # Sofort Daten holen - ohne Lock, Leser und andere Änderungen laufen weiter
+        device.fetch_data()
+        
+        self.publish_snapshot()
+        return device, True
+    
+    def add_site(self, url: str, name: str = None, options: dict = None) -> tuple:
+        """
+        Fügt einen Upstream-Proxy als Standort hinzu (erste Abfrage im Hintergrund).
+        
+        Liefert (Standort, angelegt) wie add_device.
+        """
+        with self._write_lock:
+            existing = self.find_by_ip(url.rstrip('/'))
+            if existing is not None:
+                return existing, False
+            number = 1
+            while f"site_{number}" in self.devices:
+                number += 1
+            site = UpstreamSite(f"site_{number}", url, name, options)
+            devices = dict(self.devices)
+            devices[site.id] = site
+            self._set_devices(devices)
+            self.save_config()
+        
+        logger.info(f"[ADD] Standort hinzugefuegt: {site.name} ({site.url})")
+        self._fetch_in_background([site])
+        return site, True
     
     def remove_device(self, device_id: str) -> bool:
         """Entfernt ein Gerät"""
-        with self._lock:
+        with self._write_lock:
             if device_id in self.devices:
-                device = self.devices.pop(device_id)
+                devices = dict(self.devices)
+                device = devices.pop(device_id)
+                self._set_devices(devices)
+                device.close()
                 self.save_config()
                 logger.info(f"[DEL] Geraet entfernt: {device.name}")
-                return True
-            return False
+            else:
+                return False
+        
+        self.publish_snapshot()
+        return True
     
-    def update_device(self, device_id: str, ip: str = None, name: str = None) -> Optional[FroniusDevice]:
-        """Aktualisiert ein Gerät"""
-        with self._lock:
-            if device_id in self.devices:
-                device = self.devices[device_id]
-                if ip:
-                    device.ip = ip
-                if name:
-                    device.name = name
-                self.save_config()
-                return device
-            return None
+    def update_device(self, device_id: str, ip: str = None, name: str = None,
+                      endpoints: dict = None, options: dict = None) -> tuple:
+        """
+        Aktualisiert ein Gerät (options: siehe FroniusDevice.OPTION_DEFAULTS).
+        
+        Liefert (Gerät, geändert) wie add_device: (None, False) bei
+        unbekannter ID, (anderes Gerät, False) wenn die neue IP schon einem
+        anderen Gerät gehört - geprüft unter dem Schreib-Lock.
+        """
+        with self._write_lock:
+            device = self.devices.get(device_id)
+            if device is None:
+                return None, False
+            if ip:
+                other = self.find_by_ip(ip.rstrip('/'))
+                if other is not None and other is not device:
+                    return other, False
+                device.change_ip(ip)
+            if name:
+                device.name = name
+            if endpoints is not None:
+                device.endpoints = dict(endpoints)
+            if options:
+                device.apply_options(options)
+            self._set_devices(dict(self.devices))
+            self.save_config()
+        
+        self.publish_snapshot()
+        return device, True
     
-    def get_accumulated_data(self) -> dict:
-        """Akkumuliert Daten aller erreichbaren Geräte"""
-        total = {
-            'pv_power': 0.0,
-            'grid_power': 0.0,
-            'load_power': 0.0,
-            'akku_power': 0.0,
-            'akku_soc': 0.0,
-            'device_count': 0,
-            'reachable_count': 0,
-            'devices': [],
-            'timestamp': datetime.now().isoformat()
+    def apply_batch(self, add: List[dict], update: List[dict], remove: List[str]) -> dict:
+        """
+        Führt viele Änderungen in einer Transaktion aus.
+        
+        Konflikte (unbekannte IDs, doppelte IPs - auch innerhalb des Batches)
+        werden vorab geprüft; gibt es welche, wird nichts geändert und
+        {'errors': [...]} geliefert. Sonst: eine Config-Speicherung, ein
+        Snapshot, und die Erstabfrage neuer Geräte läuft im Hintergrund.
+        """
+        with self._write_lock:
+            devices = dict(self.devices)
+            ip_index = dict(self._ip_index)
+            errors = []
+            
+            for device_id in remove:
+                device = devices.pop(device_id, None)
+                if device is None:
+                    errors.append(f'Device {device_id} not found')
+                elif ip_index.get(device.ip) == device_id:
+                    del ip_index[device.ip]
+            
+            for item in update:
+                device = devices.get(item.get('id'))
+                if device is None:
+                    errors.append(f"Device {item.get('id')} not found")
+                    continue
+                ip = item.get('ip')
+                if ip and ip != device.ip:
+                    if ip in ip_index:
+                        errors.append(f'Device with IP {ip} already exists')
+                        continue
+                    ip_index.pop(device.ip, None)
+                    ip_index[ip] = device.id
+            
+            new_devices = []
+            for item in add:
+                ip = item['ip']
+                if ip in ip_index:
+                    errors.append(f'Device with IP {ip} already exists')
+                    continue
+                device = FroniusDevice(self._next_device_id(devices), ip, item.get('name'),
+                                       endpoints=item.get('endpoints'), options=item)
+                devices[device.id] = device
+                ip_index[ip] = device.id
+                new_devices.append(device)
+            
+            if errors:
+                return {'errors': errors}
+            
+            # Validierung ok - Änderungen anwenden
+            for item in update:
+                device = devices[item['id']]
+                if item.get('ip'):
+                    device.change_ip(item['ip'])
+                if item.get('name'):
+                    device.name = item['name']
+                if item.get('endpoints') is not None:
+                    device.endpoints = dict(item['endpoints'])
+                device.apply_options(item)
+            for device_id in remove:
+                self.devices[device_id].close()
+            
+            self._set_devices(devices)
+            self.save_config()
+        
+        logger.info(f"[BATCH] {len(new_devices)} hinzugefuegt, {len(update)} geaendert, {len(remove)} entfernt")
+        self.publish_snapshot()
+        self._fetch_in_background(new_devices)
+        return {
+            'added': new_devices,
+            'updated': [devices[item['id']] for item in update],
+            'removed': list(remove)
         }
+    
+    def discover(self, subnet: str):
+        """
+        Sucht Fronius-Geräte in einem Netz; liefert Treffer sofort (Generator).
         
-        soc_values = []
+        Alle Adressen werden parallel (DISCOVERY_WORKERS) mit kurzem
+        Connect-Timeout geprüft, ein /24 dauert so nur wenige Sekunden.
+        """
+        network = ipaddress.ip_network(subnet, strict=False)
+        hosts = [str(host) for host in network.hosts()]
         
-        with self._lock:
-            for device in self.devices.values():
-                total['device_count'] += 1
-                
-                device_info = device.to_dict()
-                
-                if device.last_data:
-                    total['reachable_count'] += 1
-                    total['pv_power'] += device.last_data.get('pv_power', 0)
-                    total['grid_power'] += device.last_data.get('grid_power', 0)
-                    total['load_power'] += device.last_data.get('load_power', 0)
-                    total['akku_power'] += device.last_data.get('akku_power', 0)
-                    
-                    soc = device.last_data.get('akku_soc', 0)
-                    if soc > 0:
-                        soc_values.append(soc)
-                    
-                    device_info['data'] = {
-                        'pv_power': device.last_data.get('pv_power', 0),
-                        'grid_power': device.last_data.get('grid_power', 0),
-                        'load_power': device.last_data.get('load_power', 0),
-                        'akku_power': device.last_data.get('akku_power', 0),
-                        'akku_soc': device.last_data.get('akku_soc', 0),
-                    }
-                
-                total['devices'].append(device_info)
-        
-        # SOC: Durchschnitt aller Batterien
-        if soc_values:
-            total['akku_soc'] = sum(soc_values) / len(soc_values)
-        
-        # Runden
-        for key in ['pv_power', 'grid_power', 'load_power', 'akku_power', 'akku_soc']:
-            total[key] = round(total[key], 2)
-        
-        return total
-    
-    def poll_all(self):
-        """Holt Daten von allen Geräten"""
-        with self._lock:
-            devices = list(self.devices.values())
+        def probe(ip):
+            device = FroniusDevice('discover', ip, endpoints={}, transient=True)
+            try:
+                return device.probe()
+            finally:
+                device.close()
+        
+        executor = ThreadPoolExecutor(max_workers=DISCOVERY_WORKERS, thread_name_prefix='fronius-discover')
+        try:
+            futures = [executor.submit(probe, ip) for ip in hosts]
+            for future in as_completed(futures):
+                candidate = future.result()
+                if candidate is None:
+                    continue
+                configured = self.find_by_ip(candidate['ip'])
+                candidate['configured'] = configured is not None
+                candidate['device_id'] = configured.id if configured else None
+                yield candidate
+        finally:
+            # Bei Abbruch (z.B. Client getrennt) offene Probes verwerfen
+            executor.shutdown(wait=False, cancel_futures=True)
+    
+    def publish_snapshot(self) -> DataSnapshot:
+        """Baut einen neuen Snapshot und tauscht ihn atomar aus"""
+        with self._snapshot_lock:
+            version = self.snapshot.version + 1 if self.snapshot else 1
+            self.aggregator.refresh()
+            groups = {name: self.get_accumulated_data(name) for name in self.aggregator.groups()}
+            snapshot = DataSnapshot(version, self.get_accumulated_data(), groups, self.snapshot)
+            self.deltas.update(snapshot)
+            self.snapshot = snapshot
+        self.broadcaster.publish(snapshot)
+        return snapshot
+    
+    def get_accumulated_data(self, group: str = None) -> Optional[dict]:
+        """
+        Akkumulierte Daten aller Geräte bzw. einer Aggregat-Gruppe.
         
+        Die Summen kommen fertig aus dem PowerAggregator; nur die
+        Geräteliste wird hier zusammengestellt. None bei unbekannter Gruppe.
+        """
+        if group == PowerAggregator.ALL:
+            group = None
+        totals = self.aggregator.totals(group or PowerAggregator.ALL)
+        if totals is None:
+            return None
+        
+        devices = []
+        now = time.monotonic()
+        oldest = None
+        # Referenz einmal lesen - das Dict wird nie in-place verändert
+        for device in self.devices.values():
+            if group and group not in device.groups:
+                continue
+            device_info = device.to_dict()
+            reading = device.last_data
+            if reading:
+                age = now - reading.fetched_at
+                state, _, counted = staleness(age, device.interval)
+                device_info['data_age_s'] = round(age, 1)
+                device_info['freshness'] = state
+                if counted:
+                    device_info['data'] = reading.power_dict()
+                    oldest = age if oldest is None else max(oldest, age)
+            devices.append(device_info)
+        
+        totals['oldest_age_s'] = round(oldest, 1) if oldest is not None else None
+        totals['devices'] = devices
+        totals['timestamp'] = datetime.now().isoformat()
+        if group:
+            totals['group'] = group
+        return totals
+    
+    def _dispatch(self, devices: List[FroniusDevice], timeout: float, stats: dict) -> list:
+        """Startet Abfragen im Thread-Pool (gesperrte und noch laufende Geräte ausgenommen)"""
+        futures = []
         for device in devices:
-            device.fetch_data()
+            if not device.breaker_ready():
+                # Gerät gesperrt - kostet bis zum nächsten Probe-Fenster nichts
+                stats['breaker_open'] += 1
+                continue
+            pending = self._in_flight.get(device.id)
+            if pending is not None and not pending.done():
+                # Vorherige Abfrage hängt noch - nicht doppelt anfragen
+                stats['skipped'] += 1
+                continue
+            future = self._executor.submit(device.poll, timeout)
+            future.started = time.time()
+            self._in_flight[device.id] = future
+            futures.append(future)
+        stats['polled'] += len(futures)
+        return futures
+    
+    def _finish_window(self, stats: dict, cycle_ms: float):
+        """Räumt _in_flight auf und veröffentlicht die Poll-Statistik"""
+        metrics.poll_cycle.observe(cycle_ms / 1000)
+        
+        # Einträge entfernter Geräte aufräumen
+        for device_id in list(self._in_flight):
+            if device_id not in self.devices and self._in_flight[device_id].done():
+                del self._in_flight[device_id]
+        
+        self.poll_stats = dict(stats, cycles=self.poll_stats['cycles'] + 1, last_cycle_ms=cycle_ms,
+                               last_cycle_at=datetime.now().isoformat())
+        if stats['timed_out'] or stats['skipped']:
+            logger.warning(f"[POLL] {cycle_ms:.0f}ms: {stats['timed_out']} Timeout, "
+                           f"{stats['skipped']} uebersprungen")
+    
+    def _record(self, snapshot: DataSnapshot):
+        """Historie, Tagesabschluss der Energie-Auswertung und Warmstart"""
+        try:
+            self.history.record_snapshot(snapshot)
+        except Exception as e:
+            logger.error(f"Historie schreiben fehlgeschlagen: {e}")
+        try:
+            self.energy.close_days()
+        except Exception as e:
+            logger.error(f"Energie-Auswertung fehlgeschlagen: {e}")
+        if self.warm_start.due():
+            self.warm_start.save(snapshot)
+    
+    @staticmethod
+    def _new_window() -> dict:
+        return {'polled': 0, 'completed': 0, 'timed_out': 0, 'skipped': 0, 'breaker_open': 0}
+    
+    def poll_all(self, deadline: float = POLL_DEADLINE):
+        """
+        Holt Daten von allen Geräten parallel, unabhängig vom Zeitplan.
+        
+        Alle Geräte werden gleichzeitig über den Thread-Pool abgefragt.
+        Der Zyklus endet spätestens nach `deadline` Sekunden - Geräte, die
+        bis dahin nicht geantwortet haben, laufen im Hintergrund weiter und
+        werden übersprungen, bis ihre Abfrage beendet ist. Der laufende
+        Betrieb nutzt den PollScheduler (start_polling); poll_all dient
+        Benchmark und manuellen Komplett-Abfragen.
+        """
+        stats = self._new_window()
+        start = time.time()
+        futures = self._dispatch(list(self.devices.values()), min(REQUEST_TIMEOUT, deadline), stats)
+        done, not_done = wait(futures, timeout=deadline)
+        stats['completed'] = len(done)
+        stats['timed_out'] = len(not_done)
+        self._finish_window(stats, round((time.time() - start) * 1000, 2))
+        
+        snapshot = self.publish_snapshot()
+        try:
+            self.history.record_snapshot(snapshot)
+        except Exception as e:
+            logger.error(f"Historie schreiben fehlgeschlagen: {e}")
     
-    def start_polling(self):
-        """Startet Hintergrund-Polling"""
+    def start_polling(self, delay: float = STARTUP_POLL_DELAY):
+        """
+        Startet Hintergrund-Polling nach dem Zeitplan des PollScheduler.
+        
+        Ein einziger Thread verteilt fällige Geräte an den Thread-Pool und
+        wartet bis zum nächsten Termin oder bis eine Abfrage fertig ist.
+        Neue Messwerte werden höchstens alle PUBLISH_MIN_INTERVAL Sekunden
+        als Snapshot veröffentlicht; Historie, Energie-Auswertung, Statistik
+        und Config-Abgleich laufen im festen Takt POLL_INTERVAL.
+        
+        Der erste Termin liegt frühestens `delay` Sekunden nach dem Start,
+        damit der Server beim Start nicht mit den ersten Abfragen um die CPU
+        konkurriert.
+        """
         if self._running:
             return
         
         self._running = True
         
         def poll_loop():
+            time.sleep(delay)
+            pending = set()
+            stats = self._new_window()
+            longest = 0.0  # längste Abfrage im aktuellen Takt
+            changed = False
+            next_tick = time.monotonic() + POLL_INTERVAL
+            # Warmstart-Stand erst ersetzen, wenn der erste Takt durch ist
+            restoring = bool(self.snapshot and self.snapshot.data.get('restored'))
+            last_publish = next_tick - PUBLISH_MIN_INTERVAL if restoring else 0.0
             while self._running:
-                self.poll_all()
-                time.sleep(POLL_INTERVAL)
+                try:
+                    now = time.monotonic()
+                    if now >= next_tick:
+                        # Fester Takt: Config abgleichen, Statistik, Historie
+                        self.reload_config()
+                        wall = time.time()
+                        running = [wall - future.started for future in pending]
+                        stats['timed_out'] = sum(1 for age in running if age > POLL_DEADLINE)
+                        self._finish_window(stats, round(max([longest] + running) * 1000, 2))
+                        stats = self._new_window()
+                        longest = 0.0
+                        snapshot = self.publish_snapshot()
+                        last_publish = now
+                        changed = False
+                        self._record(snapshot)
+                        next_tick += POLL_INTERVAL
+                        if next_tick <= now:
+                            next_tick = now + POLL_INTERVAL
+                    
+                    due, lag = self.scheduler.pop_due(now)
+                    if due:
+                        metrics.poll_lag = lag
+                        devices = [self.devices[device_id] for device_id in due if device_id in self.devices]
+                        pending.update(self._dispatch(devices, REQUEST_TIMEOUT, stats))
+                    
+                    # Schlafen bis zum nächsten Termin, Takt oder fälligen Snapshot
+                    now = time.monotonic()
+                    wake = min(next_tick, self.scheduler.next_due() or next_tick)
+                    if changed:
+                        wake = min(wake, last_publish + PUBLISH_MIN_INTERVAL)
+                    timeout = max(0.0, wake - now)
+                    if pending:
+                        done, _ = wait(pending, timeout=timeout, return_when=FIRST_COMPLETED)
+                        if done:
+                            wall = time.time()
+                            longest = max([longest] + [wall - future.started for future in done])
+                            stats['completed'] += len(done)
+                            pending -= done
+                            changed = True
+                    else:
+                        time.sleep(timeout)
+                    
+                    now = time.monotonic()
+                    if changed and now - last_publish >= PUBLISH_MIN_INTERVAL:
+                        self.publish_snapshot()
+                        last_publish = now
+                        changed = False
+                except Exception:
+                    # Ein fehlerhafter Durchlauf darf das Polling nicht beenden
+                    logger.exception("[POLL] Fehler in der Poll-Schleife")
+                    now = time.monotonic()
+                    if now >= next_tick:
+                        next_tick = now + POLL_INTERVAL
+                    time.sleep(POLL_MIN_INTERVAL)
         
         self._poll_thread = threading.Thread(target=poll_loop, daemon=True)
         self._poll_thread.start()
-        logger.info(f"[POLL] Polling gestartet (alle {POLL_INTERVAL}s)")
+        logger.info(f"[POLL] Polling gestartet (Standard-Takt {POLL_INTERVAL}s)")
     
     def stop_polling(self):
-        """Stoppt Hintergrund-Polling"""
+        """Stoppt Hintergrund-Polling und sichert Historie, Config und Warmstart-Snapshot"""
         self._running = False
+        self.history.flush()
+        self.config_store.flush()
+        self.warm_start.save(self.snapshot)
 
 
 # Globaler Manager
 manager = FroniusManager()
+# Event-Loop für /stream (wird von serve() gestartet)
+stream_server: Optional[StreamServer] = None
 
 # ═══════════════════════════════════════════════════════════════════════════
 # CORS MIDDLEWARE
 # ═══════════════════════════════════════════════════════════════════════════
 
+@app.before_request
+def start_request_timer():
+    request.environ['fronius_proxy.start'] = time.perf_counter()
+
+
+@app.after_request
+def record_request_metrics(response):
+    start = request.environ.get('fronius_proxy.start')
+    if start is not None:
+        route = request.url_rule.rule if request.url_rule else 'unmatched'
+        metrics.observe_route(route, request.method, response.status_code, time.perf_counter() - start)
+    return response
+
+
 @app.after_request
 def add_cors_headers(response):
     response.headers['Access-Control-Allow-Origin'] = '*'
     response.headers['Access-Control-Allow-Methods'] = 'GET, POST, PUT, DELETE, OPTIONS'
     response.headers['Access-Control-Allow-Headers'] = 'Content-Type, Authorization'
+    response.headers['Access-Control-Expose-Headers'] = 'ETag, X-Delta-Since'
     return response
 
 # ═══════════════════════════════════════════════════════════════════════════
@@ -348,8 +3434,17 @@ def index():
             'POST /devices': 'Gerät hinzufügen ({"ip": "X.X.X.X", "name": "..."})',
             'DELETE /devices/<id>': 'Gerät entfernen',
             'PUT /devices/<id>': 'Gerät aktualisieren',
+            'POST /devices/batch': 'Viele Geräte auf einmal ({"add": [...], "update": [...], "remove": [...]})',
+            'GET /discover?subnet=X.X.X.0/24': 'Fronius-Geräte im Netz suchen (&stream=1, &add=1)',
             'GET /data': 'Akkumulierte Daten aller Geräte',
-            'GET /data/<id>': 'Daten eines Geräts',
+            'GET /sites': 'Upstream-Proxys (Föderation) auflisten',
+            'POST /sites': 'Upstream-Proxy hinzufügen ({"url": "http://X.X.X.X:5000", "name": "..."})',
+            'GET /data/<id>': 'Daten eines Geräts oder Standorts',
+            'GET /data/group/<name>': 'Akkumulierte Daten einer Gruppe (z.B. Gebäude, Phase)',
+            'GET /stream': 'Live-Daten als Server-Sent Events',
+            'GET /metrics': 'Kennzahlen (Prometheus)',
+            'GET /history?from=&to=&step=&device=': 'Zeitreihe (Unix-Sekunden)',
+            'GET /energy?period=day|week|month|year': 'Energie (kWh), Eigenverbrauch, Autarkie, Spitzenlast',
             'GET /fronius?ip=X.X.X.X': 'Einzelabfrage (Legacy)'
         },
         'device_count': len(manager.devices)
@@ -359,17 +3454,98 @@ def index():
 @app.route('/health', methods=['GET'])
 def health():
     """Health Check"""
-    data = manager.get_accumulated_data()
+    data = manager.snapshot.data
+    # Gestartetes, aber beendetes Polling liefert nur noch alternde Daten
+    polling = manager._poll_thread is None or manager._poll_thread.is_alive()
     return jsonify({
-        'status': 'ok',
+        'status': 'ok' if polling else 'degraded',
         'service': 'fronius-proxy',
         'version': '3.0',
         'devices': data['device_count'],
         'reachable': data['reachable_count'],
+        'stale': data['stale_count'] + data['expired_count'],
+        'warm_start': bool(data.get('restored')),
+        'uptime_s': round(time.monotonic() - STARTED_AT, 1),
+        'poll': manager.poll_stats,
         'timestamp': datetime.now().isoformat()
     })
 
 
+@app.route('/metrics', methods=['GET'])
+def prometheus_metrics():
+    """Kennzahlen im Prometheus-Textformat"""
+    lines = []
+    
+    def header(name, kind, text):
+        lines.append(f'# HELP {name} {text}')
+        lines.append(f'# TYPE {name} {kind}')
+    
+    header('fronius_device_request_duration_seconds', 'histogram', 'Antwortzeit der Power-Flow-Abfrage pro Geraet')
+    for device_id, histogram in list(metrics.device_latency.items()):
+        histogram.render('fronius_device_request_duration_seconds', f'device="{_label(device_id)}"', lines)
+    
+    header('fronius_device_errors_total', 'counter', 'Fehlgeschlagene Abfragen nach Ursache')
+    for device_id, counters in list(metrics.device_errors.items()):
+        for cause, count in zip(ERROR_CAUSES, counters):
+            lines.append(f'fronius_device_errors_total{{device="{_label(device_id)}",cause="{cause}"}} {count}')
+    
+    header('fronius_upstream_request_duration_seconds', 'histogram', 'Antwortzeit einmaliger /proxy-Abfragen pro Ziel')
+    for target, histogram in list(metrics.upstream_latency.items()):
+        histogram.render('fronius_upstream_request_duration_seconds', f'target="{_label(target)}"', lines)
+    header('fronius_upstream_errors_total', 'counter', 'Fehlgeschlagene /proxy-Abfragen nach Ziel und Ursache')
+    for target, counters in list(metrics.upstream_errors.items()):
+        for cause, count in zip(ERROR_CAUSES, counters):
+            lines.append(f'fronius_upstream_errors_total{{target="{_label(target)}",cause="{cause}"}} {count}')
+    
+    device_list = list(manager.devices.values())
+    header('fronius_device_up', 'gauge', '1 wenn das Geraet zuletzt erreichbar war')
+    for device in device_list:
+        lines.append(f'fronius_device_up{{device="{_label(device.id)}"}} {int(device.is_reachable)}')
+    header('fronius_device_breaker_open', 'gauge', '1 wenn der Circuit-Breaker nicht geschlossen ist')
+    for device in device_list:
+        lines.append(f'fronius_device_breaker_open{{device="{_label(device.id)}"}} {int(device.breaker_state != "closed")}')
+    header('fronius_device_connection_reuse_ratio', 'gauge', 'Anteil wiederverwendeter Keep-Alive-Verbindungen')
+    for device in device_list:
+        ratio = device.http_summary()['reuse_ratio']
+        if ratio is not None:
+            lines.append(f'fronius_device_connection_reuse_ratio{{device="{_label(device.id)}"}} {ratio}')
+    
+    header('fronius_poll_cycle_duration_seconds', 'histogram', 'Dauer eines Poll-Zyklus')
+    metrics.poll_cycle.render('fronius_poll_cycle_duration_seconds', '', lines)
+    header('fronius_poll_lag_seconds', 'gauge', 'Verzug des letzten Poll-Termins gegenueber dem Zeitplan')
+    lines.append(f'fronius_poll_lag_seconds {metrics.poll_lag:.3f}')
+    header('fronius_poll_interval_seconds', 'gauge', 'Konfiguriertes Poll-Intervall')
+    lines.append(f'fronius_poll_interval_seconds {POLL_INTERVAL}')
+    
+    header('fronius_proxy_cache_requests_total', 'counter', 'Anfragen an den /proxy-Cache nach Ergebnis')
+    for result, count in proxy_cache.stats.items():
+        lines.append(f'fronius_proxy_cache_requests_total{{result="{result}"}} {count}')
+    header('fronius_data_responses_total', 'counter', 'Antworten auf /data (not_modified = ETag-Treffer, delta = ?since=)')
+    for result, count in metrics.data_responses.items():
+        lines.append(f'fronius_data_responses_total{{result="{result}"}} {count}')
+    
+    header('fronius_devices_by_freshness', 'gauge', 'Geraete nach Alter des letzten Messwerts')
+    data = manager.snapshot.data
+    for state in ('fresh', 'stale', 'expired'):
+        lines.append(f'fronius_devices_by_freshness{{state="{state}"}} {data[state + "_count"]}')
+    
+    header('fronius_snapshot_version', 'gauge', 'Version des aktuellen Daten-Snapshots')
+    lines.append(f'fronius_snapshot_version {manager.snapshot.version}')
+    header('fronius_stream_subscribers', 'gauge', 'Offene /stream-Verbindungen')
+    lines.append(f'fronius_stream_subscribers {manager.broadcaster.subscribers}')
+    
+    header('fronius_http_request_duration_seconds', 'histogram', 'Bearbeitungszeit pro Route')
+    for (route, method), histogram in list(metrics.route_latency.items()):
+        histogram.render('fronius_http_request_duration_seconds',
+                         f'route="{_label(route)}",method="{method}"', lines)
+    header('fronius_http_requests_total', 'counter', 'Anfragen pro Route und Status')
+    for (route, method, status), count in list(metrics.route_status.items()):
+        lines.append(f'fronius_http_requests_total{{route="{_label(route)}",method="{method}",status="{status}"}} {count}')
+    
+    lines.append('')
+    return Response('\n'.join(lines), mimetype='text/plain; version=0.0.4')
+
+
 # ─────────────────────────────────────────────────────────────────────────
 # GERÄTE-VERWALTUNG
 # ─────────────────────────────────────────────────────────────────────────
@@ -377,7 +3553,7 @@ def health():
 @app.route('/devices', methods=['GET'])
 def list_devices():
     """Liste aller konfigurierten Geräte"""
-    devices = [d.to_dict() for d in manager.devices.values()]
+    devices = [d.to_dict() for d in manager.devices.values() if d.kind == 'device']
     return jsonify({
         'success': True,
         'count': len(devices),
@@ -385,44 +3561,198 @@ def list_devices():
     })
 
 
-@app.route('/devices', methods=['POST', 'OPTIONS'])
-def add_device():
-    """Neues Gerät hinzufügen"""
+@app.route('/sites', methods=['GET'])
+def list_sites():
+    """Liste der Upstream-Proxys, deren Gesamtwerte in /data einfließen"""
+    sites = [d.to_dict() for d in manager.devices.values() if d.kind == 'site']
+    return jsonify({
+        'success': True,
+        'count': len(sites),
+        'sites': sites
+    })
+
+
+@app.route('/sites', methods=['POST', 'OPTIONS'])
+def add_site():
+    """
+    Upstream-Proxy hinzufügen (Föderation).
+    
+    Body: {"url": "http://192.168.1.20:5000", "name": "Haus B", "groups": [...]}
+    Entfernen über DELETE /devices/<id>, Gruppen/Kapazität über PUT.
+    """
+    if request.method == 'OPTIONS':
+        return '', 200
+    
+    data = request.get_json() or {}
+    if not isinstance(data, dict):
+        return jsonify({
+            'success': False,
+            'error': 'Body must be a JSON object'
+        }), 400
+    url = data.get('url')
+    if not is_valid_site_url(url):
+        return jsonify({
+            'success': False,
+            'error': 'url must be http(s)://host[:port] of another proxy'
+        }), 400
+    error = _device_options_error(data)
+    if error:
+        return jsonify({
+            'success': False,
+            'error': error
+        }), 400
+    
+    site, created = manager.add_site(url, data.get('name'), data)
+    if not created:
+        return jsonify({
+            'success': False,
+            'error': f'Site {url} already exists',
+            'site': site.to_dict()
+        }), 409
+    return jsonify({
+        'success': True,
+        'site': site.to_dict()
+    }), 201
+
+
+@app.route('/devices', methods=['POST', 'OPTIONS'])
+def add_device():
+    """Neues Gerät hinzufügen"""
+    if request.method == 'OPTIONS':
+        return '', 200
+    
+    data = request.get_json() or {}
+    if not isinstance(data, dict):
+        return jsonify({
+            'success': False,
+            'error': 'Body must be a JSON object'
+        }), 400
+    ip = data.get('ip')
+    name = data.get('name')
+    
+    if not ip:
+        return jsonify({
+            'success': False,
+            'error': 'IP address required'
+        }), 400
+    
+    # IP validieren
+    if not is_valid_ip(ip):
+        return jsonify({
+            'success': False,
+            'error': 'Invalid IP format'
+        }), 400
+    
+    # Doppelte IPs erkennt der Manager unter seinem Schreib-Lock
+    device, created = manager.add_device(ip, name)
+    if not created:
+        return jsonify({
+            'success': False,
+            'error': f'Device with IP {ip} already exists',
+            'device': device.to_dict()
+        }), 409
+    return jsonify({
+        'success': True,
+        'device': device.to_dict()
+    }), 201
+
+
+def _valid_endpoints_config(endpoints) -> bool:
+    """None oder {Endpunkt: Intervall in Sekunden}"""
+    return endpoints is None or (
+        isinstance(endpoints, dict)
+        and all(is_valid_endpoint(e) and isinstance(i, (int, float)) and i > 0
+                for e, i in endpoints.items())
+    )
+
+
+def _device_options_error(item: dict) -> Optional[str]:
+    """Prüft endpoints, groups, battery_capacity, poll_interval und priority eines Geräts"""
+    if not _valid_endpoints_config(item.get('endpoints')):
+        return 'endpoints must map Solar API endpoints to intervals in seconds'
+    groups = item.get('groups')
+    if groups is not None and not (isinstance(groups, list) and all(is_valid_group(g) for g in groups)):
+        return 'groups must be a list of names (letters, digits, _.-; not "all")'
+    capacity = item.get('battery_capacity')
+    if capacity is not None and (isinstance(capacity, bool) or not isinstance(capacity, (int, float))
+                                 or capacity < 0):
+        return 'battery_capacity must be a number in kWh (0 = auto)'
+    interval = item.get('poll_interval')
+    if interval is not None and (isinstance(interval, bool) or not isinstance(interval, (int, float))
+                                 or (interval != 0 and interval < POLL_MIN_INTERVAL)):
+        return f'poll_interval must be a number of seconds >= {POLL_MIN_INTERVAL} (0 = default)'
+    priority = item.get('priority')
+    if priority is not None and (isinstance(priority, bool) or not isinstance(priority, int)):
+        return 'priority must be an integer (higher = polled first)'
+    return None
+
+
+@app.route('/devices/batch', methods=['POST', 'OPTIONS'])
+def batch_devices():
+    """
+    Viele Geräte in einer Transaktion hinzufügen, ändern oder entfernen.
+    
+    Body: {"add": [{"ip": "...", "name": "..."}],
+           "update": [{"id": "...", "ip": "...", "name": "..."}],
+           "remove": ["fronius_3", ...]}
+    
+    Entweder werden alle Änderungen übernommen oder keine. Neue Geräte
+    werden im Hintergrund erstmals abgefragt.
+    """
     if request.method == 'OPTIONS':
         return '', 200
     
     data = request.get_json() or {}
-    ip = data.get('ip')
-    name = data.get('name')
-    
-    if not ip:
+    if not isinstance(data, dict):
         return jsonify({
             'success': False,
-            'error': 'IP address required'
+            'error': 'Body must be a JSON object with add, update and remove'
         }), 400
+    add = data.get('add') or []
+    update = data.get('update') or []
+    remove = data.get('remove') or []
     
-    # IP validieren
-    import re
-    if not re.match(r'^(\d{1,3}\.){3}\d{1,3}$', ip):
+    errors = []
+    if not (isinstance(add, list) and isinstance(update, list) and isinstance(remove, list)):
+        errors.append('add, update and remove must be lists')
+    else:
+        for item in add:
+            if not isinstance(item, dict) or not is_valid_ip(item.get('ip')):
+                errors.append(f'Invalid IP format in add: {item}')
+            elif _device_options_error(item):
+                errors.append(f"{item['ip']}: {_device_options_error(item)}")
+        for item in update:
+            if not isinstance(item, dict) or not item.get('id'):
+                errors.append(f'Missing id in update: {item}')
+            elif item.get('ip') and not is_valid_ip(item['ip']):
+                errors.append(f"Invalid IP format for {item['id']}")
+            elif _device_options_error(item):
+                errors.append(f"{item['id']}: {_device_options_error(item)}")
+        if not all(isinstance(device_id, str) for device_id in remove):
+            errors.append('remove must contain device ids')
+        ips = [item.get('ip') for item in add if isinstance(item, dict)]
+        if len(ips) != len(set(ips)):
+            errors.append('Duplicate IP in add')
+    
+    if errors:
         return jsonify({
             'success': False,
-            'error': 'Invalid IP format'
+            'errors': errors
         }), 400
     
-    # Prüfen ob IP schon existiert
-    for device in manager.devices.values():
-        if device.ip == ip:
-            return jsonify({
-                'success': False,
-                'error': f'Device with IP {ip} already exists',
-                'device': device.to_dict()
-            }), 409
+    result = manager.apply_batch(add, update, remove)
+    if 'errors' in result:
+        return jsonify({
+            'success': False,
+            'errors': result['errors']
+        }), 409
     
-    device = manager.add_device(ip, name)
     return jsonify({
         'success': True,
-        'device': device.to_dict()
-    }), 201
+        'added': [d.to_dict() for d in result['added']],
+        'updated': [d.to_dict() for d in result['updated']],
+        'removed': result['removed']
+    })
 
 
 @app.route('/devices/<device_id>', methods=['DELETE', 'OPTIONS'])
@@ -450,22 +3780,48 @@ def update_device(device_id):
         return '', 200
     
     data = request.get_json() or {}
-    device = manager.update_device(
+    if not isinstance(data, dict):
+        return jsonify({
+            'success': False,
+            'error': 'Body must be a JSON object'
+        }), 400
+    error = _device_options_error(data)
+    ip = data.get('ip')
+    if ip is not None and not error:
+        # Standorte tragen ihre URL im ip-Feld
+        current = manager.devices.get(device_id)
+        valid = is_valid_site_url if current is not None and current.kind == 'site' else is_valid_ip
+        if not valid(ip):
+            error = 'Invalid IP format' if valid is is_valid_ip else 'url must be http(s)://host[:port] of another proxy'
+    if error:
+        return jsonify({
+            'success': False,
+            'error': error
+        }), 400
+    
+    device, updated = manager.update_device(
         device_id,
-        ip=data.get('ip'),
-        name=data.get('name')
+        ip=ip,
+        name=data.get('name'),
+        endpoints=data.get('endpoints'),
+        options=data
     )
     
-    if device:
-        return jsonify({
-            'success': True,
-            'device': device.to_dict()
-        })
-    else:
+    if device is None:
         return jsonify({
             'success': False,
             'error': f'Device {device_id} not found'
         }), 404
+    if not updated:
+        return jsonify({
+            'success': False,
+            'error': f'Device with IP {ip} already exists',
+            'device': device.to_dict()
+        }), 409
+    return jsonify({
+        'success': True,
+        'device': device.to_dict()
+    })
 
 
 @app.route('/devices/<device_id>/test', methods=['POST', 'OPTIONS'])
@@ -474,19 +3830,99 @@ def test_device(device_id):
     if request.method == 'OPTIONS':
         return '', 200
     
-    if device_id not in manager.devices:
+    device = manager.devices.get(device_id)
+    if device is None:
         return jsonify({
             'success': False,
             'error': f'Device {device_id} not found'
         }), 404
     
-    device = manager.devices[device_id]
-    data = device.fetch_data()
+    # ?force=1 testet auch bei offenem Circuit-Breaker
+    force = request.args.get('force', '').lower() in ('1', 'true', 'yes')
+    data = device.fetch_data(force=force)
     
     return jsonify({
         'success': data is not None,
         'device': device.to_dict(),
-        'data': data
+        'data': data.to_dict() if data else None
+    })
+
+
+_discovery_lock = threading.Lock()
+
+
+@app.route('/discover', methods=['GET', 'POST', 'OPTIONS'])
+def discover_devices():
+    """
+    Sucht Fronius-Wechselrichter im Netz.
+    
+    Verwendung: /discover?subnet=192.168.200.0/24
+        &stream=1  Treffer sofort als NDJSON (eine Zeile pro Gerät)
+        &add=1     gefundene, noch nicht konfigurierte Geräte hinzufügen
+    """
+    if request.method == 'OPTIONS':
+        return '', 200
+    
+    subnet = request.args.get('subnet', DISCOVERY_SUBNET)
+    try:
+        network = ipaddress.ip_network(subnet, strict=False)
+    except ValueError:
+        return jsonify({
+            'success': False,
+            'error': f'Invalid subnet: {subnet}'
+        }), 400
+    if network.version != 4 or network.num_addresses > DISCOVERY_MAX_HOSTS:
+        return jsonify({
+            'success': False,
+            'error': f'Subnet must be IPv4 with at most {DISCOVERY_MAX_HOSTS} addresses'
+        }), 400
+    
+    if not _discovery_lock.acquire(blocking=False):
+        return jsonify({
+            'success': False,
+            'error': 'Discovery already running'
+        }), 409
+    
+    stream = request.args.get('stream', '').lower() in ('1', 'true', 'yes')
+    add = request.args.get('add', '').lower() in ('1', 'true', 'yes')
+    
+    def add_found(found):
+        new = [{'ip': c['ip'], 'name': f"Fronius {c['ip']}"} for c in found if not c['configured']]
+        if not new:
+            return []
+        result = manager.apply_batch(new, [], [])
+        return [d.to_dict() for d in result.get('added', [])]
+    
+    if stream:
+        def generate():
+            found = []
+            for candidate in manager.discover(str(network)):
+                found.append(candidate)
+                yield json.dumps(candidate) + '\n'
+            if add:
+                yield json.dumps({'added': add_found(found)}) + '\n'
+        
+        response = Response(generate(), mimetype='application/x-ndjson')
+        response.headers['X-Accel-Buffering'] = 'no'
+        # Freigabe beim Schließen der Antwort - auch wenn der Generator nie
+        # startet (HEAD, Client vor dem ersten Chunk getrennt)
+        response.call_on_close(_discovery_lock.release)
+        return response
+    
+    try:
+        start = time.time()
+        found = list(manager.discover(str(network)))
+        added = add_found(found) if add else []
+    finally:
+        _discovery_lock.release()
+    
+    return jsonify({
+        'success': True,
+        'subnet': str(network),
+        'duration_s': round(time.time() - start, 2),
+        'count': len(found),
+        'devices': found,
+        'added': added
     })
 
 
@@ -494,46 +3930,366 @@ def test_device(device_id):
 # DATEN-ABFRAGE
 # ─────────────────────────────────────────────────────────────────────────
 
+_MSGPACK_TYPES = ('application/msgpack', 'application/x-msgpack')
+
+
+def _requested_format() -> str:
+    """?format=json|msgpack|frame, sonst MessagePack nur bei ausdrücklichem Accept"""
+    fmt = request.args.get('format')
+    if fmt:
+        return fmt.lower()
+    if request.accept_mimetypes.best in _MSGPACK_TYPES:
+        return 'msgpack'
+    return 'json'
+
+
+def _requested_fields(sort: bool = True) -> Optional[tuple]:
+    """?fields=a,b.c als Tupel (None = alle Felder)"""
+    fields = [f.strip() for f in request.args.get('fields', '').split(',') if f.strip()]
+    if not fields:
+        return None
+    return tuple(sorted(set(fields))) if sort else tuple(dict.fromkeys(fields))
+
+
+def _format_error(fmt: str, allowed=RESPONSE_FORMATS) -> Optional[Response]:
+    """Fehlerantwort für unbekannte oder nicht installierte Formate"""
+    if fmt not in allowed:
+        response = jsonify({
+            'success': False,
+            'error': f'Unknown format {fmt} (allowed: {", ".join(allowed)})'
+        })
+        response.status_code = 400
+        return response
+    if fmt == 'msgpack' and msgpack is None:
+        response = jsonify({
+            'success': False,
+            'error': 'msgpack not installed (pip3 install msgpack)'
+        })
+        response.status_code = 406
+        return response
+    return None
+
+
+def _response_encoding(size: int) -> Optional[str]:
+    """Vom Client akzeptierte Kompression (Brotli vor gzip), None für kleine Antworten"""
+    if size < COMPRESS_MIN_SIZE:
+        return None
+    return request.accept_encodings.best_match(['br', 'gzip'] if brotli else ['gzip'])
+
+
+def _encoded_response(body: bytes, fmt: str, encoding: str = None) -> Response:
+    response = Response(body, mimetype=RESPONSE_FORMATS[fmt])
+    if encoding:
+        response.headers['Content-Encoding'] = encoding
+    response.vary.update(('Accept', 'Accept-Encoding'))
+    return response
+
+
+def _requested_since() -> Optional[int]:
+    """
+    ?since=<ETag eines früheren Snapshots> als Versionsnummer.
+    
+    None ohne Parameter oder bei einem Stand aus einem früheren
+    Prozessstart - dann gibt es den vollen Snapshot.
+    """
+    # ETags der Varianten tragen Zusätze (-gzip, -<Gruppe>, -since4), maßgeblich
+    # ist nur das Präfix <BOOT_ID>-<Version>
+    parts = request.args.get('since', '').removeprefix('W/').strip('"').split('-')
+    if len(parts) < 2 or parts[0] != BOOT_ID or not parts[1].isdigit():
+        return None
+    return int(parts[1])
+
+
+def _snapshot_response(snapshot: DataSnapshot, group: str = None) -> Optional[Response]:
+    """
+    Antwort aus dem Snapshot in Format, Projektion und Kompression des Clients.
+    
+    Die Bytes kommen aus dem Varianten-Cache des Snapshots; jede Variante
+    hat ein eigenes ETag. Mit ?since= wird nur das Delta seit diesem Stand
+    geliefert (Header X-Delta-Since), falls er noch vorgehalten wird.
+    None wenn die Gruppe unbekannt ist.
+    """
+    fmt = _requested_format()
+    error = _format_error(fmt)
+    if error:
+        return error
+    fields = _requested_fields() if fmt != 'frame' else None
+    since = _requested_since()
+    if since is not None and (fields or fmt == 'frame'):
+        response = jsonify({'success': False, 'error': 'since cannot be combined with fields or format=frame'})
+        response.status_code = 400
+        return response
+    
+    if since is not None:
+        manager.deltas.watch(group)
+    plain = snapshot.delta_variant(group, since, fmt) if since is not None else None
+    if plain is None:
+        since = None
+        plain = snapshot.variant(group, fmt, fields)
+        if plain is None:
+            return None
+    encoding = _response_encoding(len(plain))
+    
+    etag = snapshot.etag
+    if fields and not any(field.split('.')[0] == 'devices' for field in fields):
+        # Ohne Geräteliste zählen nur die Summen - ein neuer Zeitstempel
+        # allein ergibt kein neues ETag (z.B. für übergeordnete Standorte)
+        etag = f'{BOOT_ID}-{snapshot.content_version}'
+    if group:
+        etag += f'-{group}'
+    if since is not None:
+        etag += f'-since{since}'
+    if fmt != 'json':
+        etag += f'-{fmt}'
+    if fields:
+        etag += '-%08x' % zlib.crc32(','.join(fields).encode('utf-8'))
+    if encoding:
+        etag += f'-{encoding}'
+    
+    if request.if_none_match.contains(etag):
+        response = Response(status=304)
+        response.vary.update(('Accept', 'Accept-Encoding'))
+    elif since is not None:
+        body = snapshot.delta_variant(group, since, fmt, encoding) if encoding else plain
+        response = _encoded_response(body, fmt, encoding)
+    else:
+        body = snapshot.variant(group, fmt, fields, encoding) if encoding else plain
+        response = _encoded_response(body, fmt, encoding)
+    if since is not None:
+        response.headers['X-Delta-Since'] = f'{BOOT_ID}-{since}'
+    response.set_etag(etag)
+    response.headers['Cache-Control'] = 'no-cache'
+    return response
+
+
 @app.route('/data', methods=['GET'])
 def get_accumulated_data():
-    """Akkumulierte Daten aller Geräte (für Sankey-Widget)"""
-    data = manager.get_accumulated_data()
+    """
+    Akkumulierte Daten aller Geräte (für Sankey-Widget).
+    
+    Liefert die vorkodierten Bytes des aktuellen Snapshots. Clients mit
+    passendem If-None-Match erhalten 304 ohne Body.
+    
+    Optional: ?fields=solarPower,devices.id (Projektion),
+    ?format=msgpack|frame (kompakt), gzip/br per Accept-Encoding,
+    ?since=<ETag> (nur Änderungen seit diesem Stand).
+    """
+    response = _snapshot_response(manager.snapshot)
+    if response.status_code == 304:
+        metrics.data_responses['not_modified'] += 1
+    elif 'X-Delta-Since' in response.headers:
+        metrics.data_responses['delta'] += 1
+    else:
+        metrics.data_responses['full'] += 1
+    return response
+
+
+@app.route('/data/group/<name>', methods=['GET'])
+def get_group_data(name):
+    """
+    Akkumulierte Daten einer Aggregat-Gruppe (z.B. Gebäude oder Phase).
+    
+    Gruppen werden pro Gerät über "groups" gesetzt (PUT /devices/<id>).
+    Gleiches Format und gleiche Optionen wie GET /data.
+    """
+    snapshot = manager.snapshot
+    response = _snapshot_response(snapshot, None if name == PowerAggregator.ALL else name)
+    if response is None:
+        return jsonify({
+            'success': False,
+            'error': f'Group {name} not found',
+            'groups': sorted(snapshot.groups)
+        }), 404
+    return response
+
+
+@app.route('/stream', methods=['GET'])
+def stream_data():
+    """
+    Server-Sent Events: sendet jeden neuen Snapshot sofort nach dem Poll-Zyklus.
     
-    # Format für XCompanySystemDataService
+    Jedes Event enthält dieselbe JSON-Struktur wie GET /data, die Event-ID
+    ist die Snapshot-Version. Mit Last-Event-ID wird der aktuelle Stand
+    nicht erneut gesendet.
+    
+    Läuft der StreamServer, wird auf dessen Port umgeleitet - dort belegt
+    ein Abonnent keinen Thread. Sonst streamt der WSGI-Server selbst.
+    """
+    if stream_server is not None and stream_server.running:
+        host = request.host
+        if host.rfind(':') > host.rfind(']'):
+            host = host[:host.rfind(':')]
+        query = request.query_string.decode('latin-1')
+        location = f'{request.scheme}://{host}:{stream_server.port}/stream' + (f'?{query}' if query else '')
+        return Response(status=307, headers={'Location': location, 'Cache-Control': 'no-cache'})
+    
+    broadcaster = manager.broadcaster
+    if not broadcaster.subscribe():
+        return jsonify({
+            'success': False,
+            'error': 'Too many stream clients'
+        }), 503
+    
+    try:
+        last_version = int(request.headers.get('Last-Event-ID', 0))
+    except ValueError:
+        last_version = 0
+    if last_version > manager.snapshot.version:
+        # ID stammt aus einem früheren Prozessstart
+        last_version = 0
+    
+    def generate():
+        version = last_version
+        yield b'retry: 5000\n\n'
+        while True:
+            snapshot = broadcaster.wait_newer(version, SSE_KEEPALIVE)
+            if snapshot is None:
+                yield b': keepalive\n\n'
+                continue
+            version = snapshot.version
+            yield snapshot.sse_frame
+    
+    response = Response(generate(), mimetype='text/event-stream')
+    # Auch wenn der Body nie startet (HEAD, Abbruch vorher) wird der Platz frei
+    response.call_on_close(broadcaster.unsubscribe)
+    response.headers['Cache-Control'] = 'no-cache'
+    response.headers['X-Accel-Buffering'] = 'no'  # Nginx-Pufferung aus
+    return response
+
+
+@app.route('/history', methods=['GET'])
+def get_history():
+    """
+    Zeitreihe der Leistungswerte.
+    
+    Verwendung: /history?from=<unix>&to=<unix>&step=<s>&device=<id>
+    Ohne Angaben: letzte 24 Stunden der Gesamtwerte.
+    Optional: ?fields=pv_power,akku_soc und ?format=msgpack.
+    """
+    try:
+        end = int(request.args.get('to', time.time()))
+        start = int(request.args.get('from', end - 86400))
+        step = request.args.get('step')
+        step = int(step) if step else None
+    except ValueError:
+        return jsonify({
+            'success': False,
+            'error': 'from, to and step must be integers (unix seconds)'
+        }), 400
+    
+    if start > end or (step is not None and step <= 0):
+        return jsonify({
+            'success': False,
+            'error': 'Invalid range'
+        }), 400
+    
+    series_id = request.args.get('device', HistoryStore.TOTAL)
+    if series_id != HistoryStore.TOTAL and series_id not in manager.devices \
+            and not manager.history.has_series(series_id):
+        return jsonify({
+            'success': False,
+            'error': f'Device {series_id} not found'
+        }), 404
+    
+    fields = _requested_fields(sort=False)
+    unknown = [field for field in fields or () if field not in HISTORY_FIELDS]
+    if unknown:
+        return jsonify({
+            'success': False,
+            'error': f'Unknown fields {unknown} (allowed: {", ".join(HISTORY_FIELDS)})'
+        }), 400
+    fmt = _requested_format()
+    error = _format_error(fmt, ('json', 'msgpack'))
+    if error:
+        return error
+    
+    result = manager.history.query(series_id, start, end, step, fields)
+    result['success'] = True
+    body = encode_payload(result, fmt)
+    encoding = _response_encoding(len(body))
+    if encoding:
+        body = compress_body(body, encoding)
+    return _encoded_response(body, fmt, encoding)
+
+
+@app.route('/energy', methods=['GET'])
+def get_energy():
+    """
+    Energie pro Tag, Woche, Monat oder Jahr (kWh, Spitzen in kW).
+    
+    Verwendung: /energy?period=day|week|month|year&from=YYYY-MM-DD&to=YYYY-MM-DD
+    Ohne from: die letzten 30 Tage / 12 Wochen / 12 Monate / alle Jahre.
+    Abgeschlossene Tage sind vorberechnet, der laufende Tag ist "partial".
+    """
+    period = request.args.get('period', 'day')
+    if period not in EnergyAnalytics.PERIODS:
+        return jsonify({
+            'success': False,
+            'error': f'period must be one of {", ".join(EnergyAnalytics.PERIODS)}'
+        }), 400
+    
+    today = date.today()
+    default_days = {'day': 29, 'week': 7 * 12 - 1, 'month': 366, 'year': 3660}[period]
+    try:
+        last = date.fromisoformat(request.args['to']) if request.args.get('to') else today
+        # Standardbereich an date.min kappen statt OverflowError
+        first = date.fromisoformat(request.args['from']) if request.args.get('from') \
+            else last - timedelta(days=min(default_days, (last - date.min).days))
+    except ValueError:
+        return jsonify({
+            'success': False,
+            'error': 'from and to must be dates (YYYY-MM-DD)'
+        }), 400
+    if first > last:
+        return jsonify({
+            'success': False,
+            'error': 'Invalid range'
+        }), 400
+    
+    energy = manager.energy
+    first = EnergyAnalytics.period_start(first, period)
     return jsonify({
         'success': True,
-        'solarPower': data['pv_power'],
-        'gridPower': data['grid_power'],
-        'housePower': data['load_power'],
-        'batteryPower': data['akku_power'],
-        'batterySOC': data['akku_soc'],
-        'deviceCount': data['device_count'],
-        'reachableCount': data['reachable_count'],
-        'devices': data['devices'],
-        'timestamp': data['timestamp'],
-        'proxy_info': {
-            'version': '3.0',
-            'server': 'raspberry-pi'
-        }
+        'period': period,
+        'from': first.isoformat(),
+        'to': last.isoformat(),
+        'closed_until': energy.closed_until.isoformat() if energy.closed_until else None,
+        'buckets': energy.rollup(period, first, last)
     })
 
 
 @app.route('/data/<device_id>', methods=['GET'])
 def get_device_data(device_id):
-    """Daten eines einzelnen Geräts"""
-    if device_id not in manager.devices:
+    """
+    Daten eines einzelnen Geräts.
+    
+    Mit ?raw=1 wird die Original-Antwort des Fronius unverändert geliefert,
+    mit &endpoint=... die eines weiteren abgefragten Endpunkts.
+    """
+    device = manager.devices.get(device_id)
+    if device is None:
         return jsonify({
             'success': False,
             'error': f'Device {device_id} not found'
         }), 404
     
-    device = manager.devices[device_id]
+    
+    if request.args.get('raw', '').lower() in ('1', 'true', 'yes'):
+        endpoint = request.args.get('endpoint', POWER_FLOW_ENDPOINT)
+        cached = device.get_endpoint_data(endpoint, max_age=float('inf'))
+        if cached is None:
+            return jsonify({
+                'success': False,
+                'device': device.to_dict(),
+                'error': 'No raw data available'
+            }), 404
+        return Response(cached.raw, mimetype='application/json')
     
     if device.last_data:
         return jsonify({
             'success': True,
             'device': device.to_dict(),
-            'data': device.last_data
+            'data': device.last_data.to_dict(device.interval)
         })
     else:
         return jsonify({
@@ -547,27 +4303,102 @@ def get_device_data(device_id):
 # PROXY ENDPOINT (Flutter Web App kompatibel)
 # ─────────────────────────────────────────────────────────────────────────
 
-def _proxy_request(ip: str, endpoint: str = 'GetPowerFlowRealtimeData.fcgi'):
-    """Interne Proxy-Funktion fuer Einzelabfragen"""
-    # Temporaeres Device erstellen
-    temp_device = FroniusDevice('temp', ip, 'Temp')
-    # Custom endpoint setzen falls angegeben
-    if endpoint != 'GetPowerFlowRealtimeData.fcgi':
-        temp_device.api_endpoint = endpoint
+class ProxyCache:
+    """
+    TTL-Cache für /proxy und /fronius mit Request-Coalescing.
+    
+    Gleichzeitige Anfragen mit demselben Schlüssel teilen sich eine
+    Upstream-Abfrage: die erste führt sie aus, alle weiteren warten auf
+    deren Ergebnis. Die Größe ist per LRU begrenzt.
+    """
+    
+    def __init__(self, ttl: float = PROXY_CACHE_TTL, max_entries: int = PROXY_CACHE_MAX):
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self._entries = OrderedDict()  # key -> [expires, value, Event]
+        self._lock = threading.Lock()
+        self.stats = {'hits': 0, 'misses': 0, 'coalesced': 0}
     
-    data = temp_device.fetch_data()
+    def get(self, key, fetch):
+        """Liefert den gecachten Wert oder ruft fetch() genau einmal auf"""
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                expires, value, ready = entry
+                if not ready.is_set():
+                    self.stats['coalesced'] += 1
+                elif time.monotonic() < expires:
+                    self._entries.move_to_end(key)
+                    self.stats['hits'] += 1
+                    return value
+                else:
+                    entry = None
+            if entry is None:
+                ready = threading.Event()
+                entry = [0.0, None, ready]
+                self._entries[key] = entry
+                self._entries.move_to_end(key)
+                while len(self._entries) > self.max_entries:
+                    self._entries.popitem(last=False)
+                self.stats['misses'] += 1
+                owner = True
+            else:
+                owner = False
+        
+        if not owner:
+            ready.wait()
+            return entry[1]
+        
+        value = None
+        try:
+            value = fetch()
+        finally:
+            entry[0] = time.monotonic() + self.ttl
+            entry[1] = value
+            ready.set()
+        return value
+
+
+proxy_cache = ProxyCache()
+
+
+def _raw_json_response(raw: bytes, proxy_info: dict) -> Response:
+    """
+    Baut {"success": true, "data": <raw>, "proxy_info": {...}} aus den
+    Original-Bytes, ohne die Fronius-Antwort erneut zu parsen oder zu kodieren.
+    """
+    body = b''.join((
+        b'{"success":true,"data":',
+        raw,
+        b',"proxy_info":',
+        json.dumps(proxy_info, separators=(',', ':')).encode('utf-8'),
+        b'}'
+    ))
+    return Response(body, mimetype='application/json')
+
+
+def _proxy_request(ip: str, endpoint: str = POWER_FLOW_ENDPOINT):
+    """
+    Interne Proxy-Funktion fuer Einzelabfragen.
     
-    if data:
+    Ist die IP als Geraet konfiguriert und hat der Poller frische Daten
+    fuer den Endpunkt, werden diese direkt geliefert. Sonst laeuft die
+    Abfrage ueber den ProxyCache, sodass gleichzeitige Anfragen nur einen
+    Upstream-Abruf ausloesen.
+    """
+    if not is_valid_endpoint(endpoint):
         return jsonify({
-            'success': True,
-            'data': data.get('raw', {}),
-            'proxy_info': {
-                'source_ip': ip,
-                'response_time_ms': data.get('response_time_ms'),
-                'timestamp': data.get('timestamp'),
-                'server': 'raspberry-pi-python-proxy'
-            }
-        })
+            'success': False,
+            'error': f'Invalid endpoint: {endpoint}'
+        }), 400
+    
+    result = _poller_result(ip, endpoint)
+    if result is None:
+        result = proxy_cache.get((ip, endpoint), lambda: _fetch_upstream(ip, endpoint))
+    
+    if result:
+        raw, proxy_info = result
+        return _raw_json_response(raw, proxy_info)
     else:
         return jsonify({
             'success': False,
@@ -581,6 +4412,43 @@ def _proxy_request(ip: str, endpoint: str = 'GetPowerFlowRealtimeData.fcgi'):
         }), 502
 
 
+def _poller_result(ip: str, endpoint: str) -> Optional[tuple]:
+    """Antwort aus den Poller-Daten eines konfigurierten Geraets (falls frisch)"""
+    device = manager.find_by_ip(ip)
+    if device is None:
+        return None
+    cached = device.get_endpoint_data(endpoint)
+    if cached is None:
+        return None
+    return cached.raw, {
+        'source_ip': ip,
+        'response_time_ms': cached.response_time_ms,
+        'timestamp': cached.timestamp,
+        'server': 'raspberry-pi-python-proxy',
+        'source': 'poller'
+    }
+
+
+def _fetch_upstream(ip: str, endpoint: str) -> Optional[tuple]:
+    """Einmalige Abfrage eines nicht konfigurierten Geraets"""
+    # Temporaeres Device erstellen
+    temp_device = FroniusDevice('temp', ip, 'Temp', endpoints={}, transient=True)
+    try:
+        cached = temp_device.fetch_endpoint(endpoint)
+    finally:
+        temp_device.close()
+    
+    if cached is None:
+        return None
+    return cached.raw, {
+        'source_ip': ip,
+        'response_time_ms': cached.response_time_ms,
+        'timestamp': cached.timestamp,
+        'server': 'raspberry-pi-python-proxy',
+        'source': 'upstream'
+    }
+
+
 @app.route('/proxy', methods=['GET', 'OPTIONS'])
 def proxy_endpoint():
     """
@@ -593,7 +4461,7 @@ def proxy_endpoint():
         return '', 200
     
     ip = request.args.get('ip')
-    endpoint = request.args.get('endpoint', 'GetPowerFlowRealtimeData.fcgi')
+    endpoint = request.args.get('endpoint', POWER_FLOW_ENDPOINT)
     
     if not ip:
         return jsonify({
@@ -612,7 +4480,7 @@ def fronius_legacy():
         return '', 200
     
     ip = request.args.get('ip')
-    endpoint = request.args.get('endpoint', 'GetPowerFlowRealtimeData.fcgi')
+    endpoint = request.args.get('endpoint', POWER_FLOW_ENDPOINT)
     
     if not ip:
         return jsonify({
@@ -627,6 +4495,61 @@ def fronius_legacy():
 # MAIN
 # ═══════════════════════════════════════════════════════════════════════════
 
+def waitress_options() -> dict:
+    """Einstellungen für waitress (auch für fronius_bench.py --server waitress)"""
+    return {
+        'threads': SERVER_THREADS,
+        'backlog': SERVER_BACKLOG,
+        'connection_limit': SERVER_CONNECTION_LIMIT,
+        'channel_timeout': 60,
+        'ident': 'fronius-proxy'
+    }
+
+
+def serve():
+    """
+    Startet den HTTP-Server.
+    
+    Mit waitress (pip3 install waitress) laufen Verbindungen über eine
+    Event-Loop und einen festen Pool aus SERVER_THREADS Workern -
+    Keep-Alive-Verbindungen belegen keine Threads. Ohne waitress wird der
+    Flask-Entwicklungsserver verwendet. /stream läuft (mit SSE_PORT) über
+    den StreamServer in einem eigenen Thread und belegt keine Worker.
+    
+    Es bleibt ein Prozess: wegen des GIL laufen die Views nacheinander,
+    der Durchsatz von /data ist durch einen Kern begrenzt. Mehr Worker
+    helfen nur, solange Anfragen auf Geräte warten (/proxy, /fronius).
+    Messwerte: README, Abschnitt Benchmark.
+    """
+    global stream_server
+    if SSE_PORT:
+        try:
+            stream_server = StreamServer(manager.broadcaster)
+            stream_server.start()
+        except OSError as e:
+            stream_server = None
+            logger.error(f"[SSE] Port {SSE_PORT} nicht verfuegbar ({e}) - /stream ueber den WSGI-Server")
+    
+    if SERVER in ('auto', 'waitress'):
+        try:
+            from waitress import serve as waitress_serve
+        except ImportError:
+            if SERVER == 'waitress':
+                logger.error("[SERVER] waitress nicht installiert - nutze Entwicklungsserver")
+        else:
+            logger.info(f"[SERVER] waitress auf Port {PORT} ({SERVER_THREADS} Worker)")
+            waitress_serve(app, host='0.0.0.0', port=PORT, **waitress_options())
+            return
+    
+    logger.info(f"[SERVER] Flask-Entwicklungsserver auf Port {PORT}")
+    app.run(
+        host='0.0.0.0',
+        port=PORT,
+        debug=False,
+        threaded=True
+    )
+
+
 if __name__ == '__main__':
     print("""
 ===================================================================
@@ -645,13 +4568,12 @@ if __name__ == '__main__':
 ===================================================================
     """)
     
-    # Polling starten
+    # SIGTERM (systemctl stop) wie Ctrl+C behandeln, damit atexit greift
+    signal.signal(signal.SIGTERM, lambda signum, frame: sys.exit(0))
+    atexit.register(manager.stop_polling)
+    
+    # Polling starten (erster Zyklus leicht verzögert)
     manager.start_polling()
     
     # Server starten
-    app.run(
-        host='0.0.0.0',
-        port=PORT,
-        debug=False,
-        threaded=True
-    )
+    serve()
@@ -92,8 +92,8 @@ echo -e "${GREEN}[OK] Nginx installiert${NC}"
 # PYTHON + FLASK INSTALLIEREN
 # -----------------------------------------------------------------------------
 echo -e "${YELLOW}[4/9] Installiere Python und Flask...${NC}"
-apt install -y -qq python3 python3-pip python3-flask python3-requests
-pip3 install --break-system-packages flask requests 2>/dev/null || pip3 install flask requests
+apt install -y -qq python3 python3-pip python3-flask python3-requests python3-waitress python3-brotli python3-msgpack
+pip3 install --break-system-packages flask requests waitress brotli msgpack 2>/dev/null || pip3 install flask requests waitress brotli msgpack
 echo -e "${GREEN}[OK] Python + Flask installiert${NC}"
 
 # -----------------------------------------------------------------------------
@@ -211,6 +211,15 @@ server {
         }
     }
     
+    # Live-Stream (Server-Sent Events, eigene Event-Loop auf Port 5001)
+    location /api/fronius/stream {
+        proxy_pass http://127.0.0.1:5001/stream;
+        proxy_http_version 1.1;
+        proxy_set_header Connection "";
+        proxy_buffering off;
+        proxy_read_timeout 1h;
+    }
+    
     # Legacy Proxy Endpoint (Einzelabfrage)
     location /fronius-proxy {
         proxy_pass http://127.0.0.1:5000/fronius;